@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Controle de admissão das requisições da API
+Limita a taxa por cliente (IP) e rota com baldes de tokens e limita quantas
+escritas chegam ao mesmo tempo ao SQLite (um único escritor) com uma fila
+curta. Quem passa do limite recebe 429 com Retry-After na hora, em vez de
+ocupar uma thread esperando o banco. Rotas caras (geração do Excel,
+backup) têm orçamentos próprios.
+
+Com vários processos (producao_sql), as vagas das filas valem para todos
+eles (travas flock em arquivos ao lado do banco) e os orçamentos por
+cliente e as filas de espera são divididos pelo número de processos.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: só a fila por processo
+    fcntl = None
+
+from metricas import normalizar_rota, registro
+
+# ADMISSAO=0 desativa os limites (benchmarks, testes de carga)
+ADMISSAO_ATIVA = os.environ.get('ADMISSAO', '1') != '0'
+
+# Definidos pelo producao_sql: processos que atendem a mesma porta e diretório das vagas compartilhadas
+ADMISSAO_PROCESSOS = int(os.environ.get('ADMISSAO_PROCESSOS', 1))
+ADMISSAO_DIRETORIO = os.environ.get('ADMISSAO_DIRETORIO')
+
+RECUSAS = registro.contador('ferramentas_admissao_recusadas_total',
+                            'Requisições recusadas com 429 pelo controle de admissão', ('regra', 'motivo'))
+
+class Regra(NamedTuple):
+    capacidade: float   # rajada máxima de requisições
+    por_segundo: float  # reposição contínua do balde
+
+# Orçamentos por cliente e rota
+REGRAS_PADRAO = {
+    'leitura': Regra(200, 50.0),
+    'escrita': Regra(30, 5.0),
+    'excel': Regra(2, 1 / 60),
+    'backup': Regra(2, 1 / 300)
+}
+
+# Concorrência por regra: vagas ocupadas ao mesmo tempo, fila de espera e espera máxima
+FILAS_PADRAO = {
+    'escrita': {'vagas': 4, 'max_fila': 32, 'espera_maxima': 2.0, 'retry_after': 1},
+    'excel': {'vagas': 1, 'max_fila': 0, 'espera_maxima': 0.0, 'retry_after': 10}
+}
+
+# Rotas caras: (método, caminho) -> regra
+ROTAS_PESADAS = {
+    ('GET', '/api/generate_sync_excel'): 'excel',
+    ('POST', '/api/backup'): 'backup'
+}
+
+METODOS_ESCRITA = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def classificar_rota(metodo: str, caminho: str) -> Optional[str]:
+    """Regra aplicada à requisição; None para estáticos e preflight (sem limite)"""
+    caminho = caminho.split('?', 1)[0]
+    if not caminho.startswith('/api/') or metodo == 'OPTIONS':
+        return None
+    regra = ROTAS_PESADAS.get((metodo, caminho.rstrip('/')))
+    if regra:
+        return regra
+    return 'escrita' if metodo in METODOS_ESCRITA else 'leitura'
+
+class AdmissaoRecusada(Exception):
+    """Requisição recusada (429); retry_after em segundos inteiros"""
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+class LimitadorTaxa:
+    """
+    Baldes de tokens por chave (cliente, regra, rota)
+
+    Cada balde começa cheio (capacidade) e é reposto a `por_segundo`; cada
+    requisição consome um token. Baldes cheios são descartados quando há
+    mais de `max_baldes`, então clientes inativos não acumulam memória.
+    """
+
+    def __init__(self, regras: Dict[str, Regra], max_baldes: int = 10000):
+        self.regras = regras
+        self.max_baldes = max_baldes
+        self._baldes = {}
+        self._lock = threading.Lock()
+
+    def consumir(self, chave: tuple, regra: str) -> float:
+        """Consome um token; retorna 0 se permitido ou os segundos até o próximo token"""
+        capacidade, por_segundo = self.regras[regra]
+        agora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(chave)
+            if balde is None:
+                if len(self._baldes) >= self.max_baldes:
+                    self._descartar_cheios(agora)
+                balde = self._baldes[chave] = [capacidade, agora]
+            else:
+                balde[0] = min(capacidade, balde[0] + (agora - balde[1]) * por_segundo)
+                balde[1] = agora
+            if balde[0] >= 1:
+                balde[0] -= 1
+                return 0.0
+            return (1 - balde[0]) / por_segundo
+
+    def _descartar_cheios(self, agora: float):
+        for chave, (tokens, instante) in list(self._baldes.items()):
+            capacidade, por_segundo = self.regras[chave[1]]
+            if tokens + (agora - instante) * por_segundo >= capacidade:
+                del self._baldes[chave]
+
+    def __len__(self):
+        return len(self._baldes)
+
+class FilaAdmissao:
+    """
+    Limita quantas requisições usam um recurso ao mesmo tempo
+
+    Até `vagas` requisições entram direto; até `max_fila` esperam no máximo
+    `espera_maxima` segundos por uma vaga. Com a fila cheia, ou passado o
+    tempo de espera, a entrada é recusada imediatamente.
+    """
+
+    def __init__(self, vagas: int, max_fila: int = 0, espera_maxima: float = 0.0, retry_after: int = 1):
+        self.vagas = vagas
+        self.max_fila = max_fila
+        self.espera_maxima = espera_maxima
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._ocupadas = 0
+        self._esperando = 0
+        self._contadores = {'admitidas': 0, 'fila_cheia': 0, 'espera_esgotada': 0, 'espera_max_ms': 0.0}
+
+    def _tomar_vaga(self) -> bool:
+        """Ocupa uma vaga se houver (chamado com _cond travado)"""
+        return self._ocupadas < self.vagas
+
+    def _devolver_vaga(self):
+        pass
+
+    def _admitir(self, inicio: float = None):
+        """Conta a entrada admitida (chamado com _cond travado); `inicio` se houve espera"""
+        self._ocupadas += 1
+        self._contadores['admitidas'] += 1
+        if inicio is not None:
+            espera_ms = (time.monotonic() - inicio) * 1000
+            self._contadores['espera_max_ms'] = max(self._contadores['espera_max_ms'], round(espera_ms, 1))
+
+    def entrar(self) -> bool:
+        with self._cond:
+            if not self._esperando and self._tomar_vaga():
+                self._admitir()
+                return True
+            if self._esperando >= self.max_fila:
+                self._contadores['fila_cheia'] += 1
+                return False
+
+            inicio = time.monotonic()
+            limite = inicio + self.espera_maxima
+            self._esperando += 1
+            try:
+                while not self._tomar_vaga():
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._contadores['espera_esgotada'] += 1
+                        return False
+                    self._cond.wait(restante)
+            finally:
+                self._esperando -= 1
+            self._admitir(inicio)
+            return True
+
+    def sair(self):
+        self._devolver_vaga()
+        with self._cond:
+            self._ocupadas -= 1
+            self._cond.notify()
+
+    def estatisticas(self) -> Dict:
+        with self._cond:
+            estatisticas = dict(self._contadores)
+            estatisticas.update({'vagas': self.vagas, 'ocupadas': self._ocupadas,
+                                 'esperando': self._esperando, 'max_fila': self.max_fila})
+            return estatisticas
+
+class FilaAdmissaoCompartilhada(FilaAdmissao):
+    """
+    FilaAdmissao cujas vagas valem para todos os processos
+
+    Cada vaga é um arquivo em `diretorio` travado com flock enquanto uma
+    requisição a ocupa; o sistema solta a trava se o processo morrer. Cada
+    processo abre os arquivos uma vez e só tenta as vagas que nenhuma
+    thread sua ocupa (flock no mesmo descritor não separa threads). As
+    tentativas rodam fora de _cond; quem espera tenta de novo após
+    `intervalo_espera` segundos, dobrando até `intervalo_espera_maximo`, ou
+    antes, se uma vaga deste processo for liberada. A fila de espera
+    (`max_fila`) e `ocupadas` nas estatísticas continuam sendo deste processo.
+    """
+    intervalo_espera = 0.005
+    intervalo_espera_maximo = 0.05
+
+    def __init__(self, diretorio: str, nome: str, vagas: int, max_fila: int = 0,
+                 espera_maxima: float = 0.0, retry_after: int = 1):
+        super().__init__(vagas, max_fila, espera_maxima, retry_after)
+        os.makedirs(diretorio, exist_ok=True)
+        self.arquivos = [os.path.join(diretorio, f'{nome}.{i}.lock') for i in range(vagas)]
+        self._local = threading.local()
+        self._vagas_lock = threading.Lock()
+        self._pid = None
+        self._descritores = []
+        self._livres = deque()
+
+    def _abrir(self):
+        """Abre os arquivos das vagas neste processo (chamado com _vagas_lock travado)"""
+        if self._pid == os.getpid():
+            return
+        # Após o fork, os descritores herdados compartilham a trava com o pai: fecha e abre os próprios
+        for fd in self._descritores:
+            os.close(fd)
+        self._descritores = [os.open(arquivo, os.O_RDWR | os.O_CREAT, 0o644) for arquivo in self.arquivos]
+        self._livres = deque(range(len(self.arquivos)))
+        self._pid = os.getpid()
+
+    def _tomar_vaga(self) -> bool:
+        """Tenta uma vaga livre neste processo; não precisa de _cond"""
+        with self._vagas_lock:
+            self._abrir()
+            tentativas = len(self._livres)
+        for _ in range(tentativas):
+            with self._vagas_lock:
+                if not self._livres:
+                    return False
+                vaga = self._livres.popleft()
+            try:
+                fcntl.flock(self._descritores[vaga], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                with self._vagas_lock:
+                    self._livres.append(vaga)
+                continue
+            self._local.vaga = vaga
+            return True
+        return False
+
+    def _devolver_vaga(self):
+        # sair() roda na mesma thread que entrou (teardown da requisição)
+        vaga = self._local.vaga
+        self._local.vaga = None
+        fcntl.flock(self._descritores[vaga], fcntl.LOCK_UN)
+        with self._vagas_lock:
+            self._livres.append(vaga)
+
+    def entrar(self) -> bool:
+        inicio = time.monotonic()
+        with self._cond:
+            direto = not self._esperando
+        if direto and self._tomar_vaga():
+            with self._cond:
+                self._admitir()
+            return True
+
+        with self._cond:
+            if self._esperando >= self.max_fila:
+                self._contadores['fila_cheia'] += 1
+                return False
+            self._esperando += 1
+        limite = inicio + self.espera_maxima
+        intervalo = self.intervalo_espera
+        try:
+            while not self._tomar_vaga():
+                restante = limite - time.monotonic()
+                with self._cond:
+                    if restante <= 0:
+                        self._contadores['espera_esgotada'] += 1
+                        return False
+                    self._cond.wait(min(restante, intervalo))
+                intervalo = min(intervalo * 2, self.intervalo_espera_maximo)
+        finally:
+            with self._cond:
+                self._esperando -= 1
+        with self._cond:
+            self._admitir(inicio)
+        return True
+
+    def estatisticas(self) -> Dict:
+        estatisticas = super().estatisticas()
+        estatisticas['compartilhada'] = True
+        return estatisticas
+
+class ControleAdmissao:
+    """
+    Aplica o limite de taxa e, depois, a fila da regra da requisição
+
+    Com `processos` > 1 (workers atendendo a mesma porta), cada processo
+    recebe só parte das requisições de um cliente, então o orçamento de cada
+    balde e cada fila de espera é dividido pelo número de processos. Com
+    `diretorio`, as vagas das filas são compartilhadas entre os processos
+    (FilaAdmissaoCompartilhada); sem ele, as vagas também são divididas.
+    """
+
+    def __init__(self, regras: Dict[str, Regra] = None, filas: Dict[str, Dict] = None,
+                 processos: int = 1, diretorio: str = None):
+        self.processos = processos = max(1, processos)
+        self.limitador = LimitadorTaxa({
+            nome: Regra(max(1.0, regra.capacidade / processos), regra.por_segundo / processos)
+            for nome, regra in (regras or REGRAS_PADRAO).items()})
+        self.filas = {}
+        for nome, config in (filas or FILAS_PADRAO).items():
+            config = dict(config, max_fila=math.ceil(config.get('max_fila', 0) / processos))
+            if diretorio and fcntl is not None:
+                self.filas[nome] = FilaAdmissaoCompartilhada(diretorio, nome, **config)
+            else:
+                config['vagas'] = max(1, config['vagas'] // processos)
+                self.filas[nome] = FilaAdmissao(**config)
+        self._lock = threading.Lock()
+        self._recusadas = {}
+
+    def admitir(self, cliente: str, metodo: str, caminho: str, rota: str = None) -> Optional[FilaAdmissao]:
+        """
+        Admite a requisição ou levanta AdmissaoRecusada
+
+        Retorna a fila ocupada (chame sair() ao terminar a requisição) ou None.
+        `rota` é o padrão da rota, quando o servidor o conhece; senão o caminho
+        é normalizado.
+        """
+        regra = classificar_rota(metodo, caminho)
+        if regra is None:
+            return None
+
+        espera = self.limitador.consumir((cliente, regra, rota or normalizar_rota(caminho)), regra)
+        if espera:
+            self._recusar(regra, 'taxa')
+            raise AdmissaoRecusada(f"Limite de requisições excedido ({regra})", max(1, math.ceil(espera)))
+
+        fila = self.filas.get(regra)
+        if fila is not None and not fila.entrar():
+            self._recusar(regra, 'fila')
+            raise AdmissaoRecusada(f"Servidor ocupado ({regra}), tente novamente", fila.retry_after)
+        return fila
+
+    def _recusar(self, regra: str, motivo: str):
+        RECUSAS.inc(regra, motivo)
+        with self._lock:
+            chave = f"{regra}_{motivo}"
+            self._recusadas[chave] = self._recusadas.get(chave, 0) + 1
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            recusadas = dict(self._recusadas)
+        return {
+            'recusadas': recusadas,
+            'processos': self.processos,
+            'clientes_rastreados': len(self.limitador),
+            'filas': {nome: fila.estatisticas() for nome, fila in self.filas.items()},
+            'regras': {nome: regra._asdict() for nome, regra in self.limitador.regras.items()}
+        }
+
+class HandlerComAdmissao:
+    """
+    Mixin para BaseHTTPRequestHandler: recusa com 429 antes de despachar do_*
+
+    Deve vir antes de HandlerComMetricas na herança, para que as recusas
+    também sejam contadas. `controle_admissao` None desativa os limites.
+    """
+    controle_admissao = None
+
+    def handle_one_request(self):
+        self._fila_admissao = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._fila_admissao is not None:
+                self._fila_admissao.sair()
+                self._fila_admissao = None
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if self.controle_admissao is None:
+            return True
+        try:
+            self._fila_admissao = self.controle_admissao.admitir(self.client_address[0], self.command, self.path)
+        except AdmissaoRecusada as e:
+            self.responder_recusa(e)
+            return False
+        return True
+
+    def responder_recusa(self, recusa: AdmissaoRecusada):
+        corpo = json.dumps({'success': False, 'error': str(recusa)}).encode('utf-8')
+        # O corpo de um POST recusado não é lido: a conexão não pode ser reaproveitada
+        self.close_connection = True
+        self.send_response(429)
+        self.send_header('Retry-After', str(recusa.retry_after))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(corpo)
+
+# Instância compartilhada pelos servidores
+controle_admissao = None
+_lock_instancia = threading.Lock()
+
+def get_controle_admissao() -> Optional[ControleAdmissao]:
+    """Retorna o controle compartilhado (None com ADMISSAO=0)"""
+    global controle_admissao
+    if not ADMISSAO_ATIVA:
+        return None
+    with _lock_instancia:
+        if controle_admissao is None:
+            controle_admissao = ControleAdmissao(processos=ADMISSAO_PROCESSOS, diretorio=ADMISSAO_DIRETORIO)
+        return controle_admissao
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Verificação periódica de empréstimos em atraso
+Percorre só os atrasos ainda não notificados e avisa cada um uma única vez
+"""
+import threading
+from datetime import datetime
+from typing import Callable, Dict
+
+class VerificadorAtrasos:
+    """
+    Procura saídas vencidas e ainda não notificadas em uma thread própria
+
+    `notificar(movimentacao)` recebe o dict da movimentação atrasada e
+    retorna True quando o aviso foi tratado; só então o atraso é marcado
+    como notificado. Se falhar, a movimentação volta na próxima verificação.
+    """
+
+    def __init__(self, db, notificar: Callable[[Dict], bool], tamanho_lote: int = 200):
+        self.db = db
+        self.notificar = notificar
+        self.tamanho_lote = tamanho_lote
+        self._lock = threading.Lock()
+        self._agendador = None
+        self._parar = threading.Event()
+        self._status = {
+            'ultima_execucao': None,
+            'notificados': 0,
+            'falhas': 0,
+            'erro': None
+        }
+
+    def status(self) -> Dict:
+        """Retorna o resultado da última verificação"""
+        with self._lock:
+            return dict(self._status)
+
+    def verificar(self, agora: str = None) -> Dict:
+        """Executa uma verificação: notifica os novos atrasos em lotes"""
+        notificados = falhas = 0
+        erro = None
+        try:
+            while True:
+                lote = self.db.obter_movimentacoes_atrasadas(agora=agora, limite=self.tamanho_lote,
+                                                             somente_pendentes=True)
+                tratados = []
+                for movimentacao in lote:
+                    try:
+                        ok = self.notificar(movimentacao)
+                    except Exception as e:
+                        print(f"Erro ao notificar atraso da movimentação {movimentacao['id']}: {e}")
+                        ok = False
+                    if ok:
+                        tratados.append(movimentacao['id'])
+                    else:
+                        falhas += 1
+                notificados += self.db.marcar_atrasos_notificados(tratados)
+
+                # Um lote com falhas voltaria igual: tenta de novo só na próxima verificação
+                if len(lote) < self.tamanho_lote or len(tratados) < len(lote):
+                    break
+        except Exception as e:
+            print(f"Erro na verificação de atrasos: {e}")
+            erro = str(e)
+        finally:
+            self.db.liberar_conexao()
+
+        with self._lock:
+            self._status.update({
+                'ultima_execucao': datetime.now().isoformat(),
+                'notificados': notificados,
+                'falhas': falhas,
+                'erro': erro
+            })
+        return self.status()
+
+    def agendar(self, intervalo_segundos: float):
+        """Executa uma verificação a cada `intervalo_segundos` em uma thread de agendamento"""
+        if self._agendador is not None:
+            return
+
+        def _loop():
+            while not self._parar.wait(intervalo_segundos):
+                self.verificar()
+
+        self._agendador = threading.Thread(target=_loop, name='verificador-atrasos', daemon=True)
+        self._agendador.start()
+
+    def parar(self):
+        """Interrompe o agendamento"""
+        self._parar.set()
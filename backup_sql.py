@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Backups em segundo plano do banco de dados SQL
+Copia o banco em passos limitados, comprime opcionalmente e aplica retenção
+
+A cópia e a compressão são feitas em arquivos <nome>.parcial, renomeados
+para o nome final só quando terminam: a retenção só enxerga backups
+completos.
+
+Com vários processos (workers do gunicorn) usando o mesmo diretório, cada
+backup segura uma trava (flock) em <diretorio>/.backup.lock: só um roda por
+vez em todo o servidor, e o estado fica em <diretorio>/status_backup.json
+para que qualquer processo possa informá-lo.
+"""
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: só a trava do próprio processo
+    fcntl = None
+
+PREFIXO_BACKUP = 'backup_ferramentas_'
+FORMATO_DATA = '%Y%m%d_%H%M%S'
+EXTENSOES_BACKUP = ('db', 'db.gz')
+SUFIXO_PARCIAL = '.parcial'
+ARQUIVO_TRAVA = '.backup.lock'
+ARQUIVO_STATUS = 'status_backup.json'
+INTERVALO_STATUS = 0.5  # segundos entre gravações do progresso no arquivo de status
+
+def data_do_backup(caminho: str) -> Optional[datetime]:
+    """Extrai a data do nome backup_ferramentas_<AAAAMMDD_HHMMSS>.db[.gz] (None para outros arquivos)"""
+    nome = os.path.basename(caminho)
+    if not nome.startswith(PREFIXO_BACKUP):
+        return None
+    carimbo, _, extensao = nome[len(PREFIXO_BACKUP):].partition('.')
+    if extensao not in EXTENSOES_BACKUP:
+        return None
+    try:
+        return datetime.strptime(carimbo, FORMATO_DATA)
+    except ValueError:
+        return None
+
+def aplicar_retencao(diretorio: str, manter_diarios: int = 7, manter_semanais: int = 4) -> List[str]:
+    """
+    Remove backups antigos e retorna a lista de arquivos removidos
+
+    Mantém o backup mais recente de cada um dos últimos `manter_diarios` dias
+    com backup e de cada uma das últimas `manter_semanais` semanas ISO. O
+    backup mais recente de todos nunca é removido. Arquivos .parcial (cópia
+    em andamento ou interrompida) não contam nem são removidos.
+    """
+    backups = []
+    for caminho in glob.glob(os.path.join(diretorio, f'{PREFIXO_BACKUP}*.db*')):
+        data = data_do_backup(caminho)
+        if data is not None:
+            backups.append((data, caminho))
+    backups.sort(reverse=True)
+
+    manter = set()
+    dias = []
+    semanas = []
+    for data, caminho in backups:
+        dia = data.date()
+        semana = data.isocalendar()[:2]
+        if dia not in dias and len(dias) < manter_diarios:
+            dias.append(dia)
+            manter.add(caminho)
+        if semana not in semanas and len(semanas) < manter_semanais:
+            semanas.append(semana)
+            manter.add(caminho)
+    if backups:
+        manter.add(backups[0][1])
+
+    removidos = []
+    for _, caminho in backups:
+        if caminho not in manter:
+            try:
+                os.remove(caminho)
+                removidos.append(caminho)
+            except OSError as e:
+                print(f"Erro ao remover backup antigo {caminho}: {e}")
+    return removidos
+
+class GerenciadorBackup:
+    """
+    Executa backups do DatabaseManager em uma thread própria
+
+    Só um backup roda por vez, mesmo entre processos que compartilham o
+    diretório; o estado (progresso, arquivo, erro) fica disponível em
+    status() para o endpoint de acompanhamento.
+    """
+
+    def __init__(self, db, diretorio: str = 'backups', comprimir: bool = True,
+                 paginas_por_passo: int = 256, pausa: float = 0.01,
+                 manter_diarios: int = 7, manter_semanais: int = 4):
+        self.db = db
+        self.diretorio = diretorio
+        self.comprimir = comprimir
+        self.paginas_por_passo = paginas_por_passo
+        self.pausa = pausa
+        self.manter_diarios = manter_diarios
+        self.manter_semanais = manter_semanais
+        self._lock = threading.Lock()
+        self._thread = None
+        self._agendador = None
+        self._parar = threading.Event()
+        self._trava = None
+        self._status_gravado_em = 0.0
+        self._status = {
+            'em_andamento': False,
+            'arquivo': None,
+            'paginas_copiadas': 0,
+            'paginas_total': 0,
+            'iniciado_em': None,
+            'concluido_em': None,
+            'erro': None,
+            'removidos': []
+        }
+
+    @property
+    def caminho_status(self) -> str:
+        return os.path.join(self.diretorio, ARQUIVO_STATUS)
+
+    def status(self) -> Dict:
+        """
+        Retorna uma cópia do estado do backup atual ou do último
+
+        Sem backup em andamento neste processo, o estado vem do arquivo de
+        status, que pode ter sido gravado por outro processo. Um backup
+        marcado como em andamento cuja trava foi solta (processo morto no
+        meio da cópia) é informado como interrompido.
+        """
+        with self._lock:
+            status = dict(self._status)
+        if not status['em_andamento']:
+            gravado = self._ler_status()
+            if gravado is not None:
+                status = gravado
+                if status['em_andamento'] and not self._ocupado():
+                    status['em_andamento'] = False
+                    status['erro'] = status['erro'] or 'Backup interrompido antes de terminar'
+        total = status['paginas_total']
+        status['progresso'] = round(status['paginas_copiadas'] / total, 4) if total else 0.0
+        return status
+
+    def iniciar(self) -> bool:
+        """Dispara um backup em segundo plano; retorna False se já houver um em andamento"""
+        with self._lock:
+            if self._status['em_andamento'] or not self._travar():
+                return False
+            timestamp = datetime.now().strftime(FORMATO_DATA)
+            arquivo = os.path.join(self.diretorio, f'{PREFIXO_BACKUP}{timestamp}.db')
+            self._status.update({
+                'em_andamento': True,
+                'arquivo': arquivo + ('.gz' if self.comprimir else ''),
+                'paginas_copiadas': 0,
+                'paginas_total': 0,
+                'iniciado_em': datetime.now().isoformat(),
+                'concluido_em': None,
+                'erro': None,
+                'removidos': []
+            })
+            self._gravar_status(dict(self._status))
+            self._thread = threading.Thread(target=self._executar, args=(arquivo,),
+                                            name='backup-sql', daemon=True)
+            self._thread.start()
+            return True
+
+    def aguardar(self, timeout: float = None):
+        """Aguarda o backup em andamento terminar"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _travar(self) -> bool:
+        """Toma a trava do diretório; False se outro processo estiver fazendo backup"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        if fcntl is None:
+            return True
+        fd = os.open(os.path.join(self.diretorio, ARQUIVO_TRAVA), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._trava = fd
+        return True
+
+    def _destravar(self):
+        if self._trava is not None:
+            fcntl.flock(self._trava, fcntl.LOCK_UN)
+            os.close(self._trava)
+            self._trava = None
+
+    def _ocupado(self) -> bool:
+        """Indica se algum processo (inclusive este) segura a trava do diretório"""
+        if self._trava is not None:
+            return True
+        if fcntl is None:
+            return False
+        try:
+            fd = os.open(os.path.join(self.diretorio, ARQUIVO_TRAVA), os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except OSError:
+            return True
+        finally:
+            os.close(fd)  # fechar o descritor solta a trava tomada no teste
+
+    def _ler_status(self) -> Optional[Dict]:
+        try:
+            with open(self.caminho_status, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _gravar_status(self, status: Dict):
+        """Grava o estado no diretório de backups (escrita atômica com os.replace)"""
+        temporario = f'{self.caminho_status}.{os.getpid()}.tmp'
+        try:
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(status, f)
+            os.replace(temporario, self.caminho_status)
+            self._status_gravado_em = time.monotonic()
+        except OSError as e:
+            print(f"Erro ao gravar o status do backup: {e}")
+
+    def _progresso(self, copiadas: int, total: int):
+        with self._lock:
+            self._status['paginas_copiadas'] = copiadas
+            self._status['paginas_total'] = total
+            if time.monotonic() - self._status_gravado_em >= INTERVALO_STATUS:
+                self._gravar_status(dict(self._status))
+
+    def _remover_parciais(self):
+        """Remove cópias .parcial deixadas por um backup interrompido (a trava garante que nenhum está rodando)"""
+        for caminho in glob.glob(os.path.join(self.diretorio, f'{PREFIXO_BACKUP}*{SUFIXO_PARCIAL}')):
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    def _executar(self, arquivo: str):
+        erro = None
+        removidos = []
+        copia = arquivo + SUFIXO_PARCIAL
+        comprimido = arquivo + '.gz' + SUFIXO_PARCIAL
+        try:
+            self._remover_parciais()
+            self.db.backup_database(copia, paginas_por_passo=self.paginas_por_passo,
+                                    progresso=self._progresso, pausa=self.pausa)
+            if self.comprimir:
+                with open(copia, 'rb') as origem, open(comprimido, 'wb') as saida, \
+                        gzip.GzipFile(os.path.basename(arquivo), 'wb', fileobj=saida) as destino:
+                    shutil.copyfileobj(origem, destino, 1024 * 1024)
+                os.replace(comprimido, arquivo + '.gz')
+                os.remove(copia)
+            else:
+                os.replace(copia, arquivo)
+            removidos = aplicar_retencao(self.diretorio, self.manter_diarios, self.manter_semanais)
+        except Exception as e:
+            print(f"Erro no backup em segundo plano: {e}")
+            erro = str(e)
+            for caminho in (copia, comprimido):
+                if os.path.exists(caminho):
+                    try:
+                        os.remove(caminho)
+                    except OSError:
+                        pass
+        finally:
+            with self._lock:
+                self._status['em_andamento'] = False
+                self._status['concluido_em'] = datetime.now().isoformat()
+                self._status['erro'] = erro
+                self._status['removidos'] = removidos
+                self._gravar_status(dict(self._status))
+                self._destravar()
+
+    def agendar(self, intervalo_segundos: float):
+        """Executa um backup a cada `intervalo_segundos` em uma thread de agendamento"""
+        if self._agendador is not None:
+            return
+
+        def _loop():
+            while not self._parar.wait(intervalo_segundos):
+                self.iniciar()
+
+        self._agendador = threading.Thread(target=_loop, name='backup-agendador', daemon=True)
+        self._agendador.start()
+
+    def parar(self):
+        """Interrompe o agendamento (um backup em andamento termina normalmente)"""
+        self._parar.set()
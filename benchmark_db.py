@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmarks do banco de dados SQL do sistema de gestão de ferramentas
+Executa em um banco temporário, sem tocar em ferramentas.db
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from database_sql import DatabaseManager, Movimentacao, serializar_registros
+
+def criar_banco_temporario(max_conexoes=8, ferramentas=20, quantidade=1000):
+    """Cria um banco temporário inicializado com o schema e ferramentas de teste"""
+    tmpdir = tempfile.mkdtemp(prefix='bench_ferramentas_')
+    db = DatabaseManager(os.path.join(tmpdir, 'bench.db'), max_conexoes=max_conexoes)
+    db.initialize_database()
+    for i in range(ferramentas):
+        db.adicionar_ferramenta(f'Ferramenta {i:03d}', quantidade_total=quantidade)
+    db.liberar_conexao()
+    return db, tmpdir
+
+def benchmark_leituras_sob_escrita(max_conexoes=8, leitores=4, escritores=2, duracao=3.0):
+    """Mede leituras/s de obter_ferramentas com escritas concorrentes de movimentações"""
+    db, tmpdir = criar_banco_temporario(max_conexoes=max_conexoes)
+    parar = threading.Event()
+    leituras = [0] * leitores
+    escritas = [0] * escritores
+    erros = []
+
+    solicitante_id = db.obter_solicitantes()[0]['id']
+    ferramenta_ids = [f['id'] for f in db.obter_ferramentas()]
+    db.liberar_conexao()
+
+    def leitor(n):
+        while not parar.is_set():
+            try:
+                db.obter_ferramentas()
+                leituras[n] += 1
+            except Exception as e:
+                erros.append(e)
+            finally:
+                db.liberar_conexao()
+
+    def escritor(n):
+        i = 0
+        while not parar.is_set():
+            try:
+                mov_id = db.adicionar_movimentacao('saida', solicitante_id,
+                                                   ferramenta_ids[i % len(ferramenta_ids)])
+                db.concluir_movimentacao(mov_id)
+                escritas[n] += 1
+            except Exception as e:
+                erros.append(e)
+            finally:
+                db.liberar_conexao()
+            i += 1
+
+    threads = [threading.Thread(target=leitor, args=(n,)) for n in range(leitores)]
+    threads += [threading.Thread(target=escritor, args=(n,)) for n in range(escritores)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duracao)
+    parar.set()
+    for t in threads:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+
+    db.close()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {
+        'max_conexoes': max_conexoes,
+        'leituras_por_s': sum(leituras) / decorrido,
+        'escritas_por_s': sum(escritas) / decorrido,
+        'erros': len(erros)
+    }
+
+def benchmark_registros(n=100_000):
+    """Compara dict por linha + json.dumps com registros compactos + serialização colunar"""
+    db, tmpdir = criar_banco_temporario(ferramentas=1, quantidade=n)
+    solicitante_id = db.obter_solicitantes()[0]['id']
+    ferramenta_id = db.obter_ferramentas()[0]['id']
+    db.adicionar_movimentacoes_lote(
+        {'tipo': 'saida', 'solicitante_id': solicitante_id, 'ferramenta_id': ferramenta_id,
+         'data_saida': '2025-01-01', 'observacoes': f'Registro {i}'}
+        for i in range(n))
+
+    def via_dicts():
+        return json.dumps({'success': True, 'data': db.obter_movimentacoes()})
+
+    def via_registros():
+        return serializar_registros(db.obter_movimentacoes(como_registros=True), Movimentacao,
+                                    success=True)
+
+    resultados = {}
+    for nome, funcao in (('dicts', via_dicts), ('registros', via_registros)):
+        funcao()  # aquece o cache de páginas do SQLite
+        inicio = time.perf_counter()
+        corpo = funcao()
+        decorrido = time.perf_counter() - inicio
+
+        tracemalloc.start()
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        resultados[nome] = {'segundos': decorrido, 'pico_mb': pico / 1024 / 1024,
+                            'bytes_json': len(corpo.encode('utf-8'))}
+
+    db.close()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do banco de dados SQL')
+    parser.add_argument('--leitores', type=int, default=4)
+    parser.add_argument('--escritores', type=int, default=2)
+    parser.add_argument('--duracao', type=float, default=3.0)
+    parser.add_argument('--movimentacoes', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print('=== Leituras sob escrita concorrente ===')
+    for max_conexoes in (1, args.leitores + args.escritores):
+        r = benchmark_leituras_sob_escrita(max_conexoes, args.leitores, args.escritores, args.duracao)
+        print(f"  pool={r['max_conexoes']:>2}: {r['leituras_por_s']:>10.0f} leituras/s  "
+              f"{r['escritas_por_s']:>8.0f} escritas/s  erros={r['erros']}")
+
+    print(f'=== Leitura + JSON de {args.movimentacoes} movimentações ===')
+    for nome, r in benchmark_registros(args.movimentacoes).items():
+        print(f"  {nome:<10} {r['segundos'] * 1000:>8.0f} ms  pico {r['pico_mb']:>7.1f} MB  "
+              f"JSON {r['bytes_json'] / 1024 / 1024:>6.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark do servidor SQL: app.run (dev) contra producao_sql (gunicorn)
+Sobe cada servidor em um diretório temporário com um banco de teste e mede
+requisições/s e latências (p50/p99) com clientes keep-alive concorrentes.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from database_sql import DatabaseManager
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+ROTAS = ('/api/ferramentas', '/api/estatisticas', '/api/movimentacoes?limit=50')
+
+# Mesmo app.run do __main__ de server_sql, sem os serviços de fundo
+COMANDO_DEV = [sys.executable, '-c',
+               "import sys, server_sql; server_sql.app.run(host='127.0.0.1', port=int(sys.argv[1]), debug=True)"]
+
+def criar_banco(diretorio, ferramentas=50, movimentacoes=2000):
+    """Cria ferramentas.db no diretório com dados de teste"""
+    db = DatabaseManager(os.path.join(diretorio, 'ferramentas.db'))
+    db.initialize_database()
+    solicitante_id = db.adicionar_solicitante('Bancada', 'bancada@example.com')
+    ids = [db.adicionar_ferramenta(f'Ferramenta {i:03d}', quantidade_total=movimentacoes)
+           for i in range(ferramentas)]
+    db.adicionar_movimentacoes_lote([
+        {'tipo': 'saida', 'solicitante_id': solicitante_id, 'ferramenta_id': ids[i % len(ids)]}
+        for i in range(movimentacoes)
+    ])
+    db.close()
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def aguardar_servidor(porta, processo, timeout=30.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"Servidor terminou com código {processo.returncode}")
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=2)
+            conexao.request('GET', ROTAS[0])
+            conexao.getresponse().read()
+            conexao.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Servidor não respondeu a tempo")
+
+def carga(porta, clientes, duracao):
+    """Dispara GETs em ciclo pelas ROTAS a partir de `clientes` conexões keep-alive"""
+    latencias = [[] for _ in range(clientes)]
+    erros = [0] * clientes
+    parar = threading.Event()
+
+    def cliente(n):
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        i = n
+        while not parar.is_set():
+            rota = ROTAS[i % len(ROTAS)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                conexao.request('GET', rota, headers={'Accept-Encoding': 'gzip'})
+                resposta = conexao.getresponse()
+                resposta.read()
+                if resposta.status != 200:
+                    erros[n] += 1
+            except (OSError, http.client.HTTPException):
+                erros[n] += 1
+                conexao.close()
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+                continue
+            latencias[n].append(time.perf_counter() - inicio)
+        conexao.close()
+
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duracao)
+    parar.set()
+    for t in threads:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+
+    todas = sorted(l for lista in latencias for l in lista)
+    if not todas:
+        return {'req_s': 0.0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'erros': sum(erros)}
+    return {
+        'req_s': len(todas) / decorrido,
+        'p50_ms': todas[len(todas) // 2] * 1000,
+        'p99_ms': todas[min(len(todas) - 1, int(len(todas) * 0.99))] * 1000,
+        'erros': sum(erros)
+    }
+
+def medir(nome, comando, diretorio, porta, clientes, duracao):
+    # ADMISSAO=0: todos os clientes saem do mesmo IP e passariam do limite por cliente
+    ambiente = dict(os.environ, ADMISSAO='0',
+                    PYTHONPATH=DIRETORIO + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    processo = subprocess.Popen(comando, cwd=diretorio, env=ambiente,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        aguardar_servidor(porta, processo)
+        carga(porta, clientes, min(1.0, duracao))  # aquecimento
+        resultado = carga(porta, clientes, duracao)
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+    print(f"{nome:<28} {resultado['req_s']:>9.0f} req/s  p50 {resultado['p50_ms']:6.1f} ms  "
+          f"p99 {resultado['p99_ms']:7.1f} ms  erros {resultado['erros']}")
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do servidor SQL: app.run contra gunicorn')
+    parser.add_argument('--clientes', type=int, default=32)
+    parser.add_argument('--duracao', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_servidor_')
+    try:
+        criar_banco(tmpdir)
+        print(f"{args.clientes} clientes keep-alive, {args.duracao:.0f} s por servidor, rotas: {', '.join(ROTAS)}")
+
+        porta = porta_livre()
+        dev = medir('app.run (debug=True)', COMANDO_DEV + [str(porta)], tmpdir, porta,
+                    args.clientes, args.duracao)
+
+        porta = porta_livre()
+        producao = medir(f'gunicorn {args.workers}x{args.threads}',
+                         [sys.executable, os.path.join(DIRETORIO, 'producao_sql.py'),
+                          '--bind', f'127.0.0.1:{porta}', '--workers', str(args.workers),
+                          '--threads', str(args.threads)],
+                         tmpdir, porta, args.clientes, args.duracao)
+
+        if dev['req_s']:
+            print(f"Vazão: {producao['req_s'] / dev['req_s']:.1f}x  "
+                  f"p99: {dev['p99_ms']:.1f} -> {producao['p99_ms']:.1f} ms")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Cache de respostas GET do servidor SQL
+Cada entrada guarda as versões das tabelas de que depende (versoes_tabelas);
+uma escrita em qualquer dessas tabelas invalida a entrada na próxima leitura.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from compressao import comprimir
+from metricas import registro
+
+ACERTOS = registro.contador('ferramentas_cache_acertos_total', 'Respostas GET servidas do cache')
+FALHAS = registro.contador('ferramentas_cache_falhas_total',
+                           'Respostas GET geradas de novo (sem entrada ou entrada vencida)')
+BYTES_ECONOMIZADOS = registro.contador('ferramentas_cache_bytes_economizados_total',
+                                       'Bytes de corpo não enviados por respostas 304')
+
+class EntradaCache(NamedTuple):
+    versoes: tuple
+    corpo: bytes
+    etag: str
+    mimetype: str
+    variantes: Dict[str, bytes]
+
+class CacheRespostas:
+    """
+    Cache LRU de corpos de resposta, chaveado por rota + query string
+
+    O ETag é forte (hash do corpo), calculado uma vez quando a entrada é
+    guardada; cada codificação (gzip, br) ganha um ETag próprio e o corpo
+    comprimido fica na entrada. Os contadores alimentam /api/cache/status e
+    o /metrics.
+    """
+
+    def __init__(self, max_entradas: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._contadores = {
+            'acertos': 0,
+            'falhas': 0,
+            'nao_modificado': 0,
+            'bytes_servidos_cache': 0,
+            'bytes_economizados': 0
+        }
+
+    @staticmethod
+    def calcular_etag(corpo: bytes) -> str:
+        return '"' + hashlib.blake2b(corpo, digest_size=16).hexdigest() + '"'
+
+    def obter(self, chave: str, versoes: tuple) -> Optional[EntradaCache]:
+        """Retorna a entrada se ainda valer para estas versões; entradas vencidas são descartadas"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada.versoes == versoes:
+                self._entradas.move_to_end(chave)
+                self._contadores['acertos'] += 1
+                ACERTOS.inc()
+                return entrada
+            if entrada is not None:
+                self._remover(chave)
+            self._contadores['falhas'] += 1
+            FALHAS.inc()
+            return None
+
+    def guardar(self, chave: str, versoes: tuple, corpo: bytes, mimetype: str) -> EntradaCache:
+        """Guarda o corpo gerado para estas versões e retorna a entrada"""
+        entrada = EntradaCache(versoes, corpo, self.calcular_etag(corpo), mimetype, {})
+        if len(corpo) > self.max_bytes:
+            return entrada
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = entrada
+            self._bytes += len(corpo)
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                self._remover(next(iter(self._entradas)))
+        return entrada
+
+    @staticmethod
+    def etag_codificado(entrada: EntradaCache, codificacao: Optional[str]) -> str:
+        """ETag da representação: o mesmo corpo em gzip é outra representação"""
+        if codificacao is None:
+            return entrada.etag
+        return entrada.etag[:-1] + '-' + codificacao + '"'
+
+    def corpo_codificado(self, chave: str, entrada: EntradaCache, codificacao: Optional[str]) -> bytes:
+        """Retorna o corpo na codificação pedida, comprimindo só na primeira vez"""
+        if codificacao is None:
+            return entrada.corpo
+        corpo = entrada.variantes.get(codificacao)
+        if corpo is None:
+            corpo = comprimir(entrada.corpo, codificacao)
+            with self._lock:
+                if codificacao not in entrada.variantes and self._entradas.get(chave) is entrada:
+                    self._bytes += len(corpo)
+                entrada.variantes[codificacao] = corpo
+        return corpo
+
+    def registrar_envio(self, entrada: EntradaCache, nao_modificado: bool, do_cache: bool):
+        """Contabiliza os bytes que não precisaram ser gerados (acerto) ou enviados (304)"""
+        with self._lock:
+            if nao_modificado:
+                self._contadores['nao_modificado'] += 1
+                self._contadores['bytes_economizados'] += len(entrada.corpo)
+                BYTES_ECONOMIZADOS.inc(quantidade=len(entrada.corpo))
+            if do_cache:
+                self._contadores['bytes_servidos_cache'] += len(entrada.corpo)
+
+    def _remover(self, chave: str):
+        entrada = self._entradas.pop(chave)
+        self._bytes -= len(entrada.corpo) + sum(len(corpo) for corpo in entrada.variantes.values())
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            estatisticas = dict(self._contadores)
+            estatisticas['entradas'] = len(self._entradas)
+            estatisticas['bytes_em_cache'] = self._bytes
+        consultas = estatisticas['acertos'] + estatisticas['falhas']
+        estatisticas['taxa_acerto'] = round(estatisticas['acertos'] / consultas, 4) if consultas else 0.0
+        return estatisticas
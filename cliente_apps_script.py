@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Cliente compartilhado para o Google Apps Script
+Mantém conexões keep-alive por host (inclusive o host do redirecionamento
+do Apps Script), limita o tempo de conexão e de leitura e o número de
+chamadas simultâneas, para que um Apps Script lento não prenda as threads
+dos servidores.
+"""
+import http.client
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+
+from metricas import DURACAO_APPS_SCRIPT
+
+URL_APPS_SCRIPT = os.environ.get(
+    'APPS_SCRIPT_URL',
+    'https://script.google.com/macros/s/AKfycbw7_F6_p_cnLGenGmPFbep7zHwdZ5UcAYC1OXLu8Jp7SXrdjU9Nncimkxpuvt8qRw7oBA/exec'
+)
+
+MAX_REDIRECIONAMENTOS = 5
+
+# Erros de uma conexão keep-alive que o servidor fechou enquanto estava ociosa
+ERROS_CONEXAO_VELHA = (http.client.RemoteDisconnected, ConnectionResetError,
+                       BrokenPipeError, ConnectionAbortedError)
+
+class ClienteSaturado(Exception):
+    """Todas as vagas de chamadas simultâneas ao Apps Script estão ocupadas"""
+
+class TempoEsgotado(Exception):
+    """O Apps Script não conectou ou não respondeu dentro do limite"""
+
+class RespostaUpstream(NamedTuple):
+    status: int
+    corpo: bytes
+    content_type: str
+
+class ClienteUpstream:
+    """
+    Pool de conexões HTTP(S) keep-alive, por (esquema, host, porta)
+
+    Cada chamada ocupa uma vaga de `max_concorrentes`; sem vaga em
+    `espera_vaga` segundos a chamada falha com ClienteSaturado em vez de
+    enfileirar. `timeout_conexao` limita o connect (e o TLS) e
+    `timeout_leitura` cada leitura do socket. Redirecionamentos 301/302/303
+    viram GET sem corpo, como fazem os navegadores com o Apps Script.
+    """
+
+    def __init__(self, url: str = URL_APPS_SCRIPT, max_concorrentes: int = 8,
+                 max_ociosas_por_host: int = 8, timeout_conexao: float = 5.0,
+                 timeout_leitura: float = 30.0, espera_vaga: float = 1.0):
+        self.url = url
+        self.max_ociosas_por_host = max_ociosas_por_host
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self.espera_vaga = espera_vaga
+        self._vagas = threading.BoundedSemaphore(max_concorrentes)
+        self._ociosas = {}
+        self._lock = threading.Lock()
+        self._contadores = {
+            'requisicoes': 0,
+            'conexoes_abertas': 0,
+            'conexoes_reutilizadas': 0,
+            'redirecionamentos': 0,
+            'timeouts': 0,
+            'rejeitadas': 0,
+            'erros': 0,
+            'segundos_total': 0.0
+        }
+
+    def get(self, url: str = None, cabecalhos: Dict[str, str] = None) -> RespostaUpstream:
+        return self.requisitar('GET', url or self.url, cabecalhos=cabecalhos)
+
+    def post(self, corpo: bytes, url: str = None, content_type: str = 'application/json',
+             cabecalhos: Dict[str, str] = None) -> RespostaUpstream:
+        cabecalhos = dict(cabecalhos or {}, **{'Content-Type': content_type})
+        return self.requisitar('POST', url or self.url, corpo, cabecalhos)
+
+    def requisitar(self, metodo: str, url: str, corpo: Optional[bytes] = None,
+                   cabecalhos: Dict[str, str] = None) -> RespostaUpstream:
+        """Faz a chamada seguindo redirecionamentos; levanta ClienteSaturado ou TempoEsgotado"""
+        inicio = time.perf_counter()
+        if not self._vagas.acquire(timeout=self.espera_vaga):
+            self._contar('rejeitadas')
+            DURACAO_APPS_SCRIPT.observar('rejeitada', valor=time.perf_counter() - inicio)
+            raise ClienteSaturado("Limite de chamadas simultâneas ao Apps Script atingido")
+
+        inicio = time.perf_counter()
+        resultado = 'erro'
+        try:
+            for _ in range(MAX_REDIRECIONAMENTOS + 1):
+                resposta, destino = self._enviar(metodo, url, corpo, cabecalhos or {})
+                if resposta.status not in (301, 302, 303, 307, 308) or not destino:
+                    resultado = 'ok'
+                    return resposta
+                self._contar('redirecionamentos')
+                url = urljoin(url, destino)
+                if resposta.status in (301, 302, 303):
+                    metodo, corpo = 'GET', None
+                    cabecalhos = {k: v for k, v in (cabecalhos or {}).items() if k.lower() != 'content-type'}
+            raise http.client.HTTPException(f"Mais de {MAX_REDIRECIONAMENTOS} redirecionamentos")
+        except TempoEsgotado:
+            resultado = 'timeout'
+            self._contar('timeouts')
+            raise
+        except Exception:
+            self._contar('erros')
+            raise
+        finally:
+            self._vagas.release()
+            decorrido = time.perf_counter() - inicio
+            DURACAO_APPS_SCRIPT.observar(resultado, valor=decorrido)
+            with self._lock:
+                self._contadores['requisicoes'] += 1
+                self._contadores['segundos_total'] += decorrido
+
+    def _enviar(self, metodo, url, corpo, cabecalhos):
+        partes = urlsplit(url)
+        chave = (partes.scheme, partes.hostname, partes.port)
+        caminho = partes.path or '/'
+        if partes.query:
+            caminho += '?' + partes.query
+        cabecalhos = dict(cabecalhos, **{'User-Agent': 'Python-Proxy/1.0', 'Connection': 'keep-alive'})
+
+        conexao, reutilizada = self._obter(chave)
+        try:
+            try:
+                conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+                resposta = conexao.getresponse()
+            except ERROS_CONEXAO_VELHA:
+                if not reutilizada:
+                    raise
+                # O servidor fechou a conexão ociosa; tenta uma vez com uma nova
+                conexao.close()
+                conexao, _ = self._obter(chave, nova=True)
+                conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+                resposta = conexao.getresponse()
+            dados = resposta.read()
+        except TimeoutError as e:
+            conexao.close()
+            raise TempoEsgotado(f"Apps Script sem resposta em {self.timeout_leitura}s ({partes.hostname})") from e
+        except Exception:
+            conexao.close()
+            raise
+
+        if resposta.will_close:
+            conexao.close()
+        else:
+            self._devolver(chave, conexao)
+        return (RespostaUpstream(resposta.status, dados, resposta.getheader('Content-Type', 'application/json')),
+                resposta.getheader('Location'))
+
+    def _obter(self, chave, nova: bool = False):
+        """Retorna (conexão, reutilizada); conecta já com o timeout de conexão"""
+        if not nova:
+            with self._lock:
+                ociosas = self._ociosas.get(chave)
+                if ociosas:
+                    self._contadores['conexoes_reutilizadas'] += 1
+                    return ociosas.pop(), True
+
+        esquema, host, porta = chave
+        classe = http.client.HTTPSConnection if esquema == 'https' else http.client.HTTPConnection
+        conexao = classe(host, porta, timeout=self.timeout_conexao)
+        try:
+            conexao.connect()
+        except TimeoutError as e:
+            conexao.close()
+            raise TempoEsgotado(f"Apps Script não conectou em {self.timeout_conexao}s ({host})") from e
+        conexao.sock.settimeout(self.timeout_leitura)
+        self._contar('conexoes_abertas')
+        return conexao, False
+
+    def _devolver(self, chave, conexao):
+        with self._lock:
+            ociosas = self._ociosas.setdefault(chave, [])
+            if len(ociosas) < self.max_ociosas_por_host:
+                ociosas.append(conexao)
+                return
+        conexao.close()
+
+    def _contar(self, contador: str):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def fechar(self):
+        """Fecha as conexões ociosas"""
+        with self._lock:
+            ociosas = [c for lista in self._ociosas.values() for c in lista]
+            self._ociosas = {}
+        for conexao in ociosas:
+            conexao.close()
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            estatisticas = dict(self._contadores)
+            estatisticas['conexoes_ociosas'] = sum(len(l) for l in self._ociosas.values())
+        requisicoes = estatisticas['requisicoes']
+        estatisticas['latencia_media_ms'] = round(estatisticas.pop('segundos_total') * 1000 / requisicoes, 2) if requisicoes else 0.0
+        return estatisticas
+
+# Instância compartilhada pelos servidores
+cliente_apps_script = None
+_lock_instancia = threading.Lock()
+
+def get_cliente_apps_script() -> ClienteUpstream:
+    """Retorna o cliente compartilhado do Apps Script (criado no primeiro uso)"""
+    global cliente_apps_script
+    with _lock_instancia:
+        if cliente_apps_script is None:
+            cliente_apps_script = ClienteUpstream(
+                max_concorrentes=int(os.environ.get('APPS_SCRIPT_MAX_CONCORRENTES', 8)),
+                timeout_conexao=float(os.environ.get('APPS_SCRIPT_TIMEOUT_CONEXAO', 5)),
+                timeout_leitura=float(os.environ.get('APPS_SCRIPT_TIMEOUT_LEITURA', 30))
+            )
+        return cliente_apps_script
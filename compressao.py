@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Compressão negociada (gzip/brotli) das respostas dos servidores
+Os arquivos estáticos são comprimidos uma vez na inicialização; respostas
+JSON acima do tamanho mínimo são comprimidas na hora.
+"""
+import gzip
+import mimetypes
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Abaixo disso o cabeçalho gzip e o custo de CPU não compensam
+TAMANHO_MINIMO = 1024
+
+NIVEL_GZIP = 6
+NIVEL_GZIP_ESTATICO = 9
+QUALIDADE_BROTLI = 5
+QUALIDADE_BROTLI_ESTATICO = 11
+
+EXTENSOES_ESTATICAS = ('.html', '.js', '.css', '.json', '.svg', '.txt')
+
+TIPOS_COMPRESSIVEIS = (
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+)
+
+def codificacoes_disponiveis() -> Tuple[str, ...]:
+    """Codificações suportadas, na ordem de preferência do servidor"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def tipo_compressivel(mimetype: Optional[str]) -> bool:
+    """Indica se vale comprimir respostas deste tipo (texto, JSON, JS, SVG)"""
+    return bool(mimetype) and mimetype.startswith(TIPOS_COMPRESSIVEIS)
+
+def escolher_codificacao(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Escolhe a codificação a partir do cabeçalho Accept-Encoding
+
+    Respeita q=0 e o curinga '*'. Entre as codificações aceitas com o mesmo
+    q, prefere brotli (quando instalado) a gzip. Retorna None para identity.
+    """
+    if not accept_encoding:
+        return None
+
+    pesos = {}
+    for item in accept_encoding.split(','):
+        partes = item.strip().split(';')
+        nome = partes[0].strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        for parametro in partes[1:]:
+            chave, _, valor = parametro.strip().partition('=')
+            if chave.strip().lower() == 'q':
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        pesos[nome] = q
+
+    melhor, melhor_q = None, 0.0
+    for codificacao in codificacoes_disponiveis():
+        q = pesos.get(codificacao, pesos.get('*', 0.0))
+        if q > melhor_q:
+            melhor, melhor_q = codificacao, q
+    return melhor
+
+def comprimir(corpo: bytes, codificacao: str, estatico: bool = False) -> bytes:
+    """Comprime o corpo; `estatico` usa o nível máximo (feito uma vez só)"""
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=QUALIDADE_BROTLI_ESTATICO if estatico else QUALIDADE_BROTLI)
+    if codificacao == 'gzip':
+        # mtime=0 deixa a saída determinística (mesmo corpo, mesmos bytes)
+        return gzip.compress(corpo, compresslevel=NIVEL_GZIP_ESTATICO if estatico else NIVEL_GZIP, mtime=0)
+    raise ValueError(f"Codificação não suportada: {codificacao}")
+
+def negociar(corpo: bytes, mimetype: Optional[str], accept_encoding: Optional[str],
+             tamanho_minimo: int = TAMANHO_MINIMO) -> Tuple[bytes, Optional[str]]:
+    """
+    Comprime o corpo se o tipo, o tamanho e o cliente permitirem
+
+    Retorna (corpo, codificação); a codificação é None quando o corpo volta
+    sem alteração. Quem responde deve mandar Vary: Accept-Encoding sempre que
+    tipo_compressivel(mimetype) for verdadeiro, comprimindo ou não.
+    """
+    if len(corpo) < tamanho_minimo or not tipo_compressivel(mimetype):
+        return corpo, None
+    codificacao = escolher_codificacao(accept_encoding)
+    if codificacao is None:
+        return corpo, None
+    return comprimir(corpo, codificacao), codificacao
+
+class ArquivoComprimido:
+    """Versões comprimidas de um arquivo estático, válidas para um mtime/tamanho"""
+    __slots__ = ('caminho', 'mtime', 'tamanho', 'mimetype', 'variantes')
+
+    def __init__(self, caminho: str, mtime: float, tamanho: int, mimetype: str, variantes: Dict[str, bytes]):
+        self.caminho = caminho
+        self.mtime = mtime
+        self.tamanho = tamanho
+        self.mimetype = mimetype
+        self.variantes = variantes
+
+class ArquivosComprimidos:
+    """
+    Pré-compressão dos arquivos estáticos de um diretório
+
+    preparar() comprime na inicialização todos os arquivos com extensão em
+    EXTENSOES_ESTATICAS e pelo menos TAMANHO_MINIMO bytes. obter() confere
+    mtime e tamanho a cada pedido e recomprime um arquivo que mudou em disco,
+    então editar painel.html com o servidor no ar continua funcionando.
+    """
+
+    def __init__(self, diretorio: str, extensoes: Tuple[str, ...] = EXTENSOES_ESTATICAS,
+                 tamanho_minimo: int = TAMANHO_MINIMO):
+        self.diretorio = os.path.abspath(diretorio)
+        self.extensoes = extensoes
+        self.tamanho_minimo = tamanho_minimo
+        self._arquivos = {}
+        self._lock = threading.Lock()
+
+    def preparar(self) -> int:
+        """Comprime os arquivos estáticos do diretório e retorna quantos foram preparados"""
+        for nome in sorted(os.listdir(self.diretorio)):
+            if nome.endswith(self.extensoes):
+                self.obter(nome)
+        return len(self._arquivos)
+
+    def caminho_seguro(self, relativo: str) -> Optional[str]:
+        """Resolve o caminho dentro do diretório; None se sair dele"""
+        caminho = os.path.abspath(os.path.join(self.diretorio, relativo.lstrip('/')))
+        if os.path.commonpath([caminho, self.diretorio]) != self.diretorio:
+            return None
+        return caminho
+
+    def obter(self, relativo: str) -> Optional[ArquivoComprimido]:
+        """Retorna as variantes comprimidas do arquivo, ou None se não houver"""
+        if not relativo.endswith(self.extensoes):
+            return None
+        caminho = self.caminho_seguro(relativo)
+        if caminho is None:
+            return None
+        try:
+            info = os.stat(caminho)
+        except OSError:
+            self._arquivos.pop(caminho, None)
+            return None
+
+        arquivo = self._arquivos.get(caminho)
+        if arquivo is not None and arquivo.mtime == info.st_mtime and arquivo.tamanho == info.st_size:
+            return arquivo
+        if info.st_size < self.tamanho_minimo:
+            return None
+
+        with self._lock:
+            arquivo = self._arquivos.get(caminho)
+            if arquivo is not None and arquivo.mtime == info.st_mtime and arquivo.tamanho == info.st_size:
+                return arquivo
+            with open(caminho, 'rb') as f:
+                corpo = f.read()
+            mimetype = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+            variantes = {codificacao: comprimir(corpo, codificacao, estatico=True)
+                         for codificacao in codificacoes_disponiveis()}
+            arquivo = ArquivoComprimido(caminho, info.st_mtime, info.st_size, mimetype, variantes)
+            self._arquivos[caminho] = arquivo
+            return arquivo
+
+    def variante(self, relativo: str, accept_encoding: Optional[str]) -> Optional[Tuple[ArquivoComprimido, str, bytes]]:
+        """Retorna (arquivo, codificação, corpo) se o cliente aceitar uma das variantes"""
+        arquivo = self.obter(relativo)
+        if arquivo is None:
+            return None
+        codificacao = escolher_codificacao(accept_encoding)
+        if codificacao is None:
+            return None
+        return arquivo, codificacao, arquivo.variantes[codificacao]
+
+    def estatisticas(self) -> Dict:
+        arquivos = list(self._arquivos.values())
+        return {
+            'arquivos': len(arquivos),
+            'bytes_originais': sum(a.tamanho for a in arquivos),
+            'bytes_comprimidos': {c: sum(len(a.variantes[c]) for a in arquivos if c in a.variantes)
+                                  for c in codificacoes_disponiveis()}
+        }
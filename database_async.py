@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Camada assíncrona (asyncio) sobre o DatabaseManager
+Escritas rodam em uma única thread escritora e leituras em um pool limitado
+de threads leitoras, cada uma com sua própria conexão SQLite
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Union
+
+from database_sql import DatabaseManager, Movimentacao
+
+# Métodos que alteram o banco: sempre executados na thread escritora, em ordem
+METODOS_ESCRITA = (
+    'initialize_database', 'aplicar_migracoes', 'reconciliar_estatisticas', 'reconstruir_uso',
+    'adicionar_solicitante', 'adicionar_solicitantes_lote', 'atualizar_solicitante', 'remover_solicitante',
+    'adicionar_ferramenta', 'adicionar_ferramentas_lote', 'atualizar_ferramenta', 'remover_ferramenta',
+    'adicionar_movimentacao', 'adicionar_movimentacoes_lote', 'atualizar_movimentacao',
+    'concluir_movimentacao', 'arquivar_movimentacoes', 'marcar_atrasos_notificados',
+    'adicionar_patrimonio', 'remover_patrimonio',
+    'enfileirar_email', 'reservar_emails_pendentes', 'adiar_emails', 'marcar_emails_enviados',
+    'registrar_falha_email',
+)
+
+# Métodos somente leitura: distribuídos entre as threads leitoras
+METODOS_LEITURA = (
+    'versao_schema', 'obter_solicitantes', 'obter_ferramentas',
+    'obter_movimentacoes', 'obter_movimentacoes_pagina', 'obter_movimentacoes_atrasadas',
+    'obter_alteracoes', 'changes_since', 'obter_ultimo_seq', 'versoes_tabelas',
+    'obter_patrimonio', 'obter_patrimonios_solicitante', 'obter_patrimonios_ferramenta',
+    'obter_uso', 'obter_estatisticas', 'backup_database',
+    'obter_tabelas', 'obter_colunas_tabela', 'obter_dados_tabela', 'contar_registros_tabela',
+)
+
+# Métodos do DatabaseManager sem versão assíncrona (ciclo de vida e utilitários puros)
+METODOS_SINCRONOS = ('connect', 'close', 'liberar_conexao', 'codificar_cursor', 'decodificar_cursor')
+
+class AsyncDatabaseManager:
+    """
+    Fachada assíncrona do DatabaseManager
+
+    Cada método público do DatabaseManager tem aqui uma versão awaitable com
+    o mesmo nome e argumentos. As escritas passam por um executor de uma
+    thread só, o que as serializa sem disputar o lock do SQLite; as leituras
+    usam `leitores` threads em paralelo (modo WAL). Como as threads são
+    fixas, cada uma mantém sua conexão do pool durante toda a vida da fachada.
+    """
+
+    def __init__(self, db_path: str = 'ferramentas.db', leitores: int = 4, db: DatabaseManager = None):
+        self.leitores = leitores
+        self.db = db or DatabaseManager(db_path, max_conexoes=leitores + 2)
+        self._escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-escritor')
+        self._leitor = ThreadPoolExecutor(max_workers=leitores, thread_name_prefix='db-leitor')
+
+    async def _executar(self, escrita: bool, funcao, *args, **kwargs):
+        executor = self._escritor if escrita else self._leitor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(funcao, *args, **kwargs))
+
+    async def iterar_movimentacoes(self, tamanho_lote: int = 500, como_registros: bool = False,
+                                   **filtros) -> AsyncIterator[Union[Dict, Movimentacao]]:
+        """Versão assíncrona de iterar_movimentacoes: busca cada lote em uma thread leitora"""
+        cursor = None
+        while True:
+            pagina = await self.obter_movimentacoes_pagina(limite=tamanho_lote, cursor=cursor,
+                                                           como_registros=como_registros, **filtros)
+            for registro in pagina['data']:
+                yield registro
+            cursor = pagina['next_cursor']
+            if cursor is None:
+                return
+
+    def codificar_cursor(self, criado_em: str, id: int) -> str:
+        return self.db.codificar_cursor(criado_em, id)
+
+    def decodificar_cursor(self, cursor: str) -> tuple:
+        return self.db.decodificar_cursor(cursor)
+
+    async def close(self):
+        """Aguarda as operações pendentes e fecha as conexões"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._escritor.shutdown, wait=True))
+        await loop.run_in_executor(None, functools.partial(self._leitor.shutdown, wait=True))
+        self.db.close()
+
+def _criar_metodo_async(nome: str, escrita: bool):
+    async def metodo(self, *args, **kwargs):
+        return await self._executar(escrita, getattr(self.db, nome), *args, **kwargs)
+    metodo.__name__ = nome
+    metodo.__qualname__ = f'AsyncDatabaseManager.{nome}'
+    metodo.__doc__ = f"Versão assíncrona de DatabaseManager.{nome}"
+    return metodo
+
+for _nome in METODOS_ESCRITA:
+    setattr(AsyncDatabaseManager, _nome, _criar_metodo_async(_nome, escrita=True))
+for _nome in METODOS_LEITURA:
+    setattr(AsyncDatabaseManager, _nome, _criar_metodo_async(_nome, escrita=False))
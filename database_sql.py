@@ -4,48 +4,429 @@ Módulo de banco de dados SQL para o sistema de gestão de ferramentas
 Usa SQLite3 como backend de banco de dados
 """
 import sqlite3
+import base64
 import json
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional, Any, Iterable, Iterator, NamedTuple, Union
 import os
 
+from metricas import instrumentar_metodos
+from rastreio_sql import ConexaoRastreada, RastreadorSQL, rastreador as rastreador_padrao
+
+MIGRACOES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migracoes')
+
+def listar_migracoes(diretorio: str = None) -> List[tuple]:
+    """Retorna [(versão, caminho)] dos arquivos NNNN_descricao.sql, em ordem"""
+    diretorio = diretorio or MIGRACOES_DIR
+    migracoes = []
+    for nome in os.listdir(diretorio):
+        prefixo = nome.split('_', 1)[0]
+        if nome.endswith('.sql') and prefixo.isdigit():
+            migracoes.append((int(prefixo), os.path.join(diretorio, nome)))
+    migracoes.sort()
+    return migracoes
+
+def dividir_instrucoes_sql(script: str) -> List[str]:
+    """
+    Divide um script SQL em instruções completas
+
+    Necessário porque executescript faz COMMIT antes de rodar e não pode ser
+    usado dentro da transação das migrações. Corpos de trigger (BEGIN ... END)
+    são mantidos inteiros.
+    """
+    instrucoes = []
+    atual = ''
+    for linha in script.splitlines(keepends=True):
+        atual += linha
+        if sqlite3.complete_statement(atual):
+            if atual.strip():
+                instrucoes.append(atual.strip())
+            atual = ''
+    # Sobra sem ';' final: só conta se não for apenas comentário
+    resto = '\n'.join(l for l in atual.splitlines() if not l.strip().startswith('--'))
+    if resto.strip():
+        instrucoes.append(atual.strip())
+    return instrucoes
+
+# Registros compactos (tuplas nomeadas) para leituras grandes
+class Solicitante(NamedTuple):
+    id: int
+    nome: str
+    email: Optional[str]
+    telefone: Optional[str]
+    departamento: Optional[str]
+    criado_em: Optional[str]
+    atualizado_em: Optional[str]
+
+class Ferramenta(NamedTuple):
+    id: int
+    nome: str
+    quantidade_total: int
+    quantidade_disponivel: int
+    status: Optional[str]
+    criado_em: Optional[str]
+    atualizado_em: Optional[str]
+
+class Movimentacao(NamedTuple):
+    id: int
+    tipo: str
+    solicitante_id: int
+    ferramenta_id: int
+    quantidade: Optional[int]
+    data_saida: Optional[str]
+    data_retorno: Optional[str]
+    hora_devolucao: Optional[str]
+    tem_retorno: Optional[str]
+    observacoes: Optional[str]
+    status: Optional[str]
+    email_notificacao: Optional[str]
+    criado_em: Optional[str]
+    atualizado_em: Optional[str]
+    patrimonio: Optional[str]
+    concluido_em: Optional[str]
+    solicitante_nome: str
+    ferramenta_nome: str
+
+def serializar_registros(registros: Iterable[NamedTuple], tipo: type, **extras) -> str:
+    """
+    Serializa registros direto para JSON em formato colunar
+
+    As tuplas vão direto para o encoder como listas, sem criar um dict por
+    linha: {"colunas": [...], "data": [[...], ...], **extras}.
+    """
+    if not isinstance(registros, (list, tuple)):
+        registros = list(registros)
+    corpo = dict(extras)
+    corpo['colunas'] = tipo._fields
+    corpo['data'] = registros
+    return json.dumps(corpo, ensure_ascii=False, separators=(',', ':'))
+
+def _colunas_registro(tipo: type, prefixo: str = '') -> str:
+    """Lista de colunas na ordem dos campos do registro"""
+    return ', '.join(f'{prefixo}{campo}' for campo in tipo._fields)
+
+_COLUNAS_MOVIMENTACAO = ', '.join(
+    [f'm.{campo}' for campo in Movimentacao._fields[:-2]]
+    + ['s.nome as solicitante_nome', 'f.nome as ferramenta_nome'])
+
+# Colunas copiadas para movimentacoes_arquivo (e lidas de volta na união com o histórico)
+_COLUNAS_ARQUIVO = ', '.join(Movimentacao._fields[:-2])
+
+# Colunas da tabela quente que o arquivo não guarda: na união, o lado do arquivo as projeta como NULL.
+# O NULL leva o tipo da coluna; com afinidades iguais nos dois lados o SQLite achata a união
+# e continua usando os índices de cada tabela.
+_COLUNAS_SO_QUENTES = {'vencimento': 'TEXT', 'atraso_notificado': 'INTEGER'}
+_UNIAO_QUENTE = ', '.join([_COLUNAS_ARQUIVO, *_COLUNAS_SO_QUENTES])
+_UNIAO_ARQUIVO = ', '.join([_COLUNAS_ARQUIVO, *(f'CAST(NULL AS {tipo}) AS {coluna}'
+                                                for coluna, tipo in _COLUNAS_SO_QUENTES.items())])
+
+class ConnectionPool:
+    """
+    Pool de conexões SQLite com uma conexão por thread
+
+    Cada thread recebe sua própria conexão (aberta em modo WAL), de forma que
+    leituras rodam em paralelo com escritas. O número de conexões é limitado
+    por max_conexoes; conexões presas a threads que já terminaram são
+    recuperadas automaticamente e toda conexão ociosa passa por uma
+    verificação de saúde antes de ser reutilizada. Com um `rastreador`, as
+    conexões medem cada instrução executada (ver rastreio_sql).
+    """
+
+    def __init__(self, db_path: str, max_conexoes: int = 8, timeout: float = 30.0,
+                 busy_timeout_ms: int = 5000, rastreador: Optional[RastreadorSQL] = None):
+        self.db_path = db_path
+        self.max_conexoes = max_conexoes
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.rastreador = rastreador
+        self._cond = threading.Condition()
+        self._livres: List[sqlite3.Connection] = []
+        self._em_uso: Dict[int, tuple] = {}  # ident da thread -> (thread, conexão)
+        self._total = 0
+        self._fechado = False
+
+    def _abrir(self) -> sqlite3.Connection:
+        """Abre uma nova conexão configurada para o pool"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               timeout=self.busy_timeout_ms / 1000,
+                               factory=ConexaoRastreada if self.rastreador else sqlite3.Connection)
+        conn.row_factory = sqlite3.Row  # Permite acesso por nome de coluna
+        conn.execute("PRAGMA foreign_keys = ON")  # Habilita chaves estrangeiras
+        conn.execute("PRAGMA journal_mode = WAL")  # Leitores não bloqueiam escritores
+        conn.execute("PRAGMA synchronous = NORMAL")  # Seguro em WAL e evita fsync por commit
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if self.rastreador:
+            # Depois dos PRAGMAs: a configuração da conexão não entra no resumo
+            conn.rastreador = self.rastreador
+        return conn
+
+    @staticmethod
+    def _saudavel(conn: sqlite3.Connection) -> bool:
+        """Verifica se a conexão ainda responde"""
+        try:
+            # Fora do rastreamento: não é uma instrução da aplicação
+            sqlite3.Connection.execute(conn, "SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _recuperar_orfas(self):
+        """Devolve ao pool conexões de threads que terminaram sem liberá-las"""
+        for ident, (thread, conn) in list(self._em_uso.items()):
+            if not thread.is_alive():
+                del self._em_uso[ident]
+                if conn.in_transaction:
+                    try:
+                        conn.rollback()
+                    except sqlite3.Error:
+                        pass
+                self._livres.append(conn)
+
+    def obter(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual, obtendo uma do pool se necessário"""
+        ident = threading.get_ident()
+        with self._cond:
+            if self._fechado:
+                raise sqlite3.ProgrammingError("Pool de conexões fechado")
+
+            atual = self._em_uso.get(ident)
+            if atual is not None:
+                return atual[1]
+
+            limite = time.monotonic() + self.timeout
+            while True:
+                if not self._livres and self._total >= self.max_conexoes:
+                    self._recuperar_orfas()
+
+                if self._livres:
+                    conn = self._livres.pop()
+                    if not self._saudavel(conn):
+                        try:
+                            conn.close()
+                        except sqlite3.Error:
+                            pass
+                        self._total -= 1
+                        continue
+                    break
+
+                if self._total < self.max_conexoes:
+                    conn = self._abrir()
+                    self._total += 1
+                    break
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Tempo esgotado aguardando conexão do pool ({self.max_conexoes} em uso)")
+                self._cond.wait(restante)
+
+            self._em_uso[ident] = (threading.current_thread(), conn)
+            return conn
+
+    def liberar(self):
+        """Devolve ao pool a conexão da thread atual"""
+        with self._cond:
+            atual = self._em_uso.pop(threading.get_ident(), None)
+            if atual is None:
+                return
+            conn = atual[1]
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            if self._fechado:
+                conn.close()
+                self._total -= 1
+            else:
+                self._livres.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        """Context manager que obtém e libera a conexão da thread atual"""
+        ja_possui = threading.get_ident() in self._em_uso
+        conn = self.obter()
+        try:
+            yield conn
+        finally:
+            if not ja_possui:
+                self.liberar()
+
+    def fechar_todas(self):
+        """Fecha todas as conexões do pool"""
+        with self._cond:
+            self._fechado = True
+            conexoes = self._livres + [conn for _, conn in self._em_uso.values()]
+            self._livres = []
+            self._em_uso = {}
+            self._total = 0
+            self._cond.notify_all()
+        for conn in conexoes:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def estatisticas(self) -> Dict:
+        """Retorna o estado atual do pool"""
+        with self._cond:
+            return {
+                'max_conexoes': self.max_conexoes,
+                'abertas': self._total,
+                'em_uso': len(self._em_uso),
+                'livres': len(self._livres)
+            }
+
 class DatabaseManager:
-    def __init__(self, db_path: str = 'ferramentas.db'):
+    def __init__(self, db_path: str = 'ferramentas.db', max_conexoes: int = 8,
+                 busy_timeout_ms: int = 5000, max_tentativas: int = 5, espera_base: float = 0.02,
+                 rastreador: Optional[RastreadorSQL] = None):
         self.db_path = db_path
-        self.connection = None
+        self.max_conexoes = max_conexoes
+        self.busy_timeout_ms = busy_timeout_ms
+        # Sem rastreador explícito usa o compartilhado (None se DB_RASTREIO=0)
+        self.rastreador = rastreador or rastreador_padrao
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.pool = None
         self.connect()
 
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Conexão da thread atual, obtida do pool"""
+        return self.pool.obter()
+
     def connect(self):
         """Conecta ao banco de dados SQLite"""
         try:
-            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.connection.row_factory = sqlite3.Row  # Permite acesso por nome de coluna
-            self.connection.execute("PRAGMA foreign_keys = ON")  # Habilita chaves estrangeiras
-            print(f"Conectado ao banco de dados: {self.db_path}")
+            self.pool = ConnectionPool(self.db_path, max_conexoes=self.max_conexoes,
+                                       busy_timeout_ms=self.busy_timeout_ms,
+                                       rastreador=self.rastreador)
+            with self.pool.conexao() as conn:
+                modo = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            print(f"Conectado ao banco de dados: {self.db_path} (journal_mode={modo})")
         except sqlite3.Error as e:
             print(f"Erro ao conectar ao banco de dados: {e}")
             raise
 
-    def initialize_database(self):
-        """Inicializa o banco de dados com o schema"""
-        try:
-            with open('schema.sql', 'r', encoding='utf-8') as f:
-                schema = f.read()
+    def liberar_conexao(self):
+        """Devolve ao pool a conexão usada pela thread atual"""
+        if self.pool:
+            self.pool.liberar()
 
-            self.connection.executescript(schema)
-            self.connection.commit()
-            print("Banco de dados inicializado com sucesso")
+    def _transacao_imediata(self, operacao):
+        """
+        Executa operacao(cursor) em uma transação BEGIN IMMEDIATE
+
+        O lock de escrita é obtido logo no BEGIN (aguardando até busy_timeout),
+        então a transação nunca falha no meio por disputa com outro escritor.
+        Se o lock não vier a tempo ("database is locked"), a operação inteira
+        é repetida até max_tentativas vezes, com espera exponencial aleatória.
+        Qualquer outra exceção desfaz a transação e é propagada.
+        """
+        conn = self.connection
+        for tentativa in range(1, self.max_tentativas + 1):
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                resultado = operacao(cursor)
+                conn.commit()
+                return resultado
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                mensagem = str(e).lower()
+                if tentativa == self.max_tentativas or ('locked' not in mensagem and 'busy' not in mensagem):
+                    raise
+                time.sleep(random.uniform(0, self.espera_base * 2 ** (tentativa - 1)))
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+
+    @staticmethod
+    def _inserir_lote(cursor, tabela: str, colunas: List[str], linhas: List[tuple]) -> List[int]:
+        """
+        Insere várias linhas com executemany e retorna os ids gerados
+
+        Deve ser chamado dentro de uma transação IMMEDIATE: com o lock de escrita
+        mantido, as tabelas AUTOINCREMENT recebem ids consecutivos, lidos de
+        sqlite_sequence após a inserção.
+        """
+        if not linhas:
+            return []
+        placeholders = ', '.join('?' for _ in colunas)
+        cursor.executemany(
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({placeholders})", linhas)
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabela,))
+        ultimo_id = cursor.fetchone()['seq']
+        return list(range(ultimo_id - len(linhas) + 1, ultimo_id + 1))
+
+    def initialize_database(self) -> List[int]:
+        """Inicializa o banco de dados aplicando as migrações pendentes"""
+        try:
+            aplicadas = self.aplicar_migracoes()
+            if aplicadas:
+                print(f"Banco de dados inicializado com sucesso (migrações aplicadas: {aplicadas})")
+            else:
+                print("Banco de dados inicializado com sucesso (schema já atualizado)")
+            return aplicadas
         except FileNotFoundError:
-            print("Arquivo schema.sql não encontrado")
+            print(f"Diretório de migrações não encontrado: {MIGRACOES_DIR}")
             raise
         except sqlite3.Error as e:
             print(f"Erro ao inicializar banco de dados: {e}")
             raise
 
+    def versao_schema(self) -> int:
+        """Retorna a versão do schema gravada em PRAGMA user_version"""
+        return self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def aplicar_migracoes(self, diretorio: str = None) -> List[int]:
+        """
+        Aplica, em ordem, as migrações com versão maior que PRAGMA user_version
+
+        Todas as migrações pendentes rodam em uma única transação IMMEDIATE
+        e user_version é atualizado junto, então uma falha não deixa o schema
+        pela metade. Sem migrações pendentes, o custo é uma leitura de PRAGMA.
+        Retorna as versões aplicadas.
+        """
+        migracoes = listar_migracoes(diretorio)
+        if not migracoes or self.versao_schema() >= migracoes[-1][0]:
+            return []
+
+        conn = self.connection
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            # Outro processo pode ter migrado enquanto aguardávamos o lock
+            versao_atual = cursor.execute("PRAGMA user_version").fetchone()[0]
+            aplicadas = []
+            for versao, caminho in migracoes:
+                if versao <= versao_atual:
+                    continue
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    for instrucao in dividir_instrucoes_sql(f.read()):
+                        cursor.execute(instrucao)
+                cursor.execute(f"PRAGMA user_version = {versao}")
+                aplicadas.append(versao)
+            conn.commit()
+            return aplicadas
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Erro ao aplicar migrações: {e}")
+            raise
+
     def close(self):
         """Fecha a conexão com o banco de dados"""
-        if self.connection:
-            self.connection.close()
+        if self.pool:
+            self.pool.fechar_todas()
             print("Conexão com banco de dados fechada")
 
     # Métodos para Solicitantes
@@ -63,10 +444,25 @@ class DatabaseManager:
             print(f"Erro ao adicionar solicitante: {e}")
             raise
 
-    def obter_solicitantes(self) -> List[Dict]:
-        """Retorna todos os solicitantes"""
+    def adicionar_solicitantes_lote(self, registros: Iterable[Dict]) -> List[int]:
+        """Adiciona vários solicitantes em uma única transação"""
+        linhas = [(r['nome'], r.get('email'), r.get('telefone'), r.get('departamento'))
+                  for r in registros]
+        try:
+            return self._transacao_imediata(lambda cursor: self._inserir_lote(
+                cursor, 'solicitantes', ['nome', 'email', 'telefone', 'departamento'], linhas))
+        except sqlite3.Error as e:
+            print(f"Erro ao adicionar solicitantes em lote: {e}")
+            raise
+
+    def obter_solicitantes(self, como_registros: bool = False) -> Union[List[Dict], List[Solicitante]]:
+        """Retorna todos os solicitantes (como tuplas Solicitante se como_registros=True)"""
         try:
             cursor = self.connection.cursor()
+            if como_registros:
+                cursor.row_factory = None
+                cursor.execute(f"SELECT {_colunas_registro(Solicitante)} FROM solicitantes ORDER BY nome")
+                return list(map(Solicitante._make, cursor.fetchall()))
             cursor.execute("SELECT * FROM solicitantes ORDER BY nome")
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
@@ -121,10 +517,27 @@ class DatabaseManager:
             print(f"Erro ao adicionar ferramenta: {e}")
             raise
 
-    def obter_ferramentas(self) -> List[Dict]:
-        """Retorna todas as ferramentas"""
+    def adicionar_ferramentas_lote(self, registros: Iterable[Dict]) -> List[int]:
+        """Adiciona várias ferramentas em uma única transação"""
+        linhas = []
+        for r in registros:
+            quantidade_total = r.get('quantidade_total', 1)
+            linhas.append((r['nome'], quantidade_total, quantidade_total))
+        try:
+            return self._transacao_imediata(lambda cursor: self._inserir_lote(
+                cursor, 'ferramentas', ['nome', 'quantidade_total', 'quantidade_disponivel'], linhas))
+        except sqlite3.Error as e:
+            print(f"Erro ao adicionar ferramentas em lote: {e}")
+            raise
+
+    def obter_ferramentas(self, como_registros: bool = False) -> Union[List[Dict], List[Ferramenta]]:
+        """Retorna todas as ferramentas (como tuplas Ferramenta se como_registros=True)"""
         try:
             cursor = self.connection.cursor()
+            if como_registros:
+                cursor.row_factory = None
+                cursor.execute(f"SELECT {_colunas_registro(Ferramenta)} FROM ferramentas ORDER BY nome")
+                return list(map(Ferramenta._make, cursor.fetchall()))
             cursor.execute("SELECT * FROM ferramentas ORDER BY nome")
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
@@ -164,11 +577,9 @@ class DatabaseManager:
     def adicionar_movimentacao(self, tipo: str, solicitante_id: int, ferramenta_id: int,
                              data_saida: str = None, data_retorno: str = None, hora_devolucao: str = None,
                              tem_retorno: str = 'Sim', observacoes: str = None,
-                             email_notificacao: str = None) -> int:
-        """Adiciona uma nova movimentação"""
-        try:
-            cursor = self.connection.cursor()
-
+                             email_notificacao: str = None, patrimonio: str = None) -> int:
+        """Adiciona uma nova movimentação (em saídas, reserva o patrimônio informado)"""
+        def operacao(cursor):
             # Se for saída, decrementa quantidade disponível
             if tipo.lower() == 'saida':
                 cursor.execute("""
@@ -183,35 +594,163 @@ class DatabaseManager:
             cursor.execute("""
                 INSERT INTO movimentacoes (tipo, solicitante_id, ferramenta_id,
                                         data_saida, data_retorno, hora_devolucao, tem_retorno,
-                                        observacoes, email_notificacao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                        observacoes, email_notificacao, patrimonio)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (tipo, solicitante_id, ferramenta_id, data_saida, data_retorno,
-                  hora_devolucao, tem_retorno, observacoes, email_notificacao))
+                  hora_devolucao, tem_retorno, observacoes, email_notificacao, patrimonio))
+            movimentacao_id = cursor.lastrowid
 
-            self.connection.commit()
-            return cursor.lastrowid
+            # Marca a unidade como emprestada na mesma transação
+            if patrimonio and tipo.lower() == 'saida':
+                self._reservar_patrimonios(cursor, [(solicitante_id, movimentacao_id, patrimonio, ferramenta_id)])
+
+            return movimentacao_id
+
+        try:
+            return self._transacao_imediata(operacao)
         except sqlite3.Error as e:
             print(f"Erro ao adicionar movimentação: {e}")
             raise
 
-    def obter_movimentacoes(self, status: str = None) -> List[Dict]:
-        """Retorna todas as movimentações"""
+    def adicionar_movimentacoes_lote(self, registros: Iterable[Dict]) -> List[int]:
+        """
+        Adiciona várias movimentações em uma única transação
+
+        As saídas são agrupadas por ferramenta e o estoque é verificado para o
+        lote inteiro: se alguma ferramenta não tiver unidades suficientes,
+        nada é gravado.
+        """
+        colunas = ['tipo', 'solicitante_id', 'ferramenta_id', 'data_saida', 'data_retorno',
+                   'hora_devolucao', 'tem_retorno', 'observacoes', 'email_notificacao', 'patrimonio']
+        linhas = []
+        saidas = Counter()
+        reservas = []  # (posição no lote, solicitante_id, patrimônio, ferramenta_id)
+        for r in registros:
+            if r['tipo'].lower() == 'saida':
+                saidas[r['ferramenta_id']] += 1
+                if r.get('patrimonio'):
+                    reservas.append((len(linhas), r['solicitante_id'], r['patrimonio'], r['ferramenta_id']))
+            linhas.append((r['tipo'], r['solicitante_id'], r['ferramenta_id'],
+                           r.get('data_saida'), r.get('data_retorno'), r.get('hora_devolucao'),
+                           r.get('tem_retorno', 'Sim'), r.get('observacoes'),
+                           r.get('email_notificacao'), r.get('patrimonio')))
+
+        def operacao(cursor):
+            # Decrementa o estoque de cada ferramenta de uma vez para o lote todo
+            for ferramenta_id, quantidade in saidas.items():
+                cursor.execute("""
+                    UPDATE ferramentas
+                    SET quantidade_disponivel = quantidade_disponivel - ?
+                    WHERE id = ? AND quantidade_disponivel >= ?
+                """, (quantidade, ferramenta_id, quantidade))
+
+                if cursor.rowcount == 0:
+                    raise ValueError(
+                        f"Ferramenta {ferramenta_id} sem {quantidade} unidade(s) disponível(is) para empréstimo")
+
+            ids = self._inserir_lote(cursor, 'movimentacoes', colunas, linhas)
+            if reservas:
+                self._reservar_patrimonios(cursor, [(solicitante_id, ids[posicao], patrimonio, ferramenta_id)
+                                                    for posicao, solicitante_id, patrimonio, ferramenta_id
+                                                    in reservas])
+            return ids
+
+        try:
+            return self._transacao_imediata(operacao)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Erro ao adicionar movimentações em lote: {e}")
+            raise
+
+    @staticmethod
+    def codificar_cursor(criado_em: str, id: int) -> str:
+        """Codifica a posição (criado_em, id) em um cursor opaco"""
+        bruto = json.dumps([criado_em, id], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decodificar_cursor(cursor: str) -> tuple:
+        """Decodifica um cursor gerado por codificar_cursor"""
         try:
-            cursor = self.connection.cursor()
-            query = """
-                SELECT m.*, s.nome as solicitante_nome, f.nome as ferramenta_nome
-                FROM movimentacoes m
-                JOIN solicitantes s ON m.solicitante_id = s.id
-                JOIN ferramentas f ON m.ferramenta_id = f.id
-            """
-            params = []
+            bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            criado_em, id = json.loads(bruto.decode('utf-8'))
+            return str(criado_em), int(id)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError("Cursor de paginação inválido")
+
+    def _consulta_movimentacoes(self, status: str = None, tipo: str = None,
+                                solicitante_id: int = None, ferramenta_id: int = None,
+                                data_inicio: str = None, data_fim: str = None,
+                                apos: tuple = None, limite: int = None,
+                                como_registros: bool = False, incluir_historico: bool = False) -> tuple:
+        """Monta a consulta de movimentações com filtros e paginação por chave"""
+        colunas = _COLUNAS_MOVIMENTACAO if como_registros else \
+            "m.*, s.nome as solicitante_nome, f.nome as ferramenta_nome"
+        # Com histórico, a tabela quente e o arquivo são lidos como uma só, com as mesmas colunas de m.*
+        origem = f"""(
+                SELECT {_UNIAO_QUENTE} FROM movimentacoes
+                UNION ALL
+                SELECT {_UNIAO_ARQUIVO} FROM movimentacoes_arquivo
+            )""" if incluir_historico else "movimentacoes"
+        query = f"""
+            SELECT {colunas}
+            FROM {origem} m
+            JOIN solicitantes s ON m.solicitante_id = s.id
+            JOIN ferramentas f ON m.ferramenta_id = f.id
+        """
+        condicoes = []
+        params = []
+
+        if status:
+            condicoes.append("m.status = ?")
+            params.append(status)
+        if tipo:
+            condicoes.append("m.tipo = ?")
+            params.append(tipo)
+        if solicitante_id is not None:
+            condicoes.append("m.solicitante_id = ?")
+            params.append(solicitante_id)
+        if ferramenta_id is not None:
+            condicoes.append("m.ferramenta_id = ?")
+            params.append(ferramenta_id)
+        if data_inicio:
+            condicoes.append("m.data_saida >= ?")
+            params.append(data_inicio)
+        if data_fim:
+            condicoes.append("m.data_saida <= ?")
+            params.append(data_fim)
+        if apos is not None:
+            # Continua a partir do último registro da página anterior
+            condicoes.append("(m.criado_em, m.id) < (?, ?)")
+            params.extend(apos)
+
+        if condicoes:
+            query += " WHERE " + " AND ".join(condicoes)
+
+        query += " ORDER BY m.criado_em DESC, m.id DESC"
 
-            if status:
-                query += " WHERE m.status = ?"
-                params.append(status)
+        if limite is not None:
+            query += " LIMIT ?"
+            params.append(limite)
 
-            query += " ORDER BY m.criado_em DESC"
+        return query, params
 
+    def obter_movimentacoes(self, status: str = None, como_registros: bool = False,
+                            **filtros) -> Union[List[Dict], List[Movimentacao]]:
+        """
+        Retorna todas as movimentações (aceita os mesmos filtros de obter_movimentacoes_pagina)
+
+        Por padrão só a tabela quente é lida; incluir_historico=True inclui
+        também as movimentações já arquivadas (vale para todas as consultas
+        de movimentações).
+        """
+        try:
+            cursor = self.connection.cursor()
+            query, params = self._consulta_movimentacoes(status=status, como_registros=como_registros,
+                                                         **filtros)
+            if como_registros:
+                cursor.row_factory = None
+                cursor.execute(query, params)
+                return list(map(Movimentacao._make, cursor.fetchall()))
             cursor.execute(query, params)
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
@@ -219,16 +758,204 @@ class DatabaseManager:
             print(f"Erro ao obter movimentações: {e}")
             raise
 
+    def obter_movimentacoes_pagina(self, limite: int = 100, cursor: str = None,
+                                   como_registros: bool = False, **filtros) -> Dict:
+        """
+        Retorna uma página de movimentações, da mais recente para a mais antiga
+
+        A paginação é por chave (criado_em, id): o custo de cada página não
+        depende de quantas páginas vieram antes. next_cursor é None na última
+        página.
+        """
+        apos = self.decodificar_cursor(cursor) if cursor else None
+        try:
+            cur = self.connection.cursor()
+            query, params = self._consulta_movimentacoes(apos=apos, limite=limite + 1,
+                                                         como_registros=como_registros, **filtros)
+            if como_registros:
+                cur.row_factory = None
+            cur.execute(query, params)
+            rows = cur.fetchall()
+
+            mais_paginas = len(rows) > limite
+            rows = rows[:limite]
+
+            if como_registros:
+                dados = list(map(Movimentacao._make, rows))
+                chave = (dados[-1].criado_em, dados[-1].id) if dados else None
+            else:
+                dados = [dict(row) for row in rows]
+                chave = (dados[-1]['criado_em'], dados[-1]['id']) if dados else None
+
+            next_cursor = self.codificar_cursor(*chave) if mais_paginas else None
+            return {'data': dados, 'next_cursor': next_cursor}
+        except sqlite3.Error as e:
+            print(f"Erro ao obter página de movimentações: {e}")
+            raise
+
+    def iterar_movimentacoes(self, tamanho_lote: int = 500, como_registros: bool = False,
+                             **filtros) -> Iterator[Union[Dict, Movimentacao]]:
+        """
+        Percorre as movimentações em lotes sem carregar o histórico inteiro
+
+        Cada lote é uma consulta paginada por chave, então nenhuma transação
+        de leitura fica aberta entre um lote e outro.
+        """
+        apos = None
+        while True:
+            try:
+                cursor = self.connection.cursor()
+                query, params = self._consulta_movimentacoes(apos=apos, limite=tamanho_lote,
+                                                             como_registros=como_registros, **filtros)
+                if como_registros:
+                    cursor.row_factory = None
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+            except sqlite3.Error as e:
+                print(f"Erro ao iterar movimentações: {e}")
+                raise
+
+            if como_registros:
+                lote = list(map(Movimentacao._make, rows))
+                yield from lote
+                if len(lote) < tamanho_lote:
+                    return
+                apos = (lote[-1].criado_em, lote[-1].id)
+            else:
+                for row in rows:
+                    yield dict(row)
+                if len(rows) < tamanho_lote:
+                    return
+                apos = (rows[-1]['criado_em'], rows[-1]['id'])
+
+    # Empréstimos em atraso
+    @staticmethod
+    def _agora_local() -> str:
+        """Data/hora local no formato da coluna vencimento ('AAAA-MM-DD HH:MM')"""
+        return datetime.now().strftime('%Y-%m-%d %H:%M')
+
+    def obter_movimentacoes_atrasadas(self, agora: str = None, limite: int = 500,
+                                      somente_pendentes: bool = False) -> List[Dict]:
+        """
+        Retorna as saídas ativas com vencimento anterior a `agora`, das mais antigas para as mais novas
+
+        Lê apenas os índices parciais de linhas ativas por vencimento. Com
+        somente_pendentes=True traz só os atrasos ainda não notificados.
+        """
+        # Sem estatísticas (ANALYZE) o planejador preferiria idx_movimentacoes_status_criado
+        # e ordenaria todas as linhas ativas; o índice por vencimento é fixado explicitamente
+        if somente_pendentes:
+            indice, pendentes = 'idx_movimentacoes_atraso_pendente', "AND m.atraso_notificado = 0"
+        else:
+            indice, pendentes = 'idx_movimentacoes_vencimento', ""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                SELECT m.*, s.nome as solicitante_nome, f.nome as ferramenta_nome
+                FROM movimentacoes m INDEXED BY {indice}
+                JOIN solicitantes s ON m.solicitante_id = s.id
+                JOIN ferramentas f ON m.ferramenta_id = f.id
+                WHERE m.status = 'ativo' {pendentes} AND m.vencimento < ?
+                  AND lower(m.tipo) = 'saida'
+                ORDER BY m.vencimento
+                LIMIT ?
+            """, (agora or self._agora_local(), limite))
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter movimentações atrasadas: {e}")
+            raise
+
+    def marcar_atrasos_notificados(self, ids: List[int]) -> int:
+        """Marca atrasos como notificados para que o verificador não os repita"""
+        ids = list(ids)
+        if not ids:
+            return 0
+
+        def operacao(cursor):
+            cursor.execute(f"""
+                UPDATE movimentacoes SET atraso_notificado = 1
+                WHERE id IN ({', '.join('?' * len(ids))}) AND status = 'ativo'
+            """, ids)
+            return cursor.rowcount
+
+        try:
+            return self._transacao_imediata(operacao)
+        except sqlite3.Error as e:
+            print(f"Erro ao marcar atrasos notificados: {e}")
+            raise
+
+    def arquivar_movimentacoes(self, idade_dias: int = 365, tamanho_lote: int = 500,
+                               max_lotes: int = None, pausa: float = 0.0) -> int:
+        """
+        Move movimentações concluídas/canceladas antigas para movimentacoes_arquivo
+
+        Arquiva as linhas encerradas (atualizado_em) há mais de `idade_dias`,
+        em lotes de `tamanho_lote`, cada um em sua própria transação curta
+        para não segurar o lock de escrita. Retorna quantas foram arquivadas.
+        """
+        # Limite calculado pelo SQLite, no mesmo relógio (UTC) do CURRENT_TIMESTAMP de atualizado_em
+        idade = f'{-int(idade_dias)} days'
+
+        def operacao(cursor):
+            cursor.execute("""
+                SELECT id FROM movimentacoes
+                WHERE status IN ('concluido', 'cancelado') AND atualizado_em < datetime('now', ?)
+                ORDER BY atualizado_em
+                LIMIT ?
+            """, (idade, tamanho_lote))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+
+            marcadores = ', '.join('?' * len(ids))
+            # Uma movimentação encerrada não segura mais nenhum patrimônio
+            cursor.execute(f"""
+                UPDATE patrimonios
+                SET solicitante_id = NULL, movimentacao_id = NULL, atualizado_em = CURRENT_TIMESTAMP
+                WHERE movimentacao_id IN ({marcadores})
+            """, ids)
+            cursor.execute(f"""
+                INSERT INTO movimentacoes_arquivo ({_COLUNAS_ARQUIVO})
+                SELECT {_COLUNAS_ARQUIVO} FROM movimentacoes WHERE id IN ({marcadores})
+            """, ids)
+            cursor.execute(f"DELETE FROM movimentacoes WHERE id IN ({marcadores})", ids)
+            return len(ids)
+
+        total = 0
+        lotes = 0
+        try:
+            while max_lotes is None or lotes < max_lotes:
+                arquivadas = self._transacao_imediata(operacao)
+                total += arquivadas
+                lotes += 1
+                if arquivadas < tamanho_lote:
+                    break
+                if pausa:
+                    time.sleep(pausa)
+            return total
+        except sqlite3.Error as e:
+            print(f"Erro ao arquivar movimentações: {e}")
+            raise
+
     def atualizar_movimentacao(self, id: int, **kwargs) -> bool:
-        """Atualiza uma movimentação"""
+        """
+        Atualiza uma movimentação
+
+        O status não é gravado diretamente: 'concluido' passa por
+        concluir_movimentacao (devolve a unidade e libera o patrimônio) e
+        qualquer outro valor levanta ValueError.
+        """
+        status = kwargs.get('status')
+        if status is not None and status != 'concluido':
+            raise ValueError(f"Status '{status}' não pode ser definido na atualização")
         try:
             cursor = self.connection.cursor()
             fields = []
             values = []
 
-            allowed_fields = ['tipo', 'solicitante_id', 'ferramenta_id', 'projeto_id',
+            allowed_fields = ['tipo', 'solicitante_id', 'ferramenta_id',
                             'data_saida', 'data_retorno', 'hora_devolucao', 'tem_retorno',
-                            'observacoes', 'status', 'email_notificacao']
+                            'observacoes', 'email_notificacao']
 
             for field in allowed_fields:
                 if field in kwargs:
@@ -236,7 +963,7 @@ class DatabaseManager:
                     values.append(kwargs[field])
 
             if not fields:
-                return False
+                return self.concluir_movimentacao(id) if status else False
 
             fields.append("atualizado_em = CURRENT_TIMESTAMP")
             query = f"UPDATE movimentacoes SET {', '.join(fields)} WHERE id = ?"
@@ -244,24 +971,32 @@ class DatabaseManager:
 
             cursor.execute(query, values)
             self.connection.commit()
-            return cursor.rowcount > 0
+            atualizada = cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"Erro ao atualizar movimentação: {e}")
             raise
+        if atualizada and status:
+            return self.concluir_movimentacao(id)
+        return atualizada
 
     def concluir_movimentacao(self, id: int) -> bool:
         """Conclui uma movimentação (retorno de ferramenta)"""
-        try:
-            cursor = self.connection.cursor()
+        def operacao(cursor):
+            # Só uma movimentação ativa é concluída: repetir a chamada não devolve a unidade duas vezes
+            cursor.execute("""
+                UPDATE movimentacoes
+                SET status = 'concluido', concluido_em = CURRENT_TIMESTAMP, atualizado_em = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'ativo'
+            """, (id,))
 
-            # Busca a movimentação
-            cursor.execute("SELECT * FROM movimentacoes WHERE id = ?", (id,))
-            mov = cursor.fetchone()
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT 1 FROM movimentacoes WHERE id = ?", (id,))
+                return cursor.fetchone() is not None
 
-            if not mov:
-                return False
+            cursor.execute("SELECT tipo, ferramenta_id FROM movimentacoes WHERE id = ?", (id,))
+            mov = cursor.fetchone()
 
-            # Se for retorno, incrementa quantidade disponível
+            # Se for retorno de uma saída, incrementa quantidade disponível
             if mov['tipo'].lower() == 'saida':
                 cursor.execute("""
                     UPDATE ferramentas
@@ -269,57 +1004,528 @@ class DatabaseManager:
                     WHERE id = ?
                 """, (mov['ferramenta_id'],))
 
-            # Atualiza status da movimentação
+            # Libera o patrimônio que estava com o solicitante
             cursor.execute("""
-                UPDATE movimentacoes
-                SET status = 'concluido', atualizado_em = CURRENT_TIMESTAMP
-                WHERE id = ?
+                UPDATE patrimonios
+                SET solicitante_id = NULL, movimentacao_id = NULL, atualizado_em = CURRENT_TIMESTAMP
+                WHERE movimentacao_id = ?
             """, (id,))
 
-            self.connection.commit()
             return True
+
+        try:
+            return self._transacao_imediata(operacao)
         except sqlite3.Error as e:
             print(f"Erro ao concluir movimentação: {e}")
             raise
 
+    # Métodos para Patrimônios
+    @staticmethod
+    def _reservar_patrimonios(cursor, reservas: List[tuple]):
+        """
+        Marca patrimônios como emprestados: reservas = [(solicitante_id, movimentacao_id, codigo, ferramenta_id)]
+
+        Só unidades livres da ferramenta certa são atualizadas; se alguma não
+        estiver, levanta ValueError e o chamador desfaz a transação.
+        """
+        cursor.executemany("""
+            UPDATE patrimonios
+            SET solicitante_id = ?, movimentacao_id = ?, atualizado_em = CURRENT_TIMESTAMP
+            WHERE codigo = ? AND ferramenta_id = ? AND solicitante_id IS NULL
+        """, reservas)
+
+        if cursor.rowcount != len(reservas):
+            codigos = ', '.join(r[2] for r in reservas)
+            raise ValueError(f"Patrimônio não disponível para empréstimo: {codigos}")
+
+    def adicionar_patrimonio(self, codigo: str, ferramenta_id: int) -> str:
+        """Cadastra um patrimônio (unidade identificada) de uma ferramenta"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                INSERT INTO patrimonios (codigo, ferramenta_id)
+                VALUES (?, ?)
+            """, (codigo, ferramenta_id))
+            self.connection.commit()
+            return codigo
+        except sqlite3.Error as e:
+            print(f"Erro ao adicionar patrimônio: {e}")
+            raise
+
+    def obter_patrimonio(self, codigo: str) -> Optional[Dict]:
+        """Retorna um patrimônio pela etiqueta, com quem está com ele"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT p.*, f.nome as ferramenta_nome, s.nome as solicitante_nome
+                FROM patrimonios p
+                JOIN ferramentas f ON p.ferramenta_id = f.id
+                LEFT JOIN solicitantes s ON p.solicitante_id = s.id
+                WHERE p.codigo = ?
+            """, (codigo,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except sqlite3.Error as e:
+            print(f"Erro ao obter patrimônio: {e}")
+            raise
+
+    def obter_patrimonios_solicitante(self, solicitante_id: int) -> List[Dict]:
+        """Retorna os patrimônios que estão com um solicitante"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT p.*, f.nome as ferramenta_nome
+                FROM patrimonios p
+                JOIN ferramentas f ON p.ferramenta_id = f.id
+                WHERE p.solicitante_id = ?
+            """, (solicitante_id,))
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter patrimônios do solicitante: {e}")
+            raise
+
+    def obter_patrimonios_ferramenta(self, ferramenta_id: int, somente_livres: bool = False) -> List[Dict]:
+        """Retorna os patrimônios de uma ferramenta (apenas os livres se somente_livres=True)"""
+        try:
+            cursor = self.connection.cursor()
+            if somente_livres:
+                cursor.execute("""
+                    SELECT * FROM patrimonios
+                    WHERE ferramenta_id = ? AND solicitante_id IS NULL
+                    ORDER BY codigo
+                """, (ferramenta_id,))
+            else:
+                cursor.execute("""
+                    SELECT p.*, s.nome as solicitante_nome
+                    FROM patrimonios p
+                    LEFT JOIN solicitantes s ON p.solicitante_id = s.id
+                    WHERE p.ferramenta_id = ?
+                    ORDER BY p.codigo
+                """, (ferramenta_id,))
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter patrimônios da ferramenta: {e}")
+            raise
+
+    def remover_patrimonio(self, codigo: str) -> bool:
+        """Remove um patrimônio"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM patrimonios WHERE codigo = ?", (codigo,))
+            self.connection.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Erro ao remover patrimônio: {e}")
+            raise
+
+    # Log de alterações (CDC)
+    def obter_alteracoes(self, desde: int = 0, limite: int = 500) -> Dict:
+        """
+        Retorna as alterações com seq maior que `desde`, em ordem crescente
+
+        O consumidor guarda ultimo_seq como checkpoint e o envia na próxima
+        chamada; 'mais' indica que ainda há alterações além deste lote.
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT seq, entidade, entidade_id, operacao, colunas, criado_em
+                FROM alteracoes
+                WHERE seq > ?
+                ORDER BY seq
+                LIMIT ?
+            """, (desde, limite + 1))
+            rows = cursor.fetchall()
+
+            mais = len(rows) > limite
+            alteracoes = []
+            for row in rows[:limite]:
+                alteracao = dict(row)
+                alteracao['colunas'] = json.loads(row['colunas']) if row['colunas'] else None
+                alteracoes.append(alteracao)
+
+            ultimo_seq = alteracoes[-1]['seq'] if alteracoes else desde
+            return {'alteracoes': alteracoes, 'ultimo_seq': ultimo_seq, 'mais': mais}
+        except sqlite3.Error as e:
+            print(f"Erro ao obter alterações: {e}")
+            raise
+
+    def changes_since(self, seq: int = 0, limit: int = 500) -> Dict:
+        """Alias de obter_alteracoes com a assinatura usada pelos consumidores incrementais"""
+        return self.obter_alteracoes(desde=seq, limite=limit)
+
+    def obter_ultimo_seq(self) -> int:
+        """Retorna o seq da alteração mais recente (0 se o log estiver vazio)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes")
+            return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter último seq de alterações: {e}")
+            raise
+
+    def versoes_tabelas(self, tabelas: Iterable[str]) -> tuple:
+        """Retorna a versão atual de cada tabela, na ordem pedida (0 para tabela sem contador)"""
+        tabelas = list(tabelas)
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                SELECT tabela, versao FROM versoes_tabelas
+                WHERE tabela IN ({', '.join('?' * len(tabelas))})
+            """, tabelas)
+            versoes = dict(cursor.fetchall())
+            return tuple(versoes.get(tabela, 0) for tabela in tabelas)
+        except sqlite3.Error as e:
+            print(f"Erro ao obter versões das tabelas: {e}")
+            raise
+
+    # Agregados diários de uso
+    def obter_uso(self, periodo: Union[int, tuple] = 30, agrupamento: str = 'ferramenta') -> List[Dict]:
+        """
+        Retorna o uso no período lendo apenas os agregados diários
+
+        periodo é (data_inicio, data_fim) em 'AAAA-MM-DD' (inclusivo) ou um
+        número de dias até hoje. agrupamento: 'ferramenta', 'solicitante',
+        'dia', 'ferramenta_dia' ou 'solicitante_dia'.
+        """
+        if isinstance(periodo, int):
+            hoje = datetime.now(timezone.utc).date()
+            inicio, fim = (hoje - timedelta(days=periodo - 1)).isoformat(), hoje.isoformat()
+        else:
+            inicio, fim = periodo
+
+        somas = """SUM(u.movimentacoes) AS movimentacoes, SUM(u.saidas) AS saidas,
+                   SUM(u.unidades) AS unidades, SUM(u.devolucoes) AS devolucoes"""
+        if agrupamento == 'ferramenta':
+            query = f"""
+                SELECT u.ferramenta_id, f.nome AS ferramenta_nome, {somas}
+                FROM uso_diario_ferramenta u
+                LEFT JOIN ferramentas f ON f.id = u.ferramenta_id
+                WHERE u.dia BETWEEN ? AND ?
+                GROUP BY u.ferramenta_id
+                ORDER BY saidas DESC, u.ferramenta_id
+            """
+        elif agrupamento == 'solicitante':
+            query = f"""
+                SELECT u.solicitante_id, s.nome AS solicitante_nome, {somas}
+                FROM uso_diario_solicitante u
+                LEFT JOIN solicitantes s ON s.id = u.solicitante_id
+                WHERE u.dia BETWEEN ? AND ?
+                GROUP BY u.solicitante_id
+                ORDER BY saidas DESC, u.solicitante_id
+            """
+        elif agrupamento == 'dia':
+            query = f"""
+                SELECT u.dia, {somas}
+                FROM uso_diario_ferramenta u
+                WHERE u.dia BETWEEN ? AND ?
+                GROUP BY u.dia
+                ORDER BY u.dia
+            """
+        elif agrupamento == 'ferramenta_dia':
+            query = """
+                SELECT u.dia, u.ferramenta_id, f.nome AS ferramenta_nome,
+                       u.movimentacoes, u.saidas, u.unidades, u.devolucoes
+                FROM uso_diario_ferramenta u
+                LEFT JOIN ferramentas f ON f.id = u.ferramenta_id
+                WHERE u.dia BETWEEN ? AND ?
+                ORDER BY u.dia, u.ferramenta_id
+            """
+        elif agrupamento == 'solicitante_dia':
+            query = """
+                SELECT u.dia, u.solicitante_id, s.nome AS solicitante_nome,
+                       u.movimentacoes, u.saidas, u.unidades, u.devolucoes
+                FROM uso_diario_solicitante u
+                LEFT JOIN solicitantes s ON s.id = u.solicitante_id
+                WHERE u.dia BETWEEN ? AND ?
+                ORDER BY u.dia, u.solicitante_id
+            """
+        else:
+            raise ValueError(f"Agrupamento inválido: {agrupamento}")
+
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(query, (inicio, fim))
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter uso: {e}")
+            raise
+
+    def reconstruir_uso(self) -> Dict:
+        """
+        Recalcula os agregados diários a partir de todo o histórico (quente e arquivo)
+
+        Usado para preencher os agregados de movimentações anteriores à
+        migração ou corrigir divergências. Saídas contam no dia de criado_em
+        e devoluções no dia em que a saída foi concluída (concluido_em).
+        """
+        def operacao(cursor):
+            contagens = {}
+            for tabela, chave in (('uso_diario_ferramenta', 'ferramenta_id'),
+                                  ('uso_diario_solicitante', 'solicitante_id')):
+                cursor.execute(f"DELETE FROM {tabela}")
+                antes = cursor.connection.total_changes
+                cursor.execute(f"""
+                    WITH todas AS (
+                        SELECT {chave}, tipo, quantidade, status, criado_em, concluido_em FROM movimentacoes
+                        UNION ALL
+                        SELECT {chave}, tipo, quantidade, status, criado_em, concluido_em FROM movimentacoes_arquivo
+                    ), eventos AS (
+                        SELECT date(criado_em) AS dia, {chave}, 1 AS movimentacoes,
+                               lower(tipo) = 'saida' AS saidas,
+                               CASE WHEN lower(tipo) = 'saida' THEN COALESCE(quantidade, 1) ELSE 0 END AS unidades,
+                               0 AS devolucoes
+                        FROM todas
+                        UNION ALL
+                        SELECT date(concluido_em), {chave}, 0, 0, 0, 1
+                        FROM todas
+                        WHERE status = 'concluido' AND lower(tipo) = 'saida'
+                    )
+                    INSERT INTO {tabela} (dia, {chave}, movimentacoes, saidas, unidades, devolucoes)
+                    SELECT dia, {chave}, SUM(movimentacoes), SUM(saidas), SUM(unidades), SUM(devolucoes)
+                    FROM eventos
+                    GROUP BY dia, {chave}
+                """)
+                # rowcount não é informado para instruções iniciadas por WITH
+                contagens[tabela] = cursor.connection.total_changes - antes
+            return contagens
+
+        try:
+            return self._transacao_imediata(operacao)
+        except sqlite3.Error as e:
+            print(f"Erro ao reconstruir agregados de uso: {e}")
+            raise
+
+    # Fila de e-mails
+    def enfileirar_email(self, destinatario: str, assunto: str, mensagem: str) -> int:
+        """Grava um e-mail na fila de envio e retorna seu id"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                INSERT INTO emails_pendentes (destinatario, assunto, mensagem)
+                VALUES (?, ?, ?)
+            """, (destinatario, assunto, mensagem))
+            self.connection.commit()
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"Erro ao enfileirar e-mail: {e}")
+            raise
+
+    def reservar_emails_pendentes(self, limite: int = 50, reserva_segundos: float = 600) -> List[Dict]:
+        """
+        Reserva um lote de e-mails cuja próxima tentativa já chegou e o retorna
+
+        O lote é marcado 'enviando' até o fim da reserva na mesma instrução
+        que o seleciona: outro processo drenando a fila não recebe as mesmas
+        mensagens. Reservas vencidas (quem reservou morreu antes de concluir)
+        voltam a ser elegíveis.
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                UPDATE emails_pendentes
+                SET status = 'enviando', proxima_tentativa = datetime('now', ?)
+                WHERE id IN (
+                    SELECT id FROM emails_pendentes
+                    WHERE status IN ('pendente', 'enviando') AND proxima_tentativa <= datetime('now')
+                    ORDER BY proxima_tentativa
+                    LIMIT ?
+                )
+                RETURNING id, destinatario, assunto, mensagem, tentativas
+            """, (f'+{int(reserva_segundos)} seconds', limite))
+            lote = [dict(row) for row in cursor.fetchall()]
+            self.connection.commit()
+            lote.sort(key=lambda email: email['id'])
+            return lote
+        except sqlite3.Error as e:
+            print(f"Erro ao reservar e-mails pendentes: {e}")
+            raise
+
+    def adiar_emails(self, ids: List[int], espera_segundos: float, erro: str = None) -> int:
+        """Devolve e-mails reservados à fila para daqui a espera_segundos, sem contar uma tentativa"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                UPDATE emails_pendentes
+                SET status = 'pendente', proxima_tentativa = datetime('now', ?), erro = COALESCE(?, erro)
+                WHERE id IN ({', '.join('?' * len(ids))}) AND status = 'enviando'
+            """, [f'+{int(espera_segundos)} seconds', erro, *ids])
+            self.connection.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Erro ao adiar e-mails: {e}")
+            raise
+
+    def marcar_emails_enviados(self, ids: List[int]) -> int:
+        """Marca e-mails como enviados"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                UPDATE emails_pendentes
+                SET status = 'enviado', enviado_em = CURRENT_TIMESTAMP, erro = NULL
+                WHERE id IN ({', '.join('?' * len(ids))})
+            """, ids)
+            self.connection.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Erro ao marcar e-mails enviados: {e}")
+            raise
+
+    def registrar_falha_email(self, id: int, erro: str, espera_segundos: float,
+                              max_tentativas: int = 6) -> str:
+        """
+        Registra uma tentativa de envio que falhou e reagenda o e-mail
+
+        Depois de max_tentativas o e-mail fica com status 'falhou' e sai da
+        fila. Retorna o novo status.
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                UPDATE emails_pendentes
+                SET tentativas = tentativas + 1,
+                    erro = ?,
+                    proxima_tentativa = datetime('now', ?),
+                    status = CASE WHEN tentativas + 1 >= ? THEN 'falhou' ELSE 'pendente' END
+                WHERE id = ?
+                RETURNING status
+            """, (erro, f'+{int(espera_segundos)} seconds', max_tentativas, id))
+            row = cursor.fetchone()
+            self.connection.commit()
+            return row['status'] if row else None
+        except sqlite3.Error as e:
+            print(f"Erro ao registrar falha de e-mail: {e}")
+            raise
+
     # Métodos utilitários
     def obter_estatisticas(self) -> Dict:
-        """Retorna estatísticas do sistema"""
+        """Retorna estatísticas do sistema (contadores mantidos por triggers)"""
         try:
             cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT total_ferramentas, ferramentas_disponiveis,
+                       movimentacoes_ativas, total_solicitantes
+                FROM estatisticas
+                WHERE id = 1
+            """)
+            row = cursor.fetchone()
+
+            if row is None:
+                return self._contar_estatisticas(cursor)
+
+            return dict(row)
+        except sqlite3.Error as e:
+            print(f"Erro ao obter estatísticas: {e}")
+            raise
+
+    @staticmethod
+    def _contar_estatisticas(cursor) -> Dict:
+        """Recalcula as estatísticas contando as tabelas"""
+        stats = {}
+
+        # Contagem de ferramentas
+        cursor.execute("SELECT COUNT(*) as total FROM ferramentas")
+        stats['total_ferramentas'] = cursor.fetchone()['total']
+
+        # Ferramentas disponíveis
+        cursor.execute("SELECT COUNT(*) as total FROM ferramentas WHERE quantidade_disponivel > 0")
+        stats['ferramentas_disponiveis'] = cursor.fetchone()['total']
 
-            stats = {}
+        # Movimentações ativas
+        cursor.execute("SELECT COUNT(*) as total FROM movimentacoes WHERE status = 'ativo'")
+        stats['movimentacoes_ativas'] = cursor.fetchone()['total']
 
-            # Contagem de ferramentas
-            cursor.execute("SELECT COUNT(*) as total FROM ferramentas")
-            stats['total_ferramentas'] = cursor.fetchone()['total']
+        # Total de solicitantes
+        cursor.execute("SELECT COUNT(*) as total FROM solicitantes")
+        stats['total_solicitantes'] = cursor.fetchone()['total']
 
-            # Ferramentas disponíveis
-            cursor.execute("SELECT COUNT(*) as total FROM ferramentas WHERE quantidade_disponivel > 0")
-            stats['ferramentas_disponiveis'] = cursor.fetchone()['total']
+        return stats
 
-            # Movimentações ativas
-            cursor.execute("SELECT COUNT(*) as total FROM movimentacoes WHERE status = 'ativo'")
-            stats['movimentacoes_ativas'] = cursor.fetchone()['total']
+    def reconciliar_estatisticas(self, corrigir: bool = True) -> Dict:
+        """
+        Recalcula os contadores do zero e compara com a tabela estatisticas
 
-            # Total de solicitantes
-            cursor.execute("SELECT COUNT(*) as total FROM solicitantes")
-            stats['total_solicitantes'] = cursor.fetchone()['total']
+        Retorna {'contadores': ..., 'divergencias': {campo: {'armazenado', 'real'}}}.
+        Com corrigir=True os valores armazenados são substituídos pelos reais.
+        """
+        def operacao(cursor):
+            reais = self._contar_estatisticas(cursor)
 
-            return stats
+            cursor.execute("SELECT * FROM estatisticas WHERE id = 1")
+            row = cursor.fetchone()
+            armazenados = dict(row) if row else {}
+
+            divergencias = {
+                campo: {'armazenado': armazenados.get(campo), 'real': valor}
+                for campo, valor in reais.items()
+                if armazenados.get(campo) != valor
+            }
+
+            if corrigir and divergencias:
+                cursor.execute("""
+                    INSERT OR REPLACE INTO estatisticas (id, total_ferramentas, ferramentas_disponiveis,
+                                                         movimentacoes_ativas, total_solicitantes)
+                    VALUES (1, :total_ferramentas, :ferramentas_disponiveis,
+                            :movimentacoes_ativas, :total_solicitantes)
+                """, reais)
+
+            return {'contadores': reais, 'divergencias': divergencias}
+
+        try:
+            return self._transacao_imediata(operacao)
         except sqlite3.Error as e:
-            print(f"Erro ao obter estatísticas: {e}")
+            print(f"Erro ao reconciliar estatísticas: {e}")
             raise
 
-    def backup_database(self, backup_path: str):
-        """Cria backup do banco de dados"""
+    def backup_database(self, backup_path: str, paginas_por_passo: int = -1,
+                        progresso=None, pausa: float = 0.0, max_reinicios: int = 3):
+        """
+        Cria backup do banco de dados usando uma conexão própria
+
+        Com paginas_por_passo > 0 a cópia é feita em passos, chamando
+        progresso(copiadas, total) a cada passo e dormindo `pausa` segundos
+        entre eles. Se escritas concorrentes reiniciarem a cópia mais de
+        max_reinicios vezes, o restante é copiado em um único passo (em modo
+        WAL isso é só uma transação de leitura e não bloqueia as escritas).
+        """
+        class _MuitosReinicios(Exception):
+            pass
+
+        estado = {'restante': None, 'reinicios': 0}
+
+        def _progresso(status, restante, total):
+            if estado['restante'] is not None and restante > estado['restante']:
+                estado['reinicios'] += 1
+                if estado['reinicios'] > max_reinicios:
+                    raise _MuitosReinicios()
+            estado['restante'] = restante
+            if progresso:
+                progresso(total - restante, total)
+
+        origem = None
+        destino = None
         try:
-            with sqlite3.connect(backup_path) as backup_conn:
-                self.connection.backup(backup_conn)
+            origem = sqlite3.connect(self.db_path)
+            destino = sqlite3.connect(backup_path)
+            try:
+                origem.backup(destino, pages=paginas_por_passo, progress=_progresso, sleep=pausa)
+            except _MuitosReinicios:
+                origem.backup(destino, pages=-1, progress=_progresso)
             print(f"Backup criado em: {backup_path}")
         except sqlite3.Error as e:
             print(f"Erro ao criar backup: {e}")
             raise
+        finally:
+            if destino is not None:
+                destino.close()
+            if origem is not None:
+                origem.close()
 
     # Métodos para visualização do banco de dados
     def obter_tabelas(self) -> List[Dict]:
@@ -379,6 +1585,9 @@ class DatabaseManager:
             print(f"Erro ao contar registros da tabela {table_name}: {e}")
             raise
 
+# Tempo de cada método público em /metrics (ferramentas_db_duracao_segundos)
+instrumentar_metodos(DatabaseManager, ignorar=('connect', 'close', 'liberar_conexao'))
+
 # Instância global do gerenciador de banco de dados
 db_manager = None
 
@@ -386,7 +1595,8 @@ def get_db_manager() -> DatabaseManager:
     """Retorna a instância global do gerenciador de banco de dados"""
     global db_manager
     if db_manager is None:
-        db_manager = DatabaseManager()
+        db_manager = DatabaseManager(max_conexoes=int(os.environ.get('DB_MAX_CONEXOES', 8)),
+                                     busy_timeout_ms=int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)))
     return db_manager
 
 def init_database():
@@ -396,6 +1606,40 @@ def init_database():
     return manager
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Banco de dados SQL do sistema de gestão de ferramentas')
+    parser.add_argument('--reconciliar-estatisticas', action='store_true',
+                        help='recalcula os contadores de estatísticas e informa divergências')
+    parser.add_argument('--somente-verificar', action='store_true',
+                        help='com --reconciliar-estatisticas, apenas informa sem corrigir')
+    parser.add_argument('--reconstruir-uso', action='store_true',
+                        help='recalcula os agregados diários de uso a partir de todo o histórico')
+    parser.add_argument('--arquivar-dias', type=int, metavar='DIAS',
+                        help='arquiva movimentações concluídas/canceladas encerradas há mais de DIAS dias')
+    parser.add_argument('--tamanho-lote', type=int, default=500,
+                        help='linhas por transação no arquivamento (padrão: 500)')
+    args = parser.parse_args()
+
     # Inicialização do banco de dados quando executado diretamente
-    init_database()
+    manager = init_database()
     print("Banco de dados SQL inicializado com sucesso!")
+
+    if args.reconciliar_estatisticas:
+        resultado = manager.reconciliar_estatisticas(corrigir=not args.somente_verificar)
+        if resultado['divergencias']:
+            for campo, valores in resultado['divergencias'].items():
+                print(f"  Divergência em {campo}: armazenado={valores['armazenado']} real={valores['real']}")
+            print("Contadores corrigidos" if not args.somente_verificar else "Contadores não foram alterados")
+        else:
+            print("Contadores de estatísticas consistentes")
+
+    if args.reconstruir_uso:
+        for tabela, linhas in manager.reconstruir_uso().items():
+            print(f"  {tabela}: {linhas} linha(s)")
+        print("Agregados de uso reconstruídos")
+
+    if args.arquivar_dias is not None:
+        arquivadas = manager.arquivar_movimentacoes(idade_dias=args.arquivar_dias,
+                                                    tamanho_lote=args.tamanho_lote)
+        print(f"{arquivadas} movimentação(ões) arquivada(s)")
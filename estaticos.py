@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Arquivos estáticos versionados para o modo de produção dos servidores
+Na inicialização cada .js/.css recebe um nome com o hash do conteúdo
+(script.<hash>.js), as páginas passam a apontar para esses nomes e tudo é
+servido da memória: os versionados com cache imutável de um ano, as
+páginas com revalidação por ETag. No modo dev nada disso é usado e cada
+servidor mantém o comportamento sem cache.
+"""
+import hashlib
+import http.server
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from compressao import comprimir, codificacoes_disponiveis, escolher_codificacao, TAMANHO_MINIMO
+
+MODO_DEV = 'dev'
+MODO_PRODUCAO = 'producao'
+
+EXTENSOES_VERSIONADAS = ('.js', '.css')
+PAGINAS = ('index.html', 'painel.html', 'db_viewer.html')
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_PAGINA = 'no-cache'
+
+# src="script.js" / href='style.css' (só caminhos relativos, sem query string)
+REFERENCIA = re.compile(r'''(\b(?:src|href)\s*=\s*)(["'])([^"'?#:]+)\2''')
+
+def modo_estaticos(modo: Optional[str] = None) -> str:
+    """Modo explícito, ou MODO_ESTATICOS do ambiente; dev quando não definido"""
+    modo = (modo or os.environ.get('MODO_ESTATICOS') or MODO_DEV).lower()
+    if modo not in (MODO_DEV, MODO_PRODUCAO):
+        raise ValueError(f"Modo de estáticos inválido: {modo} (use '{MODO_DEV}' ou '{MODO_PRODUCAO}')")
+    return modo
+
+def nome_versionado(nome: str, corpo: bytes) -> str:
+    """script.js -> script.<10 hex do sha256>.js"""
+    base, extensao = os.path.splitext(nome)
+    return f"{base}.{hashlib.sha256(corpo).hexdigest()[:10]}{extensao}"
+
+class Asset:
+    """Arquivo servido da memória, com as variantes comprimidas prontas"""
+    __slots__ = ('corpo', 'mimetype', 'etag', 'cache_control', 'variantes')
+
+    def __init__(self, corpo: bytes, mimetype: str, cache_control: str):
+        self.corpo = corpo
+        self.mimetype = mimetype
+        self.etag = '"' + hashlib.sha256(corpo).hexdigest()[:20] + '"'
+        self.cache_control = cache_control
+        self.variantes = {}
+        if len(corpo) >= TAMANHO_MINIMO:
+            self.variantes = {codificacao: comprimir(corpo, codificacao, estatico=True)
+                              for codificacao in codificacoes_disponiveis()}
+
+    def representacao(self, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str], str]:
+        """Retorna (corpo, codificação, ETag) conforme o Accept-Encoding do cliente"""
+        codificacao = escolher_codificacao(accept_encoding) if self.variantes else None
+        if codificacao is None:
+            return self.corpo, None, self.etag
+        return self.variantes[codificacao], codificacao, self.etag[:-1] + '-' + codificacao + '"'
+
+class AssetsVersionados:
+    """
+    Conjunto de arquivos estáticos carregado uma vez na inicialização
+
+    Os nomes antigos (script.js) continuam existindo em disco e são servidos
+    normalmente pelo servidor, então páginas abertas antes de um deploy não
+    quebram; só os nomes versionados recebem cache imutável.
+    """
+
+    def __init__(self, diretorio: str, paginas: Tuple[str, ...] = PAGINAS,
+                 extensoes: Tuple[str, ...] = EXTENSOES_VERSIONADAS):
+        self.diretorio = os.path.abspath(diretorio)
+        self.paginas = paginas
+        self.extensoes = extensoes
+        self.versoes = {}
+        self._assets = {}
+
+    def preparar(self) -> 'AssetsVersionados':
+        """Calcula os hashes, reescreve as páginas e carrega tudo na memória"""
+        self.versoes = {}
+        self._assets = {}
+        for nome in sorted(os.listdir(self.diretorio)):
+            if not nome.endswith(self.extensoes):
+                continue
+            with open(os.path.join(self.diretorio, nome), 'rb') as f:
+                corpo = f.read()
+            versionado = nome_versionado(nome, corpo)
+            self.versoes[nome] = versionado
+            self._assets[versionado] = Asset(corpo, self._mimetype(nome), CACHE_IMUTAVEL)
+
+        for pagina in self.paginas:
+            caminho = os.path.join(self.diretorio, pagina)
+            if not os.path.isfile(caminho):
+                continue
+            with open(caminho, 'r', encoding='utf-8') as f:
+                html = self.reescrever(f.read())
+            self._assets[pagina] = Asset(html.encode('utf-8'), 'text/html', CACHE_PAGINA)
+        return self
+
+    def reescrever(self, html: str) -> str:
+        """Troca src/href de arquivos versionados pelos nomes com hash"""
+        def trocar(match):
+            nome = match.group(3)
+            versionado = self.versoes.get(nome.lstrip('./'))
+            if versionado is None:
+                return match.group(0)
+            prefixo = nome[:len(nome) - len(nome.lstrip('./'))]
+            return f"{match.group(1)}{match.group(2)}{prefixo}{versionado}{match.group(2)}"
+        return REFERENCIA.sub(trocar, html)
+
+    def obter(self, caminho: str) -> Optional[Asset]:
+        """Asset do caminho pedido ('/' é index.html), ou None se não for servido da memória"""
+        nome = caminho.split('?', 1)[0].split('#', 1)[0].lstrip('/') or 'index.html'
+        return self._assets.get(nome)
+
+    @staticmethod
+    def _mimetype(nome: str) -> str:
+        return mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+
+    def estatisticas(self) -> Dict:
+        return {
+            'versionados': dict(self.versoes),
+            'bytes_em_memoria': sum(len(a.corpo) + sum(len(v) for v in a.variantes.values())
+                                    for a in self._assets.values())
+        }
+
+def enviar_asset(handler: http.server.BaseHTTPRequestHandler, assets: Optional[AssetsVersionados]) -> bool:
+    """
+    Responde um GET/HEAD de um BaseHTTPRequestHandler com o asset da memória
+
+    Retorna False (sem escrever nada) quando não há assets ou o caminho não
+    é um deles, para o handler seguir com o caminho normal. Os cabeçalhos de
+    cache do asset substituem os do handler: end_headers é chamado direto na
+    classe base para não passar pelos overrides que desabilitam cache.
+    """
+    if assets is None:
+        return False
+    asset = assets.obter(handler.path)
+    if asset is None:
+        return False
+
+    corpo, codificacao, etag = asset.representacao(handler.headers.get('Accept-Encoding'))
+    nao_modificado = etag in [t.strip() for t in handler.headers.get('If-None-Match', '').split(',')]
+    handler.send_response(304 if nao_modificado else 200)
+    handler.send_header('ETag', etag)
+    handler.send_header('Cache-Control', asset.cache_control)
+    if asset.variantes:
+        handler.send_header('Vary', 'Accept-Encoding')
+    if not nao_modificado:
+        handler.send_header('Content-Type', asset.mimetype)
+        if codificacao:
+            handler.send_header('Content-Encoding', codificacao)
+        handler.send_header('Content-Length', str(len(corpo)))
+    http.server.BaseHTTPRequestHandler.end_headers(handler)
+    if not nao_modificado and handler.command != 'HEAD':
+        handler.wfile.write(corpo)
+    return True
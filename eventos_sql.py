@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Feed de alterações por Server-Sent Events (SSE)
+Um único loop asyncio, em uma thread, atende todos os assinantes e lê o log
+de alterações (tabela alteracoes) para distribuir cada evento a todos.
+Nenhum assinante ocupa uma thread: cada um é só um socket e uma fila.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+ENTIDADES = ('solicitantes', 'ferramentas', 'movimentacoes')
+
+CABECALHOS_SSE = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/event-stream; charset=utf-8\r\n'
+    'Cache-Control: no-cache\r\n'
+    'Connection: keep-alive\r\n'
+    'X-Accel-Buffering: no\r\n'
+    'Access-Control-Allow-Origin: *\r\n'
+    '\r\n'
+).encode('ascii')
+
+def formatar_evento(alteracao: Dict) -> bytes:
+    """Evento SSE compacto: id = seq, event = entidade, data = {op, id, colunas}"""
+    dados = {'op': alteracao['operacao'], 'id': alteracao['entidade_id']}
+    if alteracao.get('colunas'):
+        dados['colunas'] = alteracao['colunas']
+    return (f"id: {alteracao['seq']}\nevent: {alteracao['entidade']}\n"
+            f"data: {json.dumps(dados, separators=(',', ':'))}\n\n").encode('utf-8')
+
+class _Assinante:
+    __slots__ = ('fila', 'entidades', 'ultimo_enviado')
+
+    def __init__(self, entidades, ultimo_enviado: int, tamanho_fila: int):
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+        self.entidades = entidades
+        self.ultimo_enviado = ultimo_enviado
+
+class HubEventos:
+    """
+    Servidor SSE com fan-out a partir do log de alterações
+
+    Uma tarefa lê o log a cada `intervalo` segundos (ou logo após avisar())
+    e põe cada evento na fila de cada assinante. Os últimos `tamanho_buffer`
+    eventos ficam em memória para retomar conexões com Last-Event-ID; para
+    ids mais antigos o restante vem do banco. Um assinante cuja fila enche
+    (cliente lento) é desconectado e retoma sozinho pelo Last-Event-ID.
+
+    GET /eventos?entidades=movimentacoes,ferramentas&ultimo_id=N
+    (ultimo_id é alternativa ao cabeçalho Last-Event-ID na primeira conexão)
+    """
+
+    def __init__(self, db, host: str = '0.0.0.0', porta: int = 8001, intervalo: float = 0.25,
+                 tamanho_buffer: int = 2000, tamanho_fila: int = 500, heartbeat: float = 15.0,
+                 max_assinantes: int = 2000):
+        self.db = db
+        self.host = host
+        self.porta = porta
+        self.intervalo = intervalo
+        self.tamanho_fila = tamanho_fila
+        self.heartbeat = heartbeat
+        self.max_assinantes = max_assinantes
+        self._buffer = deque(maxlen=tamanho_buffer)  # (seq, entidade, bytes)
+        self._assinantes = set()
+        self._ultimo_seq = 0
+        self._loop = None
+        self._acordar = None
+        self._parar = None
+        self._pronto = threading.Event()
+        self._erro_inicio = None
+        self._thread = None
+        # Uma thread só para o banco: a conexão do pool fica presa a ela
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='eventos-db')
+        self._status = {
+            'eventos_publicados': 0,
+            'conexoes': 0,
+            'desconectados_lentos': 0,
+            'retomadas_buffer': 0,
+            'retomadas_banco': 0
+        }
+
+    def iniciar(self, timeout: float = 10.0):
+        """Abre a porta e inicia o loop em uma thread; retorna quando estiver aceitando conexões"""
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._rodar, name='hub-eventos', daemon=True)
+        self._thread.start()
+        self._pronto.wait(timeout)
+        if self._erro_inicio is not None:
+            raise self._erro_inicio
+        return self
+
+    def avisar(self):
+        """Lê o log já, sem esperar o intervalo (chamado após uma escrita)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._acordar.set)
+
+    def parar(self, timeout: float = 5.0):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._parar.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def status(self) -> Dict:
+        status = dict(self._status)
+        status.update({'assinantes': len(self._assinantes), 'ultimo_seq': self._ultimo_seq,
+                       'porta': self.porta, 'eventos_em_buffer': len(self._buffer)})
+        return status
+
+    # Banco (na thread do executor)
+    def _no_banco(self, metodo, *args):
+        try:
+            return metodo(*args)
+        finally:
+            self.db.liberar_conexao()
+
+    async def _banco(self, metodo, *args):
+        return await self._loop.run_in_executor(self._executor, self._no_banco, metodo, *args)
+
+    # Loop principal
+    def _rodar(self):
+        try:
+            asyncio.run(self._principal())
+        except Exception as e:
+            self._erro_inicio = e
+            self._pronto.set()
+
+    async def _principal(self):
+        self._loop = asyncio.get_running_loop()
+        self._acordar = asyncio.Event()
+        self._parar = asyncio.Event()
+        self._ultimo_seq = await self._banco(self.db.obter_ultimo_seq)
+
+        servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        self.porta = servidor.sockets[0].getsockname()[1]
+        leitor = asyncio.create_task(self._ler_log())
+        self._pronto.set()
+        try:
+            await self._parar.wait()
+        finally:
+            leitor.cancel()
+            servidor.close()
+            for assinante in list(self._assinantes):
+                self._desconectar(assinante)
+            await servidor.wait_closed()
+
+    async def _ler_log(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._acordar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+            try:
+                mais = True
+                while mais:
+                    lote = await self._banco(self.db.obter_alteracoes, self._ultimo_seq, 500)
+                    for alteracao in lote['alteracoes']:
+                        self._publicar(alteracao['seq'], alteracao['entidade'], formatar_evento(alteracao))
+                    self._ultimo_seq = lote['ultimo_seq']
+                    mais = lote['mais']
+            except Exception as e:
+                print(f"Erro ao ler o log de alterações: {e}")
+
+    def _publicar(self, seq: int, entidade: str, evento: bytes):
+        self._buffer.append((seq, entidade, evento))
+        self._status['eventos_publicados'] += 1
+        for assinante in list(self._assinantes):
+            if assinante.entidades and entidade not in assinante.entidades:
+                continue
+            try:
+                assinante.fila.put_nowait((seq, evento))
+            except asyncio.QueueFull:
+                # Cliente lento: desconecta; ele retoma pelo Last-Event-ID
+                self._desconectar(assinante)
+                self._status['desconectados_lentos'] += 1
+
+    def _desconectar(self, assinante: _Assinante):
+        """Descarta o que estava pendente e sinaliza o fim da transmissão"""
+        self._assinantes.discard(assinante)
+        while not assinante.fila.empty():
+            assinante.fila.get_nowait()
+        assinante.fila.put_nowait(None)
+
+    # Conexões
+    async def _atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        assinante = None
+        try:
+            linha = await asyncio.wait_for(reader.readline(), 10)
+            cabecalhos = {}
+            while True:
+                cabecalho = await asyncio.wait_for(reader.readline(), 10)
+                if cabecalho in (b'\r\n', b'\n', b''):
+                    break
+                nome, _, valor = cabecalho.decode('latin-1').partition(':')
+                cabecalhos[nome.strip().lower()] = valor.strip()
+
+            partes = linha.decode('latin-1').split()
+            if len(partes) < 2 or partes[0] != 'GET' or urlsplit(partes[1]).path.rstrip('/') != '/eventos':
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+            if len(self._assinantes) >= self.max_assinantes:
+                writer.write(b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 5\r\n'
+                             b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+
+            consulta = parse_qs(urlsplit(partes[1]).query)
+            entidades = None
+            if consulta.get('entidades'):
+                entidades = frozenset(e for e in consulta['entidades'][0].split(',') if e in ENTIDADES)
+            ultimo_id = cabecalhos.get('last-event-id') or consulta.get('ultimo_id', [None])[0]
+            ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+            if ultimo_id is not None and ultimo_id > self._ultimo_seq:
+                # Id à frente do log (banco restaurado de um backup): retoma a partir do seq atual,
+                # senão o cliente descartaria todos os eventos novos até alcançar o id antigo
+                ultimo_id = self._ultimo_seq
+
+            # Registra antes de recuperar o histórico para não perder eventos no meio
+            assinante = _Assinante(entidades, self._ultimo_seq if ultimo_id is None else ultimo_id,
+                                   self.tamanho_fila)
+            self._assinantes.add(assinante)
+            self._status['conexoes'] += 1
+            writer.write(CABECALHOS_SSE + f"retry: 2000\n: conectado seq={self._ultimo_seq}\n\n".encode('ascii'))
+            await writer.drain()
+
+            if ultimo_id is not None:
+                await self._retomar(assinante, writer, ultimo_id)
+            await self._transmitir(assinante, writer)
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if assinante is not None:
+                self._assinantes.discard(assinante)
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _retomar(self, assinante: _Assinante, writer, ultimo_id: int):
+        """Envia o que o cliente perdeu desde ultimo_id: do buffer se couber, senão do banco"""
+        ate = self._ultimo_seq
+        if ultimo_id >= ate:
+            return
+        if self._buffer and self._buffer[0][0] <= ultimo_id + 1:
+            self._status['retomadas_buffer'] += 1
+            for seq, entidade, evento in list(self._buffer):
+                if ultimo_id < seq <= ate and (not assinante.entidades or entidade in assinante.entidades):
+                    writer.write(evento)
+            assinante.ultimo_enviado = ate
+            await writer.drain()
+            return
+
+        self._status['retomadas_banco'] += 1
+        desde = ultimo_id
+        while desde < ate:
+            lote = await self._banco(self.db.obter_alteracoes, desde, 500)
+            if not lote['alteracoes']:
+                break
+            for alteracao in lote['alteracoes']:
+                if alteracao['seq'] > ate:
+                    break
+                if not assinante.entidades or alteracao['entidade'] in assinante.entidades:
+                    writer.write(formatar_evento(alteracao))
+            desde = lote['ultimo_seq']
+            await writer.drain()
+        assinante.ultimo_enviado = ate
+
+    async def _transmitir(self, assinante: _Assinante, writer):
+        while True:
+            try:
+                item = await asyncio.wait_for(assinante.fila.get(), self.heartbeat)
+            except asyncio.TimeoutError:
+                writer.write(b': ping\n\n')
+                await writer.drain()
+                continue
+            if item is None:
+                return
+            seq, evento = item
+            if seq <= assinante.ultimo_enviado:
+                continue
+            assinante.ultimo_enviado = seq
+            writer.write(evento)
+            # Junta o que já estiver na fila em um único drain
+            while not assinante.fila.empty():
+                item = assinante.fila.get_nowait()
+                if item is None:
+                    await writer.drain()
+                    return
+                if item[0] > assinante.ultimo_enviado:
+                    assinante.ultimo_enviado = item[0]
+                    writer.write(item[1])
+            await writer.drain()
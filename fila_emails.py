@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Envio de e-mails em segundo plano a partir da fila persistente (emails_pendentes)
+Uma thread mantém uma sessão SMTP autenticada aberta e envia as mensagens em lotes
+"""
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict
+
+from metricas import DURACAO_EMAIL
+
+class FilaEmails:
+    """
+    Drena a fila de e-mails do DatabaseManager em uma thread própria
+
+    A sessão SMTP (conexão, STARTTLS e login) é aberta uma vez e reaproveitada
+    entre lotes; se ficar ociosa por mais de `ocioso_max` segundos é fechada.
+    Cada lote é reservado no banco por `reserva` segundos, então vários
+    processos podem drenar a mesma fila sem enviar a mesma mensagem duas vezes.
+    Uma recusa da mensagem reagenda só ela com espera exponencial
+    (espera_base * 2^tentativas, com variação aleatória) até max_tentativas.
+    Falhas de conexão ou autenticação não são culpa da mensagem: o restante
+    do lote volta à fila sem gastar tentativas, com espera exponencial pelo
+    número de falhas seguidas do servidor (até `espera_max`).
+    """
+
+    def __init__(self, db, config: Dict, tamanho_lote: int = 50, intervalo: float = 5.0,
+                 max_tentativas: int = 6, espera_base: float = 30.0, ocioso_max: float = 60.0,
+                 timeout: float = 30.0, reserva: float = 600.0, espera_max: float = 900.0):
+        self.db = db
+        self.config = config
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.ocioso_max = ocioso_max
+        self.timeout = timeout
+        self.reserva = reserva
+        self.espera_max = espera_max
+        self._falhas_servidor = 0
+        self._smtp = None
+        self._ultimo_uso = 0.0
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._status = {
+            'enviados': 0,
+            'falhas': 0,
+            'conexoes': 0,
+            'ultimo_envio': None,
+            'ultimo_erro': None
+        }
+
+    def status(self) -> Dict:
+        """Retorna os contadores de envio desde o início da thread"""
+        with self._lock:
+            return dict(self._status)
+
+    def iniciar(self):
+        """Inicia a thread de envio"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='fila-emails', daemon=True)
+        self._thread.start()
+
+    def avisar(self):
+        """Acorda a thread de envio (chamado logo após enfileirar um e-mail)"""
+        self._acordar.set()
+
+    def parar(self, timeout: float = None):
+        """Interrompe a thread depois do lote atual e fecha a sessão SMTP"""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        try:
+            while not self._parar.is_set():
+                try:
+                    enviados = self.processar()
+                except Exception as e:
+                    print(f"Erro na fila de e-mails: {e}")
+                    enviados = 0
+                if enviados < self.tamanho_lote:
+                    if self._smtp is not None and time.monotonic() - self._ultimo_uso > self.ocioso_max:
+                        self._fechar_sessao()
+                    self._acordar.wait(self.intervalo)
+                    self._acordar.clear()
+        finally:
+            self._fechar_sessao()
+            self.db.liberar_conexao()
+
+    def _abrir_sessao(self):
+        if self._smtp is not None:
+            return self._smtp
+        smtp = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'], timeout=self.timeout)
+        try:
+            if self.config.get('usar_tls', True):
+                smtp.starttls()
+            if self.config.get('username'):
+                smtp.login(self.config['username'], self.config['password'])
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._falhas_servidor = 0
+        with self._lock:
+            self._status['conexoes'] += 1
+        return smtp
+
+    def _fechar_sessao(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+    def _montar(self, email: Dict) -> str:
+        msg = MIMEMultipart()
+        msg['From'] = self.config['from_email']
+        msg['To'] = email['destinatario']
+        msg['Subject'] = email['assunto']
+        msg.attach(MIMEText(email['mensagem'], 'html'))
+        return msg.as_string()
+
+    def _falha(self, email: Dict, erro: Exception):
+        espera = self.espera_base * 2 ** email['tentativas']
+        espera = random.uniform(espera / 2, espera)
+        status = self.db.registrar_falha_email(email['id'], str(erro), espera, self.max_tentativas)
+        if status == 'falhou':
+            print(f"E-mail {email['id']} para {email['destinatario']} descartado após "
+                  f"{self.max_tentativas} tentativas: {erro}")
+        with self._lock:
+            self._status['falhas'] += 1
+            self._status['ultimo_erro'] = str(erro)
+
+    def _adiar(self, lote, erro: Exception):
+        espera = min(self.espera_base * 2 ** self._falhas_servidor, self.espera_max)
+        espera = random.uniform(espera / 2, espera)
+        self._falhas_servidor += 1
+        self.db.adiar_emails([email['id'] for email in lote], espera, str(erro))
+        with self._lock:
+            self._status['falhas'] += 1
+            self._status['ultimo_erro'] = str(erro)
+
+    def processar(self) -> int:
+        """Envia um lote de e-mails pendentes pela sessão SMTP atual; retorna quantos foram enviados"""
+        lote = self.db.reservar_emails_pendentes(limite=self.tamanho_lote, reserva_segundos=self.reserva)
+        if not lote:
+            return 0
+
+        enviados = []
+        for posicao, email in enumerate(lote):
+            if self._parar.is_set():
+                # Encerrando: devolve o que sobrou do lote sem esperar a reserva vencer
+                self.db.adiar_emails([restante['id'] for restante in lote[posicao:]], 0)
+                break
+            inicio = time.perf_counter()
+            try:
+                smtp = self._abrir_sessao()
+                try:
+                    smtp.sendmail(self.config['from_email'], email['destinatario'], self._montar(email))
+                except smtplib.SMTPServerDisconnected:
+                    # Servidor encerrou a sessão ociosa: reconecta uma vez e reenvia
+                    self._smtp = None
+                    smtp = self._abrir_sessao()
+                    smtp.sendmail(self.config['from_email'], email['destinatario'], self._montar(email))
+                enviados.append(email['id'])
+                DURACAO_EMAIL.observar('enviado', valor=time.perf_counter() - inicio)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                # Recusa desta mensagem: a sessão continua válida para as demais
+                DURACAO_EMAIL.observar('recusado', valor=time.perf_counter() - inicio)
+                self._falha(email, e)
+            except Exception as e:
+                # Falha de conexão/autenticação: o restante do lote volta à fila sem gastar tentativas
+                DURACAO_EMAIL.observar('falha', valor=time.perf_counter() - inicio)
+                self._fechar_sessao()
+                self._adiar(lote[posicao:], e)
+                break
+        self._ultimo_uso = time.monotonic()
+
+        self.db.marcar_emails_enviados(enviados)
+        if enviados:
+            with self._lock:
+                self._status['enviados'] += len(enviados)
+                self._status['ultimo_envio'] = datetime.now().isoformat()
+        return len(enviados)
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Métricas dos servidores no formato texto do Prometheus
+Um registro por processo, compartilhado por server_sql, server_sync*,
+server_proxy* e server.py. Registrar uma observação custa um dicionário,
+um bisect e um lock (alguns microssegundos); a formatação só acontece
+quando /metrics é lido.
+
+Com vários processos (workers do producao_sql), cada um grava o seu
+registro em um diretório compartilhado e o /metrics de qualquer worker
+soma os arquivos de todos (ver MetricasCompartilhadas).
+"""
+import abc
+import contextlib
+import functools
+import glob
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem travas entre processos (o producao_sql só roda em Unix)
+    fcntl = None
+
+from compressao import negociar
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites (segundos) dos histogramas: de 1 ms a 30 s
+LIMITES_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Acima disso, novas combinações de rótulos de uma métrica vão para 'outras'
+MAX_SERIES = 500
+
+def _formatar_valor(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class _Metrica(abc.ABC):
+    tipo = None
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.nomes_rotulos = tuple(rotulos)
+        self._series = {}
+        self._lock = threading.Lock()
+        self._transbordo = tuple('outras' for _ in self.nomes_rotulos)
+
+    def rotulos(self, *valores):
+        """Retorna a série destes rótulos (criada no primeiro uso); guarde-a para o caminho quente"""
+        serie = self._series.get(valores)
+        if serie is not None:
+            return serie
+        with self._lock:
+            if valores not in self._series:
+                if len(self._series) >= MAX_SERIES:
+                    valores = self._transbordo
+                    if valores in self._series:
+                        return self._series[valores]
+                self._series[valores] = self._nova_serie()
+            return self._series[valores]
+
+    @abc.abstractmethod
+    def _nova_serie(self):
+        """Cria a série de uma nova combinação de rótulos"""
+
+    @abc.abstractmethod
+    def _dados(self, serie):
+        """Valores da série em tipos simples (exportados e somados entre processos)"""
+
+    def instantaneo(self) -> dict:
+        """Descrição e valores atuais da métrica, serializáveis em JSON"""
+        with self._lock:
+            series = list(self._series.items())
+        return {'tipo': self.tipo, 'ajuda': self.ajuda, 'rotulos': list(self.nomes_rotulos),
+                'limites': list(getattr(self, 'limites', ())),
+                'series': [[list(valores), self._dados(serie)] for valores, serie in series]}
+
+    def exportar(self) -> List[str]:
+        return _formatar_metrica(self.nome, self.instantaneo())
+
+class _SerieValor:
+    __slots__ = ('valor', '_lock')
+
+    def __init__(self):
+        self.valor = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, quantidade: float = 1.0):
+        with self._lock:
+            self.valor += quantidade
+
+    def dec(self, quantidade: float = 1.0):
+        with self._lock:
+            self.valor -= quantidade
+
+    def definir(self, valor: float):
+        self.valor = valor
+
+class Contador(_Metrica):
+    """Valor que só cresce (requisições, erros)"""
+    tipo = 'counter'
+
+    def _nova_serie(self):
+        return _SerieValor()
+
+    def _dados(self, serie):
+        return serie.valor
+
+    def inc(self, *valores, quantidade: float = 1.0):
+        self.rotulos(*valores).inc(quantidade)
+
+class Medidor(Contador):
+    """Valor que sobe e desce (requisições em andamento)"""
+    tipo = 'gauge'
+
+class _SerieHistograma:
+    __slots__ = ('limites', 'contagens', 'soma', '_lock')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float):
+        posicao = bisect_left(self.limites, valor)
+        with self._lock:
+            self.contagens[posicao] += 1
+            self.soma += valor
+
+    def cronometrar(self):
+        return _Cronometro(self)
+
+class _Cronometro:
+    __slots__ = ('serie', 'inicio')
+
+    def __init__(self, serie):
+        self.serie = serie
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.serie.observar(time.perf_counter() - self.inicio)
+        return False
+
+class Histograma(_Metrica):
+    """Distribuição de durações em faixas (le) cumulativas, com soma e contagem"""
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                 limites: Iterable[float] = LIMITES_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+
+    def _nova_serie(self):
+        return _SerieHistograma(self.limites)
+
+    def observar(self, *valores, valor: float):
+        self.rotulos(*valores).observar(valor)
+
+    def _dados(self, serie):
+        with serie._lock:
+            return [list(serie.contagens), serie.soma]
+
+def _rotulos_texto(nomes, valores, extra: str = '') -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+def _formatar_metrica(nome: str, metrica: dict) -> List[str]:
+    """Linhas do formato texto para o instantâneo de uma métrica"""
+    linhas = [f"# HELP {nome} {metrica['ajuda']}", f"# TYPE {nome} {metrica['tipo']}"]
+    nomes = metrica['rotulos']
+    for valores, dados in sorted(metrica['series']):
+        if metrica['tipo'] != 'histogram':
+            linhas.append(f'{nome}{_rotulos_texto(nomes, valores)} {_formatar_valor(dados)}')
+            continue
+        contagens, soma = dados
+        acumulado = 0
+        for limite, contagem in zip(list(metrica['limites']) + [float('inf')], contagens):
+            acumulado += contagem
+            le = f'le="{_formatar_valor(limite)}"'
+            linhas.append(f'{nome}_bucket{_rotulos_texto(nomes, valores, le)} {acumulado}')
+        rotulos = _rotulos_texto(nomes, valores)
+        linhas.append(f'{nome}_sum{rotulos} {_formatar_valor(soma)}')
+        linhas.append(f'{nome}_count{rotulos} {acumulado}')
+    return linhas
+
+def _formatar(instantaneo: dict) -> bytes:
+    linhas = []
+    for nome, metrica in instantaneo.items():
+        linhas.extend(_formatar_metrica(nome, metrica))
+    return ('\n'.join(linhas) + '\n').encode('utf-8')
+
+def _somar(instantaneos: List[dict]) -> dict:
+    """Soma os instantâneos de vários processos série a série (contagens das faixas inclusive)"""
+    total = {}
+    for instantaneo in instantaneos:
+        for nome, metrica in instantaneo.items():
+            destino = total.setdefault(nome, dict(metrica, series={}))
+            series = destino['series']
+            for valores, dados in metrica['series']:
+                chave = tuple(valores)
+                atual = series.get(chave)
+                if atual is None:
+                    series[chave] = dados if metrica['tipo'] != 'histogram' else [list(dados[0]), dados[1]]
+                elif metrica['tipo'] != 'histogram':
+                    series[chave] = atual + dados
+                else:
+                    atual[0] = [a + b for a, b in zip(atual[0], dados[0])]
+                    atual[1] += dados[1]
+    for metrica in total.values():
+        metrica['series'] = [[list(chave), dados] for chave, dados in metrica['series'].items()]
+    return total
+
+class Registro:
+    """Conjunto de métricas de um processo; exportar() gera o texto de /metrics"""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, classe, nome, *args, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nome)
+            if metrica is None:
+                metrica = self._metricas[nome] = classe(nome, *args, **kwargs)
+            elif not isinstance(metrica, classe):
+                raise ValueError(f"Métrica {nome} já registrada como {metrica.tipo}")
+            return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> Contador:
+        return self._registrar(Contador, nome, ajuda, rotulos)
+
+    def medidor(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> Medidor:
+        return self._registrar(Medidor, nome, ajuda, rotulos)
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                   limites: Iterable[float] = LIMITES_PADRAO) -> Histograma:
+        return self._registrar(Histograma, nome, ajuda, rotulos, limites)
+
+    def instantaneo(self) -> dict:
+        """Todas as métricas do processo em tipos simples, por nome"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return {metrica.nome: metrica.instantaneo() for metrica in metricas}
+
+    def exportar(self) -> bytes:
+        return _formatar(self.instantaneo())
+
+class MetricasCompartilhadas:
+    """
+    Junta os registros de vários processos que atendem a mesma porta
+
+    Cada processo grava o instantâneo do seu registro em `diretorio/<pid>.json`
+    a cada `intervalo` segundos; exportar() soma o registro vivo do processo
+    atual com os arquivos dos demais. Os valores dos outros processos podem
+    estar até `intervalo` segundos atrasados.
+
+    Contadores e histogramas de processos que terminaram continuam somados,
+    para que os totais não voltem atrás quando um worker é reciclado: ao
+    parar (ou quando exportar() encontra o arquivo de um processo morto) eles
+    são incorporados a `encerrados.json` e o arquivo do pid é removido, então
+    o diretório não cresce e um pid reutilizado não sobrescreve os totais de
+    outro. Medidores (valores do momento) só contam processos vivos. A
+    incorporação e a leitura usam um flock em `diretorio/.lock` para que uma
+    leitura nunca conte o mesmo processo duas vezes.
+    """
+    ARQUIVO_ENCERRADOS = 'encerrados.json'
+    ARQUIVO_TRAVA = '.lock'
+
+    def __init__(self, registro: 'Registro', diretorio: str, intervalo: float = 5.0, pid: int = None):
+        self.registro = registro
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self.pid = pid or os.getpid()
+        self._parar = threading.Event()
+        self._thread = None
+        os.makedirs(diretorio, exist_ok=True)
+
+    @staticmethod
+    def limpar(diretorio: str):
+        """Remove os arquivos de uma execução anterior (chamado pelo processo mestre antes do fork)"""
+        for arquivo in glob.glob(os.path.join(diretorio, '*.json')):
+            os.remove(arquivo)
+
+    def _arquivo(self, pid: int = None) -> str:
+        return os.path.join(self.diretorio, f'{pid or self.pid}.json')
+
+    @contextlib.contextmanager
+    def _travado(self, exclusivo: bool):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.diretorio, self.ARQUIVO_TRAVA), 'a') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+            yield
+
+    @staticmethod
+    def _ler(arquivo: str) -> Optional[dict]:
+        try:
+            with open(arquivo, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _sem_medidores(instantaneo: dict) -> dict:
+        return {nome: metrica for nome, metrica in instantaneo.items() if metrica['tipo'] != 'gauge'}
+
+    def _incorporar(self, instantaneos: Dict[int, Optional[dict]]):
+        """
+        Soma contadores e histogramas dos pids a encerrados.json e remove os arquivos deles
+
+        Instantâneo None: lê o arquivo do pid, ignorado se outro processo já
+        o incorporou ou se o pid voltou a ser de um processo vivo.
+        """
+        encerrados = os.path.join(self.diretorio, self.ARQUIVO_ENCERRADOS)
+        with self._travado(exclusivo=True):
+            somar = [self._ler(encerrados) or {}]
+            removidos = []
+            for pid, instantaneo in instantaneos.items():
+                if instantaneo is None:
+                    if pid != self.pid and self._vivo(pid):
+                        continue
+                    instantaneo = self._ler(self._arquivo(pid))
+                    if instantaneo is None:
+                        continue
+                somar.append(self._sem_medidores(instantaneo))
+                removidos.append(self._arquivo(pid))
+            if not removidos:
+                return
+            temporario = encerrados + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(_somar(somar), f, separators=(',', ':'))
+            os.replace(temporario, encerrados)
+            for arquivo in removidos:
+                try:
+                    os.remove(arquivo)
+                except FileNotFoundError:
+                    pass
+
+    def gravar(self):
+        """Grava o instantâneo atual (substituição atômica: leitores nunca veem um arquivo pela metade)"""
+        temporario = self._arquivo() + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self.registro.instantaneo(), f, separators=(',', ':'))
+        os.replace(temporario, self._arquivo())
+
+    def iniciar(self):
+        if self._thread is not None:
+            return self
+        if os.path.exists(self._arquivo()):
+            # Arquivo de um processo morto que tinha o mesmo pid: incorpora antes de sobrescrever
+            self._incorporar({self.pid: None})
+        self.gravar()
+
+        def _loop():
+            while not self._parar.wait(self.intervalo):
+                try:
+                    self.gravar()
+                except OSError as e:
+                    print(f"Erro ao gravar métricas: {e}")
+
+        self._thread = threading.Thread(target=_loop, name='metricas-compartilhadas', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        """Interrompe a gravação periódica e incorpora os valores finais do processo a encerrados.json"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(self.intervalo)
+        self._incorporar({self.pid: self.registro.instantaneo()})
+
+    @staticmethod
+    def _vivo(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def exportar(self) -> bytes:
+        instantaneos = [self.registro.instantaneo()]
+        mortos = []
+        with self._travado(exclusivo=False):
+            encerrados = self._ler(os.path.join(self.diretorio, self.ARQUIVO_ENCERRADOS))
+            if encerrados:
+                instantaneos.append(encerrados)
+            for arquivo in glob.glob(os.path.join(self.diretorio, '*.json')):
+                nome = os.path.basename(arquivo).split('.', 1)[0]
+                if not nome.isdigit() or int(nome) == self.pid:
+                    continue
+                instantaneo = self._ler(arquivo)
+                if instantaneo is None:
+                    continue
+                if not self._vivo(int(nome)):
+                    mortos.append(int(nome))
+                    instantaneo = self._sem_medidores(instantaneo)
+                instantaneos.append(instantaneo)
+        if mortos:
+            # Processo morto sem parar() (SIGKILL): incorporado para as próximas leituras
+            self._incorporar(dict.fromkeys(mortos))
+        return _formatar(_somar(instantaneos))
+
+# Registro compartilhado e métricas usadas pelos servidores
+registro = Registro()
+
+# Junção entre processos, ativada pelo producao_sql em cada worker (None: só este processo)
+compartilhadas: Optional[MetricasCompartilhadas] = None
+
+def compartilhar_metricas(diretorio: str, intervalo: float = 5.0) -> MetricasCompartilhadas:
+    """Passa a gravar o registro deste processo em `diretorio` e a somar os demais no /metrics"""
+    global compartilhadas
+    compartilhadas = MetricasCompartilhadas(registro, diretorio, intervalo).iniciar()
+    return compartilhadas
+
+def exportar_metricas() -> bytes:
+    """Texto do /metrics: soma de todos os processos, se compartilhadas, senão só este"""
+    if compartilhadas is not None:
+        return compartilhadas.exportar()
+    return registro.exportar()
+
+REQUISICOES = registro.contador('ferramentas_http_requisicoes_total',
+                                'Requisições HTTP atendidas', ('servidor', 'metodo', 'rota', 'status'))
+EM_ANDAMENTO = registro.medidor('ferramentas_http_requisicoes_em_andamento',
+                                'Requisições HTTP sendo atendidas agora', ('servidor',))
+DURACAO_HTTP = registro.histograma('ferramentas_http_duracao_segundos',
+                                   'Tempo de atendimento das requisições HTTP', ('servidor', 'metodo', 'rota'))
+DURACAO_DB = registro.histograma('ferramentas_db_duracao_segundos',
+                                 'Tempo gasto em cada método do DatabaseManager', ('metodo',))
+DURACAO_APPS_SCRIPT = registro.histograma('ferramentas_apps_script_duracao_segundos',
+                                          'Latência das chamadas ao Google Apps Script', ('resultado',),
+                                          limites=LIMITES_PADRAO + (60.0,))
+DURACAO_EMAIL = registro.histograma('ferramentas_email_envio_duracao_segundos',
+                                    'Tempo de envio de cada e-mail pela sessão SMTP', ('resultado',))
+
+_SEGMENTO_ID = re.compile(r'/\d+(?=/|$)')
+
+def normalizar_rota(caminho: str) -> str:
+    """
+    Reduz o caminho a um rótulo de cardinalidade limitada
+
+    Ids numéricos viram <id> e arquivos estáticos contam todos como 'estatico';
+    sem isso cada id ou arquivo criaria uma série nova.
+    """
+    caminho = caminho.split('?', 1)[0]
+    if caminho == '/metrics' or caminho.startswith('/api/'):
+        return _SEGMENTO_ID.sub('/<id>', caminho)
+    return 'estatico'
+
+def instrumentar_metodos(classe, histograma: Histograma = DURACAO_DB, ignorar: Iterable[str] = ()):
+    """
+    Mede a duração de cada método público da classe, rotulada pelo nome do método
+
+    Geradores ficam de fora (só a criação seria medida), assim como métodos
+    estáticos e propriedades.
+    """
+    for nome, funcao in list(vars(classe).items()):
+        if (nome.startswith('_') or nome in ignorar or not inspect.isfunction(funcao)
+                or inspect.isgeneratorfunction(funcao)):
+            continue
+        setattr(classe, nome, _medido(funcao, histograma.rotulos(nome)))
+    return classe
+
+def _medido(funcao, serie):
+    @functools.wraps(funcao)
+    def medido(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            serie.observar(time.perf_counter() - inicio)
+    return medido
+
+class HandlerComMetricas:
+    """
+    Mixin para BaseHTTPRequestHandler: conta requisições, status e duração
+
+    Deve vir antes do handler base na herança. O handler chama
+    enviar_metricas() quando o caminho for /metrics.
+    """
+    nome_servidor = 'http'
+
+    def handle_one_request(self):
+        self._inicio_metricas = None
+        self._status_metricas = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._inicio_metricas is not None:
+                EM_ANDAMENTO.rotulos(self.nome_servidor).dec()
+                rota = normalizar_rota(self.path)
+                DURACAO_HTTP.observar(self.nome_servidor, self.command, rota,
+                                      valor=time.perf_counter() - self._inicio_metricas)
+                REQUISICOES.inc(self.nome_servidor, self.command, rota, str(self._status_metricas or 0))
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        self._inicio_metricas = time.perf_counter()
+        EM_ANDAMENTO.rotulos(self.nome_servidor).inc()
+        return True
+
+    def send_response(self, code, message=None):
+        self._status_metricas = code
+        super().send_response(code, message)
+
+    def enviar_metricas(self):
+        corpo, codificacao = negociar(exportar_metricas(), CONTENT_TYPE, self.headers.get('Accept-Encoding'))
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Vary', 'Accept-Encoding')
+        if codificacao:
+            self.send_header('Content-Encoding', codificacao)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(corpo)
@@ -0,0 +1,157 @@
+-- Schema SQL para o sistema de gestão de ferramentas
+-- Tabelas principais: ferramentas, movimentacoes, solicitantes
+
+-- Tabela de solicitantes
+CREATE TABLE IF NOT EXISTS solicitantes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT NOT NULL UNIQUE,
+    email TEXT,
+    telefone TEXT,
+    departamento TEXT,
+    criado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabela de ferramentas
+CREATE TABLE IF NOT EXISTS ferramentas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT NOT NULL,
+    quantidade_total INTEGER DEFAULT 1,
+    quantidade_disponivel INTEGER DEFAULT 1,
+    status TEXT DEFAULT 'disponivel',
+    criado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabela de movimentações
+CREATE TABLE IF NOT EXISTS movimentacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL, -- 'saida' ou 'retorno'
+    solicitante_id INTEGER NOT NULL,
+    ferramenta_id INTEGER NOT NULL,
+    quantidade INTEGER DEFAULT 1,
+    data_saida DATE,
+    data_retorno DATE,
+    hora_devolucao TIME,
+    tem_retorno TEXT DEFAULT 'Sim',
+    observacoes TEXT,
+    status TEXT DEFAULT 'ativo', -- 'ativo', 'concluido', 'cancelado'
+    email_notificacao TEXT,
+    criado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (solicitante_id) REFERENCES solicitantes (id),
+    FOREIGN KEY (ferramenta_id) REFERENCES ferramentas (id)
+);
+
+-- Índices para melhor performance
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_solicitante ON movimentacoes(solicitante_id);
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_ferramenta ON movimentacoes(ferramenta_id);
+CREATE INDEX IF NOT EXISTS idx_ferramentas_status ON ferramentas(status);
+CREATE INDEX IF NOT EXISTS idx_ferramentas_nome ON ferramentas(nome);
+CREATE INDEX IF NOT EXISTS idx_ferramentas_disponivel ON ferramentas(quantidade_disponivel);
+
+-- Listagem paginada por (criado_em, id), com e sem filtro de status
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_criado ON movimentacoes(criado_em);
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_status_criado ON movimentacoes(status, criado_em);
+
+-- Empréstimos em aberto (parcial: só as linhas ativas entram no índice)
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_ativas ON movimentacoes(ferramenta_id, solicitante_id)
+    WHERE status = 'ativo';
+
+-- Consultas por período
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_data_saida ON movimentacoes(data_saida);
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_data_retorno ON movimentacoes(data_retorno);
+
+-- Contadores de estatísticas mantidos por triggers (linha única, id = 1)
+CREATE TABLE IF NOT EXISTS estatisticas (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_ferramentas INTEGER NOT NULL DEFAULT 0,
+    ferramentas_disponiveis INTEGER NOT NULL DEFAULT 0,
+    movimentacoes_ativas INTEGER NOT NULL DEFAULT 0,
+    total_solicitantes INTEGER NOT NULL DEFAULT 0
+);
+
+-- Na primeira execução os contadores partem das contagens atuais
+INSERT OR IGNORE INTO estatisticas (id, total_ferramentas, ferramentas_disponiveis,
+                                    movimentacoes_ativas, total_solicitantes)
+SELECT 1,
+       (SELECT COUNT(*) FROM ferramentas),
+       (SELECT COUNT(*) FROM ferramentas WHERE quantidade_disponivel > 0),
+       (SELECT COUNT(*) FROM movimentacoes WHERE status = 'ativo'),
+       (SELECT COUNT(*) FROM solicitantes);
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_ferramentas_insert
+AFTER INSERT ON ferramentas
+BEGIN
+    UPDATE estatisticas
+    SET total_ferramentas = total_ferramentas + 1,
+        ferramentas_disponiveis = ferramentas_disponiveis + (NEW.quantidade_disponivel > 0)
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_ferramentas_delete
+AFTER DELETE ON ferramentas
+BEGIN
+    UPDATE estatisticas
+    SET total_ferramentas = total_ferramentas - 1,
+        ferramentas_disponiveis = ferramentas_disponiveis - (OLD.quantidade_disponivel > 0)
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_ferramentas_update
+AFTER UPDATE OF quantidade_disponivel ON ferramentas
+WHEN (NEW.quantidade_disponivel > 0) IS NOT (OLD.quantidade_disponivel > 0)
+BEGIN
+    UPDATE estatisticas
+    SET ferramentas_disponiveis = ferramentas_disponiveis
+        + (NEW.quantidade_disponivel > 0) - (OLD.quantidade_disponivel > 0)
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_movimentacoes_insert
+AFTER INSERT ON movimentacoes
+WHEN NEW.status IS 'ativo'
+BEGIN
+    UPDATE estatisticas SET movimentacoes_ativas = movimentacoes_ativas + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_movimentacoes_delete
+AFTER DELETE ON movimentacoes
+WHEN OLD.status IS 'ativo'
+BEGIN
+    UPDATE estatisticas SET movimentacoes_ativas = movimentacoes_ativas - 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_movimentacoes_update
+AFTER UPDATE OF status ON movimentacoes
+WHEN (NEW.status IS 'ativo') != (OLD.status IS 'ativo')
+BEGIN
+    UPDATE estatisticas
+    SET movimentacoes_ativas = movimentacoes_ativas + (NEW.status IS 'ativo') - (OLD.status IS 'ativo')
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_solicitantes_insert
+AFTER INSERT ON solicitantes
+BEGIN
+    UPDATE estatisticas SET total_solicitantes = total_solicitantes + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_estatisticas_solicitantes_delete
+AFTER DELETE ON solicitantes
+BEGIN
+    UPDATE estatisticas SET total_solicitantes = total_solicitantes - 1 WHERE id = 1;
+END;
+
+-- Inserir dados iniciais de solicitantes
+INSERT OR IGNORE INTO solicitantes (nome) VALUES
+('BRUNO GOMES DA SILVA'),
+('CARLOS EDUARDO'),
+('DANIEL SILVA'),
+('EDUARDO SANTOS'),
+('FERNANDO OLIVEIRA'),
+('GABRIEL COSTA'),
+('HENRIQUE ALVES'),
+('IGOR PEREIRA'),
+('JOÃO PEDRO'),
+('LUCAS MARTINS');
@@ -0,0 +1,103 @@
+-- Log de alterações (CDC) para consumidores incrementais
+-- Cada insert/update/delete em solicitantes, ferramentas e movimentacoes gera
+-- uma linha com sequência estritamente crescente (AUTOINCREMENT nunca reutiliza)
+
+CREATE TABLE IF NOT EXISTS alteracoes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entidade TEXT NOT NULL, -- 'solicitantes', 'ferramentas' ou 'movimentacoes'
+    entidade_id INTEGER NOT NULL,
+    operacao TEXT NOT NULL, -- 'insert', 'update' ou 'delete'
+    colunas TEXT, -- JSON com as colunas alteradas (apenas em 'update')
+    criado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_solicitantes_insert
+AFTER INSERT ON solicitantes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('solicitantes', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_solicitantes_update
+AFTER UPDATE ON solicitantes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao, colunas)
+    SELECT 'solicitantes', NEW.id, 'update', json_group_array(value)
+    FROM json_each(json_array(
+        CASE WHEN NEW.nome IS NOT OLD.nome THEN 'nome' END,
+        CASE WHEN NEW.email IS NOT OLD.email THEN 'email' END,
+        CASE WHEN NEW.telefone IS NOT OLD.telefone THEN 'telefone' END,
+        CASE WHEN NEW.departamento IS NOT OLD.departamento THEN 'departamento' END,
+        CASE WHEN NEW.criado_em IS NOT OLD.criado_em THEN 'criado_em' END,
+        CASE WHEN NEW.atualizado_em IS NOT OLD.atualizado_em THEN 'atualizado_em' END
+    ))
+    WHERE value IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_solicitantes_delete
+AFTER DELETE ON solicitantes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('solicitantes', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_ferramentas_insert
+AFTER INSERT ON ferramentas
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('ferramentas', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_ferramentas_update
+AFTER UPDATE ON ferramentas
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao, colunas)
+    SELECT 'ferramentas', NEW.id, 'update', json_group_array(value)
+    FROM json_each(json_array(
+        CASE WHEN NEW.nome IS NOT OLD.nome THEN 'nome' END,
+        CASE WHEN NEW.quantidade_total IS NOT OLD.quantidade_total THEN 'quantidade_total' END,
+        CASE WHEN NEW.quantidade_disponivel IS NOT OLD.quantidade_disponivel THEN 'quantidade_disponivel' END,
+        CASE WHEN NEW.status IS NOT OLD.status THEN 'status' END,
+        CASE WHEN NEW.criado_em IS NOT OLD.criado_em THEN 'criado_em' END,
+        CASE WHEN NEW.atualizado_em IS NOT OLD.atualizado_em THEN 'atualizado_em' END
+    ))
+    WHERE value IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_ferramentas_delete
+AFTER DELETE ON ferramentas
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('ferramentas', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_movimentacoes_insert
+AFTER INSERT ON movimentacoes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('movimentacoes', NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_movimentacoes_update
+AFTER UPDATE ON movimentacoes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao, colunas)
+    SELECT 'movimentacoes', NEW.id, 'update', json_group_array(value)
+    FROM json_each(json_array(
+        CASE WHEN NEW.tipo IS NOT OLD.tipo THEN 'tipo' END,
+        CASE WHEN NEW.solicitante_id IS NOT OLD.solicitante_id THEN 'solicitante_id' END,
+        CASE WHEN NEW.ferramenta_id IS NOT OLD.ferramenta_id THEN 'ferramenta_id' END,
+        CASE WHEN NEW.quantidade IS NOT OLD.quantidade THEN 'quantidade' END,
+        CASE WHEN NEW.data_saida IS NOT OLD.data_saida THEN 'data_saida' END,
+        CASE WHEN NEW.data_retorno IS NOT OLD.data_retorno THEN 'data_retorno' END,
+        CASE WHEN NEW.hora_devolucao IS NOT OLD.hora_devolucao THEN 'hora_devolucao' END,
+        CASE WHEN NEW.tem_retorno IS NOT OLD.tem_retorno THEN 'tem_retorno' END,
+        CASE WHEN NEW.observacoes IS NOT OLD.observacoes THEN 'observacoes' END,
+        CASE WHEN NEW.status IS NOT OLD.status THEN 'status' END,
+        CASE WHEN NEW.email_notificacao IS NOT OLD.email_notificacao THEN 'email_notificacao' END,
+        CASE WHEN NEW.criado_em IS NOT OLD.criado_em THEN 'criado_em' END,
+        CASE WHEN NEW.atualizado_em IS NOT OLD.atualizado_em THEN 'atualizado_em' END
+    ))
+    WHERE value IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_movimentacoes_delete
+AFTER DELETE ON movimentacoes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('movimentacoes', OLD.id, 'delete');
+END;
@@ -0,0 +1,29 @@
+-- Patrimônios: unidades individuais de cada ferramenta, identificadas pela etiqueta
+-- solicitante_id/movimentacao_id apontam para quem está com a unidade agora
+-- (NULL = unidade livre) e são atualizados na mesma transação da saída/retorno
+
+CREATE TABLE IF NOT EXISTS patrimonios (
+    codigo TEXT PRIMARY KEY,
+    ferramenta_id INTEGER NOT NULL,
+    solicitante_id INTEGER,
+    movimentacao_id INTEGER,
+    criado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (ferramenta_id) REFERENCES ferramentas (id) ON DELETE CASCADE,
+    FOREIGN KEY (solicitante_id) REFERENCES solicitantes (id),
+    FOREIGN KEY (movimentacao_id) REFERENCES movimentacoes (id)
+) WITHOUT ROWID;
+
+-- Unidades (livres ou não) de uma ferramenta; também atende o ON DELETE CASCADE
+CREATE INDEX IF NOT EXISTS idx_patrimonios_ferramenta ON patrimonios(ferramenta_id, solicitante_id);
+
+-- Unidades com um solicitante
+CREATE INDEX IF NOT EXISTS idx_patrimonios_solicitante ON patrimonios(solicitante_id)
+    WHERE solicitante_id IS NOT NULL;
+
+-- Liberação da unidade ao concluir a movimentação
+CREATE INDEX IF NOT EXISTS idx_patrimonios_movimentacao ON patrimonios(movimentacao_id)
+    WHERE movimentacao_id IS NOT NULL;
+
+-- Etiqueta da unidade emprestada em cada movimentação
+ALTER TABLE movimentacoes ADD COLUMN patrimonio TEXT;
@@ -0,0 +1,44 @@
+-- Arquivo de movimentações: linhas concluídas/canceladas antigas saem da tabela
+-- movimentacoes (quente) para movimentacoes_arquivo em lotes, mantendo o mesmo id.
+-- As consultas de empréstimos ativos, contadores e listagens só leem a tabela quente;
+-- o arquivo entra na consulta apenas quando o histórico é pedido.
+
+CREATE TABLE IF NOT EXISTS movimentacoes_arquivo (
+    id INTEGER PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    solicitante_id INTEGER NOT NULL,
+    ferramenta_id INTEGER NOT NULL,
+    quantidade INTEGER DEFAULT 1,
+    data_saida DATE,
+    data_retorno DATE,
+    hora_devolucao TIME,
+    tem_retorno TEXT DEFAULT 'Sim',
+    observacoes TEXT,
+    status TEXT,
+    email_notificacao TEXT,
+    criado_em DATETIME,
+    atualizado_em DATETIME,
+    patrimonio TEXT,
+    arquivado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (solicitante_id) REFERENCES solicitantes (id),
+    FOREIGN KEY (ferramenta_id) REFERENCES ferramentas (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_arquivo_criado ON movimentacoes_arquivo(criado_em);
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_arquivo_solicitante ON movimentacoes_arquivo(solicitante_id);
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_arquivo_ferramenta ON movimentacoes_arquivo(ferramenta_id);
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_arquivo_data_saida ON movimentacoes_arquivo(data_saida);
+
+-- Candidatas ao arquivamento, pela data de encerramento (parcial: só linhas encerradas)
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_encerradas ON movimentacoes(atualizado_em)
+    WHERE status IN ('concluido', 'cancelado');
+
+-- Mover uma linha para o arquivo não é uma exclusão para quem acompanha o log de alterações
+DROP TRIGGER IF EXISTS trg_alteracoes_movimentacoes_delete;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_movimentacoes_delete
+AFTER DELETE ON movimentacoes
+WHEN NOT EXISTS (SELECT 1 FROM movimentacoes_arquivo WHERE id = OLD.id)
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao) VALUES ('movimentacoes', OLD.id, 'delete');
+END;
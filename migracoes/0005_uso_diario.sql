@@ -0,0 +1,59 @@
+-- Agregados diários de uso (dia x ferramenta e dia x solicitante), mantidos por
+-- triggers na mesma transação de cada movimentação. Relatórios de uso leem só
+-- estas tabelas, sem reagregar movimentacoes.
+--   movimentacoes: movimentações registradas no dia
+--   saidas/unidades: empréstimos registrados no dia e unidades emprestadas
+--   devolucoes: empréstimos concluídos no dia
+
+CREATE TABLE IF NOT EXISTS uso_diario_ferramenta (
+    dia DATE NOT NULL,
+    ferramenta_id INTEGER NOT NULL,
+    movimentacoes INTEGER NOT NULL DEFAULT 0,
+    saidas INTEGER NOT NULL DEFAULT 0,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    devolucoes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia, ferramenta_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS uso_diario_solicitante (
+    dia DATE NOT NULL,
+    solicitante_id INTEGER NOT NULL,
+    movimentacoes INTEGER NOT NULL DEFAULT 0,
+    saidas INTEGER NOT NULL DEFAULT 0,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    devolucoes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia, solicitante_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_insert
+AFTER INSERT ON movimentacoes
+BEGIN
+    INSERT INTO uso_diario_ferramenta (dia, ferramenta_id, movimentacoes, saidas, unidades)
+    VALUES (date(COALESCE(NEW.criado_em, 'now')), NEW.ferramenta_id, 1,
+            lower(NEW.tipo) = 'saida', CASE WHEN lower(NEW.tipo) = 'saida' THEN COALESCE(NEW.quantidade, 1) ELSE 0 END)
+    ON CONFLICT (dia, ferramenta_id) DO UPDATE SET
+        movimentacoes = movimentacoes + excluded.movimentacoes,
+        saidas = saidas + excluded.saidas,
+        unidades = unidades + excluded.unidades;
+
+    INSERT INTO uso_diario_solicitante (dia, solicitante_id, movimentacoes, saidas, unidades)
+    VALUES (date(COALESCE(NEW.criado_em, 'now')), NEW.solicitante_id, 1,
+            lower(NEW.tipo) = 'saida', CASE WHEN lower(NEW.tipo) = 'saida' THEN COALESCE(NEW.quantidade, 1) ELSE 0 END)
+    ON CONFLICT (dia, solicitante_id) DO UPDATE SET
+        movimentacoes = movimentacoes + excluded.movimentacoes,
+        saidas = saidas + excluded.saidas,
+        unidades = unidades + excluded.unidades;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_concluir
+AFTER UPDATE OF status ON movimentacoes
+WHEN NEW.status IS 'concluido' AND OLD.status IS NOT 'concluido' AND lower(NEW.tipo) = 'saida'
+BEGIN
+    INSERT INTO uso_diario_ferramenta (dia, ferramenta_id, devolucoes)
+    VALUES (date('now'), NEW.ferramenta_id, 1)
+    ON CONFLICT (dia, ferramenta_id) DO UPDATE SET devolucoes = devolucoes + 1;
+
+    INSERT INTO uso_diario_solicitante (dia, solicitante_id, devolucoes)
+    VALUES (date('now'), NEW.solicitante_id, 1)
+    ON CONFLICT (dia, solicitante_id) DO UPDATE SET devolucoes = devolucoes + 1;
+END;
@@ -0,0 +1,62 @@
+-- Empréstimos em atraso: vencimento normalizado a partir de data_retorno/hora_devolucao
+-- (texto livre: 'AAAA-MM-DD' ou 'DD/MM/AAAA', hora 'HH:MM'; sem hora vale o fim do dia).
+-- Índices parciais só com linhas ativas: a lista de atrasados e o verificador periódico
+-- leem apenas as linhas vencidas, sem percorrer a tabela.
+
+ALTER TABLE movimentacoes ADD COLUMN vencimento TEXT GENERATED ALWAYS AS (
+    CASE
+        WHEN data_retorno GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+            THEN substr(data_retorno, 1, 10)
+        WHEN data_retorno GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]*'
+            THEN substr(data_retorno, 7, 4) || '-' || substr(data_retorno, 4, 2) || '-' || substr(data_retorno, 1, 2)
+    END || ' ' ||
+    CASE
+        WHEN hora_devolucao GLOB '[0-9][0-9]:[0-9][0-9]*' THEN substr(hora_devolucao, 1, 5)
+        WHEN hora_devolucao GLOB '[0-9]:[0-9][0-9]*' THEN '0' || substr(hora_devolucao, 1, 4)
+        ELSE '23:59'
+    END
+) VIRTUAL;
+
+-- 1 depois que o verificador notificou o atraso; volta a 0 se o prazo for alterado
+ALTER TABLE movimentacoes ADD COLUMN atraso_notificado INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_vencimento ON movimentacoes(vencimento)
+    WHERE status = 'ativo';
+
+CREATE INDEX IF NOT EXISTS idx_movimentacoes_atraso_pendente ON movimentacoes(vencimento)
+    WHERE status = 'ativo' AND atraso_notificado = 0;
+
+CREATE TRIGGER IF NOT EXISTS trg_atraso_prazo_alterado
+AFTER UPDATE OF data_retorno, hora_devolucao ON movimentacoes
+WHEN NEW.atraso_notificado = 1 AND NEW.vencimento IS NOT OLD.vencimento
+BEGIN
+    UPDATE movimentacoes SET atraso_notificado = 0 WHERE id = NEW.id;
+END;
+
+-- O log de alterações passa a registrar também patrimonio e atraso_notificado
+DROP TRIGGER IF EXISTS trg_alteracoes_movimentacoes_update;
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_movimentacoes_update
+AFTER UPDATE ON movimentacoes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao, colunas)
+    SELECT 'movimentacoes', NEW.id, 'update', json_group_array(value)
+    FROM json_each(json_array(
+        CASE WHEN NEW.tipo IS NOT OLD.tipo THEN 'tipo' END,
+        CASE WHEN NEW.solicitante_id IS NOT OLD.solicitante_id THEN 'solicitante_id' END,
+        CASE WHEN NEW.ferramenta_id IS NOT OLD.ferramenta_id THEN 'ferramenta_id' END,
+        CASE WHEN NEW.quantidade IS NOT OLD.quantidade THEN 'quantidade' END,
+        CASE WHEN NEW.data_saida IS NOT OLD.data_saida THEN 'data_saida' END,
+        CASE WHEN NEW.data_retorno IS NOT OLD.data_retorno THEN 'data_retorno' END,
+        CASE WHEN NEW.hora_devolucao IS NOT OLD.hora_devolucao THEN 'hora_devolucao' END,
+        CASE WHEN NEW.tem_retorno IS NOT OLD.tem_retorno THEN 'tem_retorno' END,
+        CASE WHEN NEW.observacoes IS NOT OLD.observacoes THEN 'observacoes' END,
+        CASE WHEN NEW.status IS NOT OLD.status THEN 'status' END,
+        CASE WHEN NEW.email_notificacao IS NOT OLD.email_notificacao THEN 'email_notificacao' END,
+        CASE WHEN NEW.criado_em IS NOT OLD.criado_em THEN 'criado_em' END,
+        CASE WHEN NEW.atualizado_em IS NOT OLD.atualizado_em THEN 'atualizado_em' END,
+        CASE WHEN NEW.patrimonio IS NOT OLD.patrimonio THEN 'patrimonio' END,
+        CASE WHEN NEW.atraso_notificado IS NOT OLD.atraso_notificado THEN 'atraso_notificado' END
+    ))
+    WHERE value IS NOT NULL;
+END;
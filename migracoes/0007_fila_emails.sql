@@ -0,0 +1,20 @@
+-- Fila persistente de e-mails (outbox): a API só grava a mensagem e responde;
+-- uma thread de envio drena a fila com uma sessão SMTP reaproveitada.
+--   status: 'pendente', 'enviado' ou 'falhou' (esgotou as tentativas)
+
+CREATE TABLE IF NOT EXISTS emails_pendentes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    destinatario TEXT NOT NULL,
+    assunto TEXT NOT NULL,
+    mensagem TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    proxima_tentativa DATETIME DEFAULT CURRENT_TIMESTAMP,
+    erro TEXT,
+    criado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    enviado_em DATETIME
+);
+
+-- A thread de envio só percorre as mensagens pendentes, pela próxima tentativa
+CREATE INDEX IF NOT EXISTS idx_emails_pendentes_proxima ON emails_pendentes(proxima_tentativa)
+    WHERE status = 'pendente';
@@ -0,0 +1,84 @@
+-- Versão de cada tabela, incrementada por triggers a cada insert/update/delete.
+-- O cache de respostas do servidor compara as versões das tabelas de que uma
+-- resposta depende; como a versão fica no banco, todos os processos enxergam
+-- as escritas uns dos outros.
+
+CREATE TABLE IF NOT EXISTS versoes_tabelas (
+    tabela TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO versoes_tabelas (tabela) VALUES
+    ('solicitantes'), ('ferramentas'), ('movimentacoes'), ('patrimonios');
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_solicitantes_insert
+AFTER INSERT ON solicitantes
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'solicitantes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_solicitantes_update
+AFTER UPDATE ON solicitantes
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'solicitantes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_solicitantes_delete
+AFTER DELETE ON solicitantes
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'solicitantes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_ferramentas_insert
+AFTER INSERT ON ferramentas
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'ferramentas';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_ferramentas_update
+AFTER UPDATE ON ferramentas
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'ferramentas';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_ferramentas_delete
+AFTER DELETE ON ferramentas
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'ferramentas';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_movimentacoes_insert
+AFTER INSERT ON movimentacoes
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'movimentacoes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_movimentacoes_update
+AFTER UPDATE ON movimentacoes
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'movimentacoes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_movimentacoes_delete
+AFTER DELETE ON movimentacoes
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'movimentacoes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_patrimonios_insert
+AFTER INSERT ON patrimonios
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'patrimonios';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_patrimonios_update
+AFTER UPDATE ON patrimonios
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'patrimonios';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_versao_patrimonios_delete
+AFTER DELETE ON patrimonios
+BEGIN
+    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'patrimonios';
+END;
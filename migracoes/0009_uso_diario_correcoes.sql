@@ -0,0 +1,103 @@
+-- Mantém os agregados diários de uso corretos quando uma movimentação é alterada
+-- ou excluída. Cada linha contribui com um evento de registro (no dia de
+-- criado_em) e, se for uma saída concluída, com uma devolução (no dia de
+-- atualizado_em, como em reconstruir_uso): a alteração subtrai a contribuição
+-- da linha antiga e soma a da nova; a exclusão subtrai a da linha antiga.
+-- O arquivamento copia a linha para movimentacoes_arquivo antes de excluí-la e
+-- não altera os agregados.
+
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_alterar
+AFTER UPDATE OF tipo, solicitante_id, ferramenta_id, quantidade, criado_em ON movimentacoes
+WHEN OLD.tipo IS NOT NEW.tipo OR OLD.solicitante_id IS NOT NEW.solicitante_id
+    OR OLD.ferramenta_id IS NOT NEW.ferramenta_id OR OLD.quantidade IS NOT NEW.quantidade
+    OR OLD.criado_em IS NOT NEW.criado_em
+BEGIN
+    UPDATE uso_diario_ferramenta SET
+        movimentacoes = movimentacoes - 1,
+        saidas = saidas - (lower(OLD.tipo) = 'saida'),
+        unidades = unidades - CASE WHEN lower(OLD.tipo) = 'saida' THEN COALESCE(OLD.quantidade, 1) ELSE 0 END
+    WHERE dia = date(COALESCE(OLD.criado_em, 'now')) AND ferramenta_id = OLD.ferramenta_id;
+
+    UPDATE uso_diario_solicitante SET
+        movimentacoes = movimentacoes - 1,
+        saidas = saidas - (lower(OLD.tipo) = 'saida'),
+        unidades = unidades - CASE WHEN lower(OLD.tipo) = 'saida' THEN COALESCE(OLD.quantidade, 1) ELSE 0 END
+    WHERE dia = date(COALESCE(OLD.criado_em, 'now')) AND solicitante_id = OLD.solicitante_id;
+
+    INSERT INTO uso_diario_ferramenta (dia, ferramenta_id, movimentacoes, saidas, unidades)
+    VALUES (date(COALESCE(NEW.criado_em, 'now')), NEW.ferramenta_id, 1,
+            lower(NEW.tipo) = 'saida', CASE WHEN lower(NEW.tipo) = 'saida' THEN COALESCE(NEW.quantidade, 1) ELSE 0 END)
+    ON CONFLICT (dia, ferramenta_id) DO UPDATE SET
+        movimentacoes = movimentacoes + excluded.movimentacoes,
+        saidas = saidas + excluded.saidas,
+        unidades = unidades + excluded.unidades;
+
+    INSERT INTO uso_diario_solicitante (dia, solicitante_id, movimentacoes, saidas, unidades)
+    VALUES (date(COALESCE(NEW.criado_em, 'now')), NEW.solicitante_id, 1,
+            lower(NEW.tipo) = 'saida', CASE WHEN lower(NEW.tipo) = 'saida' THEN COALESCE(NEW.quantidade, 1) ELSE 0 END)
+    ON CONFLICT (dia, solicitante_id) DO UPDATE SET
+        movimentacoes = movimentacoes + excluded.movimentacoes,
+        saidas = saidas + excluded.saidas,
+        unidades = unidades + excluded.unidades;
+END;
+
+-- Saída que já estava (e continua) concluída: a devolução acompanha a linha, inclusive
+-- quando atualizado_em muda. Conclusões e reaberturas ficam com os triggers de status.
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_devolucao_alterar
+AFTER UPDATE OF tipo, solicitante_id, ferramenta_id, atualizado_em ON movimentacoes
+WHEN OLD.status IS 'concluido' AND NEW.status IS 'concluido'
+    AND (lower(OLD.tipo) = 'saida' OR lower(NEW.tipo) = 'saida')
+    AND (OLD.tipo IS NOT NEW.tipo OR OLD.solicitante_id IS NOT NEW.solicitante_id
+         OR OLD.ferramenta_id IS NOT NEW.ferramenta_id OR date(OLD.atualizado_em) IS NOT date(NEW.atualizado_em))
+BEGIN
+    UPDATE uso_diario_ferramenta SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.atualizado_em) AND ferramenta_id = OLD.ferramenta_id AND lower(OLD.tipo) = 'saida';
+
+    UPDATE uso_diario_solicitante SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.atualizado_em) AND solicitante_id = OLD.solicitante_id AND lower(OLD.tipo) = 'saida';
+
+    INSERT INTO uso_diario_ferramenta (dia, ferramenta_id, devolucoes)
+    SELECT date(NEW.atualizado_em), NEW.ferramenta_id, 1 WHERE lower(NEW.tipo) = 'saida'
+    ON CONFLICT (dia, ferramenta_id) DO UPDATE SET devolucoes = devolucoes + 1;
+
+    INSERT INTO uso_diario_solicitante (dia, solicitante_id, devolucoes)
+    SELECT date(NEW.atualizado_em), NEW.solicitante_id, 1 WHERE lower(NEW.tipo) = 'saida'
+    ON CONFLICT (dia, solicitante_id) DO UPDATE SET devolucoes = devolucoes + 1;
+END;
+
+-- Saída concluída reaberta (status alterado de volta): a devolução deixa de contar
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_reabrir
+AFTER UPDATE OF status ON movimentacoes
+WHEN OLD.status IS 'concluido' AND NEW.status IS NOT 'concluido' AND lower(OLD.tipo) = 'saida'
+BEGIN
+    UPDATE uso_diario_ferramenta SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.atualizado_em) AND ferramenta_id = OLD.ferramenta_id;
+
+    UPDATE uso_diario_solicitante SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.atualizado_em) AND solicitante_id = OLD.solicitante_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_delete
+AFTER DELETE ON movimentacoes
+WHEN NOT EXISTS (SELECT 1 FROM movimentacoes_arquivo WHERE id = OLD.id)
+BEGIN
+    UPDATE uso_diario_ferramenta SET
+        movimentacoes = movimentacoes - 1,
+        saidas = saidas - (lower(OLD.tipo) = 'saida'),
+        unidades = unidades - CASE WHEN lower(OLD.tipo) = 'saida' THEN COALESCE(OLD.quantidade, 1) ELSE 0 END
+    WHERE dia = date(COALESCE(OLD.criado_em, 'now')) AND ferramenta_id = OLD.ferramenta_id;
+
+    UPDATE uso_diario_solicitante SET
+        movimentacoes = movimentacoes - 1,
+        saidas = saidas - (lower(OLD.tipo) = 'saida'),
+        unidades = unidades - CASE WHEN lower(OLD.tipo) = 'saida' THEN COALESCE(OLD.quantidade, 1) ELSE 0 END
+    WHERE dia = date(COALESCE(OLD.criado_em, 'now')) AND solicitante_id = OLD.solicitante_id;
+
+    UPDATE uso_diario_ferramenta SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.atualizado_em) AND ferramenta_id = OLD.ferramenta_id
+      AND OLD.status IS 'concluido' AND lower(OLD.tipo) = 'saida';
+
+    UPDATE uso_diario_solicitante SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.atualizado_em) AND solicitante_id = OLD.solicitante_id
+      AND OLD.status IS 'concluido' AND lower(OLD.tipo) = 'saida';
+END;
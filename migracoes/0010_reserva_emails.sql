@@ -0,0 +1,10 @@
+-- Reserva de e-mails pela thread de envio: o lote é marcado 'enviando' com
+-- proxima_tentativa no fim da reserva, na mesma instrução que o seleciona, de
+-- forma que dois processos nunca enviem a mesma mensagem. Uma reserva vencida
+-- (processo que morreu no meio do lote) volta a ser elegível.
+--   status: 'pendente', 'enviando', 'enviado' ou 'falhou'
+
+DROP INDEX IF EXISTS idx_emails_pendentes_proxima;
+
+CREATE INDEX IF NOT EXISTS idx_emails_fila_proxima ON emails_pendentes(proxima_tentativa)
+    WHERE status IN ('pendente', 'enviando');
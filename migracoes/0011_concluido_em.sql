@@ -0,0 +1,120 @@
+-- Data de devolução própria: atualizado_em muda a cada edição, então uma saída
+-- concluída editada depois (observações, ferramenta) levava a sua devolução
+-- para o dia da edição. concluido_em é gravado por concluir_movimentacao e os
+-- agregados de devoluções passam a usar o dia dele.
+
+ALTER TABLE movimentacoes ADD COLUMN concluido_em DATETIME;
+ALTER TABLE movimentacoes_arquivo ADD COLUMN concluido_em DATETIME;
+
+-- Preenchimento das linhas já concluídas com a melhor estimativa disponível,
+-- com o log de alterações desligado (não é uma alteração feita por usuário)
+DROP TRIGGER IF EXISTS trg_alteracoes_movimentacoes_update;
+
+UPDATE movimentacoes SET concluido_em = atualizado_em WHERE status = 'concluido';
+UPDATE movimentacoes_arquivo SET concluido_em = atualizado_em WHERE status = 'concluido';
+
+CREATE TRIGGER IF NOT EXISTS trg_alteracoes_movimentacoes_update
+AFTER UPDATE ON movimentacoes
+BEGIN
+    INSERT INTO alteracoes (entidade, entidade_id, operacao, colunas)
+    SELECT 'movimentacoes', NEW.id, 'update', json_group_array(value)
+    FROM json_each(json_array(
+        CASE WHEN NEW.tipo IS NOT OLD.tipo THEN 'tipo' END,
+        CASE WHEN NEW.solicitante_id IS NOT OLD.solicitante_id THEN 'solicitante_id' END,
+        CASE WHEN NEW.ferramenta_id IS NOT OLD.ferramenta_id THEN 'ferramenta_id' END,
+        CASE WHEN NEW.quantidade IS NOT OLD.quantidade THEN 'quantidade' END,
+        CASE WHEN NEW.data_saida IS NOT OLD.data_saida THEN 'data_saida' END,
+        CASE WHEN NEW.data_retorno IS NOT OLD.data_retorno THEN 'data_retorno' END,
+        CASE WHEN NEW.hora_devolucao IS NOT OLD.hora_devolucao THEN 'hora_devolucao' END,
+        CASE WHEN NEW.tem_retorno IS NOT OLD.tem_retorno THEN 'tem_retorno' END,
+        CASE WHEN NEW.observacoes IS NOT OLD.observacoes THEN 'observacoes' END,
+        CASE WHEN NEW.status IS NOT OLD.status THEN 'status' END,
+        CASE WHEN NEW.email_notificacao IS NOT OLD.email_notificacao THEN 'email_notificacao' END,
+        CASE WHEN NEW.criado_em IS NOT OLD.criado_em THEN 'criado_em' END,
+        CASE WHEN NEW.atualizado_em IS NOT OLD.atualizado_em THEN 'atualizado_em' END,
+        CASE WHEN NEW.patrimonio IS NOT OLD.patrimonio THEN 'patrimonio' END,
+        CASE WHEN NEW.atraso_notificado IS NOT OLD.atraso_notificado THEN 'atraso_notificado' END,
+        CASE WHEN NEW.concluido_em IS NOT OLD.concluido_em THEN 'concluido_em' END
+    ))
+    WHERE value IS NOT NULL;
+END;
+
+-- Devoluções contam no dia de concluido_em (antes: date('now') e atualizado_em)
+DROP TRIGGER IF EXISTS trg_uso_movimentacoes_concluir;
+DROP TRIGGER IF EXISTS trg_uso_movimentacoes_devolucao_alterar;
+DROP TRIGGER IF EXISTS trg_uso_movimentacoes_reabrir;
+DROP TRIGGER IF EXISTS trg_uso_movimentacoes_delete;
+
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_concluir
+AFTER UPDATE OF status ON movimentacoes
+WHEN NEW.status IS 'concluido' AND OLD.status IS NOT 'concluido' AND lower(NEW.tipo) = 'saida'
+BEGIN
+    INSERT INTO uso_diario_ferramenta (dia, ferramenta_id, devolucoes)
+    VALUES (date(COALESCE(NEW.concluido_em, 'now')), NEW.ferramenta_id, 1)
+    ON CONFLICT (dia, ferramenta_id) DO UPDATE SET devolucoes = devolucoes + 1;
+
+    INSERT INTO uso_diario_solicitante (dia, solicitante_id, devolucoes)
+    VALUES (date(COALESCE(NEW.concluido_em, 'now')), NEW.solicitante_id, 1)
+    ON CONFLICT (dia, solicitante_id) DO UPDATE SET devolucoes = devolucoes + 1;
+END;
+
+-- Saída que já estava (e continua) concluída: a devolução acompanha a linha quando
+-- tipo, solicitante, ferramenta ou concluido_em mudam. Outras edições não a movem.
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_devolucao_alterar
+AFTER UPDATE OF tipo, solicitante_id, ferramenta_id, concluido_em ON movimentacoes
+WHEN OLD.status IS 'concluido' AND NEW.status IS 'concluido'
+    AND (lower(OLD.tipo) = 'saida' OR lower(NEW.tipo) = 'saida')
+    AND (OLD.tipo IS NOT NEW.tipo OR OLD.solicitante_id IS NOT NEW.solicitante_id
+         OR OLD.ferramenta_id IS NOT NEW.ferramenta_id OR date(OLD.concluido_em) IS NOT date(NEW.concluido_em))
+BEGIN
+    UPDATE uso_diario_ferramenta SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.concluido_em) AND ferramenta_id = OLD.ferramenta_id AND lower(OLD.tipo) = 'saida';
+
+    UPDATE uso_diario_solicitante SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.concluido_em) AND solicitante_id = OLD.solicitante_id AND lower(OLD.tipo) = 'saida';
+
+    INSERT INTO uso_diario_ferramenta (dia, ferramenta_id, devolucoes)
+    SELECT date(NEW.concluido_em), NEW.ferramenta_id, 1 WHERE lower(NEW.tipo) = 'saida'
+    ON CONFLICT (dia, ferramenta_id) DO UPDATE SET devolucoes = devolucoes + 1;
+
+    INSERT INTO uso_diario_solicitante (dia, solicitante_id, devolucoes)
+    SELECT date(NEW.concluido_em), NEW.solicitante_id, 1 WHERE lower(NEW.tipo) = 'saida'
+    ON CONFLICT (dia, solicitante_id) DO UPDATE SET devolucoes = devolucoes + 1;
+END;
+
+-- Saída concluída reaberta (status alterado de volta): a devolução deixa de contar
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_reabrir
+AFTER UPDATE OF status ON movimentacoes
+WHEN OLD.status IS 'concluido' AND NEW.status IS NOT 'concluido' AND lower(OLD.tipo) = 'saida'
+BEGIN
+    UPDATE uso_diario_ferramenta SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.concluido_em) AND ferramenta_id = OLD.ferramenta_id;
+
+    UPDATE uso_diario_solicitante SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.concluido_em) AND solicitante_id = OLD.solicitante_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_uso_movimentacoes_delete
+AFTER DELETE ON movimentacoes
+WHEN NOT EXISTS (SELECT 1 FROM movimentacoes_arquivo WHERE id = OLD.id)
+BEGIN
+    UPDATE uso_diario_ferramenta SET
+        movimentacoes = movimentacoes - 1,
+        saidas = saidas - (lower(OLD.tipo) = 'saida'),
+        unidades = unidades - CASE WHEN lower(OLD.tipo) = 'saida' THEN COALESCE(OLD.quantidade, 1) ELSE 0 END
+    WHERE dia = date(COALESCE(OLD.criado_em, 'now')) AND ferramenta_id = OLD.ferramenta_id;
+
+    UPDATE uso_diario_solicitante SET
+        movimentacoes = movimentacoes - 1,
+        saidas = saidas - (lower(OLD.tipo) = 'saida'),
+        unidades = unidades - CASE WHEN lower(OLD.tipo) = 'saida' THEN COALESCE(OLD.quantidade, 1) ELSE 0 END
+    WHERE dia = date(COALESCE(OLD.criado_em, 'now')) AND solicitante_id = OLD.solicitante_id;
+
+    UPDATE uso_diario_ferramenta SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.concluido_em) AND ferramenta_id = OLD.ferramenta_id
+      AND OLD.status IS 'concluido' AND lower(OLD.tipo) = 'saida';
+
+    UPDATE uso_diario_solicitante SET devolucoes = devolucoes - 1
+    WHERE dia = date(OLD.concluido_em) AND solicitante_id = OLD.solicitante_id
+      AND OLD.status IS 'concluido' AND lower(OLD.tipo) = 'saida';
+END;
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Ponto de entrada de produção do server_sql
+Roda o app Flask no gunicorn com vários processos (workers), cada um com
+várias threads e o seu próprio pool de conexões SQLite.
+
+    python producao_sql.py --workers 4 --threads 8 --bind 0.0.0.0:8000
+
+O app é carregado uma vez no processo mestre (preload): migrações e
+preparo dos estáticos rodam antes do fork e os workers compartilham essa
+memória. Nenhuma conexão SQLite atravessa o fork; cada worker abre as suas
+na primeira requisição. Os serviços de fundo (fila de e-mails, atrasos,
+backup agendado) rodam em um único worker, o que obtiver a trava de
+serviços; se ele sair, outro assume. Cada worker grava suas métricas em um
+diretório ao lado do banco e o /metrics de qualquer worker devolve a soma
+de todos, então basta um alvo de scrape. As vagas de escrita do controle de
+admissão também valem para todos os workers (travas em <banco>.admissao) e
+os orçamentos por cliente são divididos pelo número de workers do início
+(TTIN/TTOU não os recalculam).
+
+Sinais (enviados ao PID do mestre, veja --pidfile):
+    HUP   recarrega a configuração e troca os workers sem derrubar conexões
+    TERM  encerramento gracioso (espera até --graceful-timeout)
+    TTIN / TTOU   adiciona / remove um worker
+    USR2 seguido de TERM no mestre antigo   troca o código sem parar de atender
+"""
+import argparse
+import fcntl
+import os
+import threading
+
+from gunicorn.app.base import BaseApplication
+
+import database_sql
+import metricas
+
+CONFIG_PADRAO = {
+    'bind': os.environ.get('SERVER_BIND', '0.0.0.0:8000'),
+    'workers': int(os.environ.get('SERVER_WORKERS', min(4, (os.cpu_count() or 1) + 1))),
+    'threads': int(os.environ.get('SERVER_THREADS', 8)),
+    'timeout': 60,
+    'graceful_timeout': 30,
+    'keepalive': 5,
+    'max_requests': 0,
+    'max_requests_jitter': 0,
+    'pidfile': None,
+    'modo_estaticos': 'producao'
+}
+
+# Worker que roda a fila de e-mails, a verificação de atrasos e o backup agendado:
+# o que obtiver a trava, um arquivo ao lado do banco (não depende do diretório atual)
+SUFIXO_TRAVA_SERVICOS = '.servicos.lock'
+INTERVALO_TRAVA = 5.0
+
+# Caminho da trava, definido no mestre a partir do caminho do banco
+caminho_trava_servicos = None
+
+# Diretório onde cada worker grava as suas métricas (<banco>.metricas)
+SUFIXO_METRICAS = '.metricas'
+diretorio_metricas = None
+
+# Diretório das vagas compartilhadas do controle de admissão (<banco>.admissao)
+SUFIXO_ADMISSAO = '.admissao'
+
+# Arquivo da trava mantido aberto enquanto o worker roda os serviços
+trava_servicos = None
+
+def preparar_mestre(modo_estaticos=None):
+    """Aplica as migrações e prepara os estáticos no mestre, sem deixar conexões abertas"""
+    global caminho_trava_servicos, diretorio_metricas
+    manager = database_sql.init_database()
+    caminho_trava_servicos = os.path.abspath(manager.db_path) + SUFIXO_TRAVA_SERVICOS
+    # Métricas de uma execução anterior do mestre não entram na soma
+    diretorio_metricas = os.path.abspath(manager.db_path) + SUFIXO_METRICAS
+    os.makedirs(diretorio_metricas, exist_ok=True)
+    metricas.MetricasCompartilhadas.limpar(diretorio_metricas)
+    # Lido pelo admissao quando o server_sql o importa
+    os.environ['ADMISSAO_DIRETORIO'] = os.path.abspath(manager.db_path) + SUFIXO_ADMISSAO
+    manager.close()
+    database_sql.db_manager = None
+
+    import server_sql
+    print(f"Arquivos estáticos: {server_sql.preparar_estaticos(modo_estaticos)}")
+    return server_sql.app
+
+def assumir_servicos(server_sql, caminho_trava, intervalo=INTERVALO_TRAVA):
+    """
+    Tenta periodicamente a trava de serviços e, ao obtê-la, inicia os serviços de fundo
+
+    A trava (flock) é liberada pelo sistema quando o processo termina, então
+    um worker reciclado ou encerrado passa os serviços para outro. Os demais
+    workers nunca iniciam esses serviços: as rotas só enfileiram e leem status.
+    """
+    global trava_servicos
+    arquivo = open(caminho_trava, 'a')
+    while True:
+        try:
+            fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            threading.Event().wait(intervalo)
+
+    trava_servicos = arquivo
+    print(f"Worker {os.getpid()}: serviços de fundo iniciados")
+    server_sql.iniciar_servicos()
+    # Um único feed SSE para todos os workers; escritas dos outros workers
+    # chegam pelo intervalo de leitura do log
+    server_sql.get_hub_eventos()
+    return arquivo
+
+def post_fork(server, worker):
+    """Zera o estado herdado do mestre; o worker abre o próprio pool ao ser usado"""
+    import server_sql
+    database_sql.db_manager = None
+    server_sql.db_manager = None
+    server_sql.gerenciador_backup = None
+    server_sql.fila_emails = None
+    server_sql.verificador_atrasos = None
+    server_sql.hub_eventos = None
+    metricas.compartilhar_metricas(diretorio_metricas)
+    threading.Thread(target=assumir_servicos, args=(server_sql, caminho_trava_servicos),
+                     name='trava-servicos', daemon=True).start()
+
+def worker_exit(server, worker):
+    """Termina o envio em andamento, incorpora as métricas finais às dos encerrados e fecha as conexões"""
+    import server_sql
+    if metricas.compartilhadas is not None:
+        metricas.compartilhadas.parar()
+    if server_sql.fila_emails is not None:
+        server_sql.fila_emails.parar(timeout=10)
+    if server_sql.hub_eventos is not None:
+        server_sql.hub_eventos.parar()
+    if server_sql.db_manager is not None:
+        server_sql.db_manager.close()
+
+class AplicacaoProducao(BaseApplication):
+    """Aplicação gunicorn configurada por código, sem arquivo gunicorn.conf.py"""
+
+    def __init__(self, config):
+        self.config_servidor = config
+        super().__init__()
+
+    def load_config(self):
+        config = self.config_servidor
+        self.cfg.set('bind', config['bind'])
+        self.cfg.set('workers', config['workers'])
+        self.cfg.set('threads', config['threads'])
+        self.cfg.set('worker_class', 'gthread')
+        self.cfg.set('preload_app', True)
+        self.cfg.set('timeout', config['timeout'])
+        self.cfg.set('graceful_timeout', config['graceful_timeout'])
+        self.cfg.set('keepalive', config['keepalive'])
+        self.cfg.set('max_requests', config['max_requests'])
+        self.cfg.set('max_requests_jitter', config['max_requests_jitter'])
+        if config['pidfile']:
+            self.cfg.set('pidfile', config['pidfile'])
+        self.cfg.set('post_fork', post_fork)
+        self.cfg.set('worker_exit', worker_exit)
+
+    def load(self):
+        return preparar_mestre(self.config_servidor['modo_estaticos'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor SQL de produção (gunicorn, vários workers)')
+    parser.add_argument('--bind', default=CONFIG_PADRAO['bind'])
+    parser.add_argument('--workers', type=int, default=CONFIG_PADRAO['workers'])
+    parser.add_argument('--threads', type=int, default=CONFIG_PADRAO['threads'],
+                        help='threads por worker (cada uma pode usar uma conexão do pool)')
+    parser.add_argument('--timeout', type=int, default=CONFIG_PADRAO['timeout'])
+    parser.add_argument('--graceful-timeout', type=int, default=CONFIG_PADRAO['graceful_timeout'])
+    parser.add_argument('--keepalive', type=int, default=CONFIG_PADRAO['keepalive'])
+    parser.add_argument('--max-requests', type=int, default=CONFIG_PADRAO['max_requests'],
+                        help='recicla o worker após N requisições (0 desativa)')
+    parser.add_argument('--max-requests-jitter', type=int, default=CONFIG_PADRAO['max_requests_jitter'])
+    parser.add_argument('--pidfile', default=CONFIG_PADRAO['pidfile'])
+    parser.add_argument('--modo-estaticos', choices=['dev', 'producao'], default=CONFIG_PADRAO['modo_estaticos'])
+    args = parser.parse_args()
+
+    config = dict(CONFIG_PADRAO)
+    config.update(vars(args))
+
+    # Threads da requisição + serviços de fundo, por worker
+    os.environ.setdefault('DB_MAX_CONEXOES', str(config['threads'] + 2))
+    # Cada worker recebe só parte das requisições de um cliente
+    os.environ['ADMISSAO_PROCESSOS'] = str(config['workers'])
+
+    print(f"Iniciando servidor SQL de produção em {config['bind']} "
+          f"({config['workers']} workers x {config['threads']} threads)")
+    AplicacaoProducao(config).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Rastreamento das instruções SQL executadas pelo DatabaseManager
+As conexões do pool são ConexaoRastreada: cada instrução é medida (texto,
+parâmetros, linhas e tempo, incluindo a leitura das linhas). As que passam
+do limite vão para um log rotativo junto com o EXPLAIN QUERY PLAN, e cada
+thread acumula um resumo que os servidores devolvem em X-DB-Queries e
+X-DB-Time.
+"""
+import logging
+import logging.handlers
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from metricas import registro
+
+# Só instruções de dados têm plano; PRAGMA, BEGIN e DDL ficam sem EXPLAIN
+PREFIXOS_COM_PLANO = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+INSTRUCOES = registro.contador('ferramentas_db_instrucoes_total', 'Instruções SQL executadas')
+INSTRUCOES_LENTAS = registro.contador('ferramentas_db_instrucoes_lentas_total',
+                                      'Instruções SQL acima do limite do log de consultas lentas')
+
+class _Instrucao:
+    __slots__ = ('cursor', 'sql', 'parametros', 'binds', 'linhas', 'segundos')
+
+    def __init__(self, cursor, sql, parametros, binds, linhas, segundos):
+        self.cursor = cursor
+        self.sql = sql
+        self.parametros = parametros
+        self.binds = binds
+        self.linhas = linhas
+        self.segundos = segundos
+
+def _contar_binds(parametros) -> int:
+    if not parametros:
+        return 0
+    return len(parametros)
+
+class RastreadorSQL:
+    """
+    Mede as instruções de cada thread e registra as lentas
+
+    Um SELECT fica pendente enquanto suas linhas são lidas; ele é concluído
+    quando o cursor se esgota ou é fechado, ou quando a thread executa a
+    instrução seguinte. Só então o tempo total é comparado com `limite_ms`.
+    """
+
+    def __init__(self, limite_ms: float = 200.0, arquivo: str = 'consultas_lentas.log',
+                 max_bytes: int = 5 * 1024 * 1024, backups: int = 3):
+        self.limite = limite_ms / 1000
+        self.arquivo = arquivo
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._local = threading.local()
+        self._log = None
+        self._lock = threading.Lock()
+        self._lentas = 0
+
+    def _estado(self):
+        local = self._local
+        if not hasattr(local, 'pendente'):
+            local.pendente = None
+            local.consultas = 0
+            local.segundos = 0.0
+        return local
+
+    # Chamados pelos cursores
+    def registrar(self, cursor, sql: str, parametros, binds: int, segundos: float):
+        local = self._estado()
+        local.consultas += 1
+        local.segundos += segundos
+        INSTRUCOES.inc()
+        instrucao = _Instrucao(cursor, sql, parametros, binds, 0, segundos)
+        if cursor.description is None:
+            instrucao.linhas = max(cursor.rowcount, 0)
+            self._concluir(instrucao)
+        else:
+            local.pendente = instrucao
+
+    def ler(self, cursor, linhas: int, segundos: float, esgotado: bool):
+        local = self._estado()
+        local.segundos += segundos
+        pendente = local.pendente
+        if pendente is not None and pendente.cursor is cursor:
+            pendente.linhas += linhas
+            pendente.segundos += segundos
+            if esgotado:
+                local.pendente = None
+                self._concluir(pendente)
+
+    def concluir_pendente(self, cursor=None):
+        """Conclui a instrução pendente da thread (só a deste cursor, se informado)"""
+        local = self._estado()
+        pendente = local.pendente
+        if pendente is not None and (cursor is None or pendente.cursor is cursor):
+            local.pendente = None
+            self._concluir(pendente)
+
+    def _concluir(self, instrucao: _Instrucao):
+        if instrucao.segundos < self.limite:
+            return
+        INSTRUCOES_LENTAS.inc()
+        with self._lock:
+            self._lentas += 1
+        try:
+            self._registrar_lenta(instrucao)
+        except Exception as e:
+            print(f"Erro ao registrar consulta lenta: {e}")
+
+    def _registrar_lenta(self, instrucao: _Instrucao):
+        sql = ' '.join(instrucao.sql.split())
+        linhas = [f"{instrucao.segundos * 1000:.1f} ms linhas={instrucao.linhas} binds={instrucao.binds} "
+                  f"thread={threading.current_thread().name}", f"  {sql}"]
+        plano = self.plano(instrucao.cursor.connection, instrucao.sql, instrucao.parametros)
+        linhas.extend(f"    {passo}" for passo in plano)
+        self._obter_log().warning('\n'.join(linhas))
+
+    @staticmethod
+    def plano(conexao: sqlite3.Connection, sql: str, parametros=()) -> list:
+        """EXPLAIN QUERY PLAN da instrução, indentado pela árvore do SQLite"""
+        if not sql.lstrip().upper().startswith(PREFIXOS_COM_PLANO):
+            return []
+        try:
+            # Cursor base: o EXPLAIN não entra no rastreamento
+            cursor = sqlite3.Cursor(conexao)
+            passos = cursor.execute('EXPLAIN QUERY PLAN ' + sql, parametros or ()).fetchall()
+            cursor.close()
+        except sqlite3.Error as e:
+            return [f"(plano indisponível: {e})"]
+        profundidade = {0: 0}
+        resultado = []
+        for id_passo, pai, _, detalhe in passos:
+            profundidade[id_passo] = profundidade.get(pai, 0) + 1
+            resultado.append('  ' * (profundidade[id_passo] - 1) + detalhe)
+        return resultado
+
+    def _obter_log(self) -> logging.Logger:
+        if self._log is None:
+            with self._lock:
+                if self._log is None:
+                    log = logging.getLogger(f'ferramentas.consultas_lentas.{id(self)}')
+                    log.propagate = False
+                    manipulador = logging.handlers.RotatingFileHandler(
+                        self.arquivo, maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8')
+                    manipulador.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                    log.addHandler(manipulador)
+                    self._log = log
+        return self._log
+
+    # Resumo por requisição
+    def iniciar_requisicao(self):
+        """Zera o resumo da thread atual (chamado no início de cada requisição)"""
+        local = self._estado()
+        self.concluir_pendente()
+        local.consultas = 0
+        local.segundos = 0.0
+
+    def resumo(self) -> tuple:
+        """(instruções, segundos) da thread desde iniciar_requisicao()"""
+        self.concluir_pendente()
+        local = self._estado()
+        return local.consultas, local.segundos
+
+    def cabecalhos(self) -> Dict[str, str]:
+        """Resumo da requisição como cabeçalhos X-DB-Queries e X-DB-Time (ms)"""
+        consultas, segundos = self.resumo()
+        return {'X-DB-Queries': str(consultas), 'X-DB-Time': f"{segundos * 1000:.2f}"}
+
+    def fechar(self):
+        with self._lock:
+            if self._log is not None:
+                for manipulador in list(self._log.handlers):
+                    manipulador.close()
+                    self._log.removeHandler(manipulador)
+                self._log = None
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            return {'lentas': self._lentas, 'limite_ms': self.limite * 1000, 'arquivo': self.arquivo}
+
+class CursorRastreado(sqlite3.Cursor):
+    """Cursor que informa ao rastreador da conexão cada execução e leitura"""
+
+    def execute(self, sql, parametros=()):
+        rastreador = self.connection.rastreador
+        if rastreador is None:
+            return super().execute(sql, parametros)
+        rastreador.concluir_pendente()
+        inicio = time.perf_counter()
+        super().execute(sql, parametros)
+        rastreador.registrar(self, sql, parametros, _contar_binds(parametros), time.perf_counter() - inicio)
+        return self
+
+    def executemany(self, sql, sequencia):
+        rastreador = self.connection.rastreador
+        if rastreador is None:
+            return super().executemany(sql, sequencia)
+        if not isinstance(sequencia, (list, tuple)):
+            sequencia = list(sequencia)
+        rastreador.concluir_pendente()
+        inicio = time.perf_counter()
+        super().executemany(sql, sequencia)
+        binds = sum(_contar_binds(p) for p in sequencia)
+        rastreador.registrar(self, sql, sequencia[0] if sequencia else (), binds, time.perf_counter() - inicio)
+        return self
+
+    def executescript(self, script):
+        rastreador = self.connection.rastreador
+        if rastreador is None:
+            return super().executescript(script)
+        rastreador.concluir_pendente()
+        inicio = time.perf_counter()
+        super().executescript(script)
+        rastreador.registrar(self, script, (), 0, time.perf_counter() - inicio)
+        return self
+
+    def _lido(self, linhas: int, inicio: float, esgotado: bool):
+        rastreador = self.connection.rastreador
+        if rastreador is not None:
+            rastreador.ler(self, linhas, time.perf_counter() - inicio, esgotado)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._lido(linha is not None, inicio, linha is None)
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        tamanho = self.arraysize if size is None else size
+        linhas = super().fetchmany(tamanho)
+        self._lido(len(linhas), inicio, len(linhas) < tamanho)
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._lido(len(linhas), inicio, True)
+        return linhas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._lido(0, inicio, True)
+            raise
+        self._lido(1, inicio, False)
+        return linha
+
+    def close(self):
+        rastreador = self.connection.rastreador
+        if rastreador is not None:
+            rastreador.concluir_pendente(self)
+        super().close()
+
+class ConexaoRastreada(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de execute()) são rastreados quando há rastreador"""
+    rastreador: Optional[RastreadorSQL] = None
+
+    def cursor(self, factory=CursorRastreado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+# Rastreador compartilhado (DB_RASTREIO=0 desativa; limite em DB_LIMITE_LENTA_MS)
+rastreador = None
+if os.environ.get('DB_RASTREIO', '1') != '0':
+    rastreador = RastreadorSQL(limite_ms=float(os.environ.get('DB_LIMITE_LENTA_MS', 200)),
+                               arquivo=os.environ.get('DB_LOG_LENTAS', 'consultas_lentas.log'))
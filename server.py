@@ -5,9 +5,20 @@ Servidor HTTP personalizado para desenvolvimento que desabilita cache
 import http.server
 import socketserver
 import os
+import urllib.parse
 from urllib.parse import unquote
+from compressao import ArquivosComprimidos
+from estaticos import AssetsVersionados, MODO_PRODUCAO, enviar_asset, modo_estaticos
+from metricas import HandlerComMetricas
+
+# Versões gzip/br dos arquivos estáticos, preparadas em run_server
+arquivos_comprimidos = ArquivosComprimidos('.')
+
+class NoCacheHTTPRequestHandler(HandlerComMetricas, http.server.SimpleHTTPRequestHandler):
+    nome_servidor = 'server'
+    # AssetsVersionados no modo produção (run_server); None mantém o modo dev sem cache
+    assets = None
 
-class NoCacheHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def end_headers(self):
         # Desabilitar cache para todos os arquivos
         self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -15,14 +26,51 @@ class NoCacheHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Expires', '0')
         super().end_headers()
 
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.enviar_metricas()
+        elif not enviar_asset(self, self.assets) and not self.enviar_estatico_comprimido():
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not enviar_asset(self, self.assets):
+            super().do_HEAD()
+
+    def enviar_estatico_comprimido(self):
+        """Envia a versão pré-comprimida do arquivo, se houver e o cliente aceitar"""
+        path = unquote(urllib.parse.urlsplit(self.path).path)
+        if path.endswith('/'):
+            path += 'index.html'
+        variante = arquivos_comprimidos.variante(path, self.headers.get('Accept-Encoding'))
+        if variante is None:
+            return False
+
+        arquivo, codificacao, corpo = variante
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(arquivo.caminho))
+        self.send_header('Content-Encoding', codificacao)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.send_header('Last-Modified', self.date_time_string(arquivo.mtime))
+        self.end_headers()
+        self.wfile.write(corpo)
+        return True
+
     def log_message(self, format, *args):
         # Log mais limpo
         pass
 
-def run_server(port=8000):
+def run_server(port=8000, modo=None):
+    modo = modo_estaticos(modo)
+    if modo == MODO_PRODUCAO:
+        NoCacheHTTPRequestHandler.assets = AssetsVersionados(os.getcwd()).preparar()
+    print(f"Arquivos estáticos pré-comprimidos: {arquivos_comprimidos.preparar()}")
     with socketserver.TCPServer(("", port), NoCacheHTTPRequestHandler) as httpd:
         print(f"Servidor rodando em http://localhost:{port}")
-        print("Cache desabilitado para desenvolvimento")
+        if modo == MODO_PRODUCAO:
+            print(f"Modo produção: {len(NoCacheHTTPRequestHandler.assets.versoes)} arquivos versionados com cache imutável")
+        else:
+            print("Cache desabilitado para desenvolvimento")
         print("Pressione Ctrl+C para parar")
         try:
             httpd.serve_forever()
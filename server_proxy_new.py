@@ -7,13 +7,24 @@ import http.server
 import socketserver
 import os
 import json
-import urllib.request
 import urllib.parse
 from urllib.parse import unquote
 import sqlite3
 from database_sql import get_db_manager, init_database
+from compressao import ArquivosComprimidos, negociar, tipo_compressivel
+from estaticos import AssetsVersionados, MODO_PRODUCAO, enviar_asset, modo_estaticos
+from cliente_apps_script import ClienteSaturado, TempoEsgotado, get_cliente_apps_script
+from metricas import HandlerComMetricas
+from rastreio_sql import rastreador as rastreador_sql
+
+# Versões gzip/br dos arquivos estáticos, preparadas em run_server
+arquivos_comprimidos = ArquivosComprimidos('.')
+
+class ProxyHTTPRequestHandler(HandlerComMetricas, http.server.SimpleHTTPRequestHandler):
+    nome_servidor = 'server_proxy_new'
+    # AssetsVersionados no modo produção (run_server); None mantém o modo dev sem cache
+    assets = None
 
-class ProxyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def end_headers(self):
         # Desabilitar cache para todos os arquivos
         self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -43,55 +54,90 @@ class ProxyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.handle_google_sheets_proxy()
         elif self.path.startswith('/api/db/'):
             self.handle_db_api()
-        else:
+        elif self.path == '/metrics':
+            self.enviar_metricas()
+        elif not enviar_asset(self, self.assets) and not self.enviar_estatico_comprimido():
             # Serve static files normally
             super().do_GET()
 
+    def do_HEAD(self):
+        if not enviar_asset(self, self.assets):
+            super().do_HEAD()
+
+    def enviar_estatico_comprimido(self):
+        """Envia a versão pré-comprimida do arquivo, se houver e o cliente aceitar"""
+        path = unquote(urllib.parse.urlsplit(self.path).path)
+        if path.endswith('/'):
+            path += 'index.html'
+        variante = arquivos_comprimidos.variante(path, self.headers.get('Accept-Encoding'))
+        if variante is None:
+            return False
+
+        arquivo, codificacao, corpo = variante
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(arquivo.caminho))
+        self.send_header('Content-Encoding', codificacao)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.send_header('Last-Modified', self.date_time_string(arquivo.mtime))
+        self.end_headers()
+        self.wfile.write(corpo)
+        return True
+
+    def enviar_corpo(self, corpo, content_type='application/json'):
+        """Termina os cabeçalhos e envia o corpo, comprimido se grande e o cliente aceitar"""
+        corpo, codificacao = negociar(corpo, content_type, self.headers.get('Accept-Encoding'))
+        self.send_header('Content-Type', content_type)
+        if tipo_compressivel(content_type):
+            self.send_header('Vary', 'Accept-Encoding')
+        if codificacao:
+            self.send_header('Content-Encoding', codificacao)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
     def handle_google_sheets_proxy(self):
         try:
-            # URL do Google Apps Script
-            google_apps_script_url = 'https://script.google.com/macros/s/AKfycbw7_F6_p_cnLGenGmPFbep7zHwdZ5UcAYC1OXLu8Jp7SXrdjU9Nncimkxpuvt8qRw7oBA/exec'
-
-            # Prepare request to Google Apps Script
+            # Shared keep-alive client (connect/read timeouts, bounded concurrency)
+            cliente = get_cliente_apps_script()
             if self.command == 'POST':
                 content_length = int(self.headers.get('Content-Length', 0))
                 post_data = self.rfile.read(content_length) if content_length > 0 else b''
                 # Forward JSON data as-is to Google Apps Script
-                req = urllib.request.Request(google_apps_script_url, data=post_data, method='POST')
-                req.add_header('Content-Type', 'application/json')
+                resposta = cliente.post(post_data)
             else:
                 # GET request
-                req = urllib.request.Request(google_apps_script_url, method='GET')
-
-            # Add headers
-            req.add_header('User-Agent', 'Python-Proxy/1.0')
-
-            # Make request to Google Apps Script
-            with urllib.request.urlopen(req) as response:
-                result = response.read().decode('utf-8')
+                resposta = cliente.get()
+            result = resposta.corpo.decode('utf-8')
 
             # Send response back to client
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
+            self.send_response(resposta.status)
             self.send_header('Access-Control-Allow-Origin', '*')
             self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
             self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With')
-            self.end_headers()
-            self.wfile.write(result.encode('utf-8'))
+            self.enviar_corpo(result.encode('utf-8'))
 
         except Exception as e:
-            # Handle errors
+            # Handle errors: 503 when every client slot is busy, 504 when upstream times out
             error_response = {
                 'error': str(e),
                 'message': 'Erro no proxy para Google Apps Script'
             }
-            self.send_response(500)
+            if isinstance(e, ClienteSaturado):
+                self.send_response(503)
+                self.send_header('Retry-After', '1')
+            elif isinstance(e, TempoEsgotado):
+                self.send_response(504)
+            else:
+                self.send_response(500)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             self.wfile.write(json.dumps(error_response).encode('utf-8'))
 
     def handle_db_api(self):
+        if rastreador_sql is not None:
+            rastreador_sql.iniciar_requisicao()
         try:
             # Initialize database manager
             db = get_db_manager()
@@ -125,28 +171,38 @@ class ProxyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def send_json_response(self, data, status=200):
         """Helper method to send JSON responses"""
         self.send_response(status)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        if rastreador_sql is not None:
+            # Instruções SQL e tempo de banco desta requisição
+            self.send_header('Access-Control-Expose-Headers', 'X-DB-Queries, X-DB-Time')
+            for nome, valor in rastreador_sql.cabecalhos().items():
+                self.send_header(nome, valor)
+        self.enviar_corpo(json.dumps(data).encode('utf-8'))
 
     def log_message(self, format, *args):
         # Log mais limpo - apenas erros
         if "error" in format.lower():
             super().log_message(format, *args)
 
-def run_server(port=8000):
+def run_server(port=8000, modo=None):
+    modo = modo_estaticos(modo)
+    if modo == MODO_PRODUCAO:
+        ProxyHTTPRequestHandler.assets = AssetsVersionados(os.getcwd()).preparar()
     # Initialize database
     try:
         init_database()
     except Exception as e:
         print(f"Aviso: Não foi possível inicializar o banco de dados: {e}")
 
+    print(f"Arquivos estáticos pré-comprimidos: {arquivos_comprimidos.preparar()}")
     with socketserver.TCPServer(("", port), ProxyHTTPRequestHandler) as httpd:
         print(f"Servidor rodando em http://localhost:{port}")
-        print("Cache desabilitado para desenvolvimento")
+        if modo == MODO_PRODUCAO:
+            print(f"Modo produção: {len(ProxyHTTPRequestHandler.assets.versoes)} arquivos versionados com cache imutável")
+        else:
+            print("Cache desabilitado para desenvolvimento")
         print("Proxy CORS para Google Apps Script habilitado em /api/google-sheets")
         print("API de banco de dados habilitada em /api/db/")
         print("Visualizador de BD: http://localhost:8000/db-viewer")
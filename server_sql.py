@@ -3,18 +3,32 @@
 Servidor Flask com integração ao banco de dados SQL
 Fornece API REST para o sistema de gestão de ferramentas
 """
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
+import functools
 import json
 import os
-from database_sql import get_db_manager, init_database
+import time
+from urllib.parse import urlencode
+from database_sql import (get_db_manager, init_database, serializar_registros,
+                          Solicitante, Ferramenta, Movimentacao)
+from backup_sql import GerenciadorBackup
+from atrasos_sql import VerificadorAtrasos
+from fila_emails import FilaEmails
+from cache_respostas import CacheRespostas
+from compressao import (ArquivosComprimidos, TAMANHO_MINIMO, escolher_codificacao,
+                        negociar, tipo_compressivel)
+from estaticos import AssetsVersionados, MODO_PRODUCAO, modo_estaticos
+from cliente_apps_script import ClienteSaturado, TempoEsgotado, get_cliente_apps_script
+from eventos_sql import HubEventos
+from metricas import (CONTENT_TYPE as CONTENT_TYPE_METRICAS, DURACAO_HTTP, EM_ANDAMENTO, REQUISICOES,
+                      exportar_metricas)
+from rastreio_sql import rastreador as rastreador_sql
+from admissao import AdmissaoRecusada, get_controle_admissao
 from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 app = Flask(__name__)
-CORS(app)  # Habilita CORS para todas as rotas
+CORS(app, expose_headers=['X-DB-Queries', 'X-DB-Time'])  # Habilita CORS para todas as rotas
 
 # Inicializa o banco de dados
 db_manager = None
@@ -25,57 +39,340 @@ def get_db():
         db_manager = init_database()
     return db_manager
 
+@app.teardown_request
+def liberar_conexao_db(exc):
+    """Devolve ao pool a conexão usada pela requisição"""
+    if db_manager is not None:
+        db_manager.liberar_conexao()
+
+# Métricas por requisição; a rota é o padrão do Flask (/api/ferramentas/<int:id>)
+@app.before_request
+def iniciar_metricas():
+    g.inicio_metricas = time.perf_counter()
+    EM_ANDAMENTO.rotulos('server_sql').inc()
+
+@app.after_request
+def registrar_metricas(resposta):
+    inicio = g.get('inicio_metricas')
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule is not None else 'nao_encontrada'
+        DURACAO_HTTP.observar('server_sql', request.method, rota, valor=time.perf_counter() - inicio)
+        REQUISICOES.inc('server_sql', request.method, rota, str(resposta.status_code))
+    return resposta
+
+# Resumo das instruções SQL da requisição (consultas lentas vão para consultas_lentas.log)
+@app.before_request
+def iniciar_rastreio_sql():
+    if rastreador_sql is not None:
+        rastreador_sql.iniciar_requisicao()
+
+@app.after_request
+def resumo_rastreio_sql(resposta):
+    """X-DB-Queries e X-DB-Time (ms): instruções e tempo de banco desta requisição"""
+    if rastreador_sql is not None:
+        resposta.headers.update(rastreador_sql.cabecalhos())
+    return resposta
+
+@app.teardown_request
+def encerrar_metricas(exc):
+    if g.pop('inicio_metricas', None) is not None:
+        EM_ANDAMENTO.rotulos('server_sql').dec()
+
+# Limite por cliente e rota e fila de escritas (ver admissao.py; ADMISSAO=0 desativa)
+controle_admissao = get_controle_admissao()
+
+@app.before_request
+def admitir_requisicao():
+    """Recusa com 429 e Retry-After quem passou do limite ou quando a fila de escritas está cheia"""
+    if controle_admissao is None:
+        return None
+    rota = request.url_rule.rule if request.url_rule is not None else None
+    try:
+        g.fila_admissao = controle_admissao.admitir(request.remote_addr, request.method, request.path, rota)
+    except AdmissaoRecusada as e:
+        return jsonify({'success': False, 'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    return None
+
+@app.teardown_request
+def liberar_admissao(exc):
+    fila = g.pop('fila_admissao', None)
+    if fila is not None:
+        fila.sair()
+
+# Configurações de backup (intervalo_horas=None desativa o backup automático)
+BACKUP_CONFIG = {
+    'diretorio': 'backups',
+    'comprimir': True,
+    'paginas_por_passo': 256,
+    'manter_diarios': 7,
+    'manter_semanais': 4,
+    'intervalo_horas': None
+}
+
+gerenciador_backup = None
+
+def get_backup():
+    """Gerenciador de backup deste processo (agendado só em iniciar_servicos()); trava e status ficam no diretório"""
+    global gerenciador_backup
+    if gerenciador_backup is None:
+        gerenciador_backup = GerenciadorBackup(
+            get_db(),
+            diretorio=BACKUP_CONFIG['diretorio'],
+            comprimir=BACKUP_CONFIG['comprimir'],
+            paginas_por_passo=BACKUP_CONFIG['paginas_por_passo'],
+            manter_diarios=BACKUP_CONFIG['manter_diarios'],
+            manter_semanais=BACKUP_CONFIG['manter_semanais']
+        )
+    return gerenciador_backup
+
 # Configurações de e-mail (ajuste conforme necessário)
 EMAIL_CONFIG = {
     'smtp_server': 'smtp.gmail.com',
     'smtp_port': 587,
+    'usar_tls': True,
     'username': 'seu_email@gmail.com',  # Substitua pelo seu e-mail
     'password': 'sua_senha_app',        # Substitua pela senha do app
     'from_email': 'seu_email@gmail.com'
 }
 
+fila_emails = None
+
+def get_fila_emails():
+    """Fila de e-mails deste processo; a thread de envio só começa em iniciar_servicos()"""
+    global fila_emails
+    if fila_emails is None:
+        fila_emails = FilaEmails(get_db(), EMAIL_CONFIG)
+    return fila_emails
+
 def enviar_email_notificacao(destinatario, assunto, mensagem):
-    """Envia e-mail de notificação"""
+    """Coloca o e-mail na fila de envio; a thread da fila entrega em segundo plano"""
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_CONFIG['from_email']
-        msg['To'] = destinatario
-        msg['Subject'] = assunto
+        get_db().enfileirar_email(destinatario, assunto, mensagem)
+        # Só acorda a thread se ela roda neste processo; nos outros o e-mail sai no próximo intervalo
+        if fila_emails is not None:
+            fila_emails.avisar()
+        return True
+    except Exception as e:
+        print(f"Erro ao enfileirar e-mail: {e}")
+        return False
 
-        msg.attach(MIMEText(mensagem, 'html'))
+# Verificação de empréstimos em atraso (intervalo_minutos=None desativa a verificação automática)
+ATRASOS_CONFIG = {
+    'intervalo_minutos': 15,
+    'tamanho_lote': 200
+}
 
-        server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
-        server.starttls()
-        server.login(EMAIL_CONFIG['username'], EMAIL_CONFIG['password'])
-        text = msg.as_string()
-        server.sendmail(EMAIL_CONFIG['from_email'], destinatario, text)
-        server.quit()
+verificador_atrasos = None
 
-        print(f"E-mail enviado para {destinatario}")
+def notificar_atraso(movimentacao):
+    """Avisa por e-mail o solicitante de uma saída vencida"""
+    if not movimentacao.get('email_notificacao'):
         return True
-    except Exception as e:
-        print(f"Erro ao enviar e-mail: {e}")
-        return False
+
+    assunto = f"Ferramenta em atraso: {movimentacao['ferramenta_nome']}"
+    mensagem = f"""
+    <h3>Devolução de Ferramenta em Atraso</h3>
+    <p><strong>Ferramenta:</strong> {movimentacao['ferramenta_nome']}</p>
+    <p><strong>Solicitante:</strong> {movimentacao['solicitante_nome']}</p>
+    <p><strong>Data de Saída:</strong> {movimentacao.get('data_saida') or 'N/A'}</p>
+    <p><strong>Devolução prevista:</strong> {movimentacao['vencimento']}</p>
+    """
+    return enviar_email_notificacao(movimentacao['email_notificacao'], assunto, mensagem)
+
+def get_verificador_atrasos():
+    """Verificador de atrasos deste processo; o agendamento só começa em iniciar_servicos()"""
+    global verificador_atrasos
+    if verificador_atrasos is None:
+        verificador_atrasos = VerificadorAtrasos(get_db(), notificar_atraso,
+                                                 tamanho_lote=ATRASOS_CONFIG['tamanho_lote'])
+    return verificador_atrasos
+
+def iniciar_servicos():
+    """
+    Inicia os serviços de fundo: envio de e-mails, verificação de atrasos e backup agendado
+
+    Deve rodar em um único processo (o worker com a trava de serviços no
+    producao_sql); as rotas só enfileiram, leem o status ou acordam o serviço.
+    """
+    get_fila_emails().iniciar()
+    if ATRASOS_CONFIG['intervalo_minutos']:
+        get_verificador_atrasos().agendar(ATRASOS_CONFIG['intervalo_minutos'] * 60)
+    if BACKUP_CONFIG['intervalo_horas']:
+        get_backup().agendar(BACKUP_CONFIG['intervalo_horas'] * 3600)
+
+# Feed de alterações por SSE em porta própria (porta=None desativa)
+EVENTOS_CONFIG = {
+    'porta': 8001,
+    'intervalo_segundos': 0.25,
+    'max_assinantes': 2000
+}
+
+hub_eventos = None
+
+def get_hub_eventos():
+    global hub_eventos
+    if hub_eventos is None and EVENTOS_CONFIG['porta']:
+        hub_eventos = HubEventos(get_db(), porta=EVENTOS_CONFIG['porta'],
+                                 intervalo=EVENTOS_CONFIG['intervalo_segundos'],
+                                 max_assinantes=EVENTOS_CONFIG['max_assinantes'])
+        hub_eventos.iniciar()
+    return hub_eventos
+
+@app.after_request
+def avisar_hub_eventos(resposta):
+    """Após uma escrita, o hub lê o log na hora em vez de esperar o intervalo"""
+    if hub_eventos is not None and request.method in ('POST', 'PUT', 'DELETE') and resposta.status_code < 400:
+        hub_eventos.avisar()
+    return resposta
+
+def formato_compacto():
+    """Indica se o cliente pediu a resposta colunar (?formato=compacto)"""
+    return request.args.get('formato') == 'compacto'
+
+def resposta_compacta(registros, tipo, **extras):
+    """Responde com registros serializados direto para JSON, sem dict por linha"""
+    corpo = serializar_registros(registros, tipo, success=True, **extras)
+    return Response(corpo, mimetype='application/json')
+
+def obter_registros_lote(data):
+    """Extrai a lista de registros do corpo de uma requisição em lote"""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and isinstance(data.get('registros'), list):
+        return data['registros']
+    raise ValueError("Envie uma lista de registros ou {'registros': [...]}")
+
+# Cache de respostas GET, invalidado pelas versões das tabelas (versoes_tabelas)
+cache_respostas = CacheRespostas()
+
+def em_cache(*tabelas):
+    """
+    Guarda em cache as respostas GET 200 da rota enquanto `tabelas` não mudarem
+
+    A chave é a rota + query string (parâmetros ordenados). Toda resposta
+    leva um ETag forte; If-None-Match igual responde 304 sem corpo.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def rota(*args, **kwargs):
+            if request.method != 'GET':
+                return funcao(*args, **kwargs)
+
+            chave = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+            versoes = get_db().versoes_tabelas(tabelas)
+            entrada = cache_respostas.obter(chave, versoes)
+            do_cache = entrada is not None
+            if entrada is None:
+                resposta = app.make_response(funcao(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+                entrada = cache_respostas.guardar(chave, versoes, resposta.get_data(), resposta.mimetype)
+
+            codificacao = None
+            cabecalhos = {'Cache-Control': 'no-cache'}
+            if tipo_compressivel(entrada.mimetype):
+                cabecalhos['Vary'] = 'Accept-Encoding'
+                if len(entrada.corpo) >= TAMANHO_MINIMO:
+                    codificacao = escolher_codificacao(request.headers.get('Accept-Encoding'))
+            etag = cache_respostas.etag_codificado(entrada, codificacao)
+            cabecalhos['ETag'] = etag
+
+            nao_modificado = request.if_none_match.contains(etag.strip('"'))
+            cache_respostas.registrar_envio(entrada, nao_modificado, do_cache)
+            if nao_modificado:
+                return Response(status=304, headers=cabecalhos)
+            if codificacao:
+                cabecalhos['Content-Encoding'] = codificacao
+            corpo = cache_respostas.corpo_codificado(chave, entrada, codificacao)
+            return Response(corpo, mimetype=entrada.mimetype, headers=cabecalhos)
+        return rota
+    return decorador
+
+# Versões gzip/br dos arquivos estáticos, preparadas na inicialização
+arquivos_comprimidos = ArquivosComprimidos('.')
+
+# Arquivos versionados servidos da memória no modo produção; None no modo dev
+assets_versionados = None
+
+def preparar_estaticos(modo=None):
+    """Prepara os estáticos conforme o modo ('dev', 'producao' ou MODO_ESTATICOS)"""
+    global assets_versionados
+    if modo_estaticos(modo) == MODO_PRODUCAO:
+        assets_versionados = AssetsVersionados('.').preparar()
+        return f"modo produção, {len(assets_versionados.versoes)} arquivos versionados"
+    assets_versionados = None
+    return f"modo dev, {arquivos_comprimidos.preparar()} arquivos pré-comprimidos"
+
+@app.after_request
+def comprimir_resposta(resposta):
+    """Comprime na hora respostas JSON/texto acima de TAMANHO_MINIMO"""
+    if (resposta.status_code != 200 or resposta.direct_passthrough or resposta.is_streamed
+            or 'Content-Encoding' in resposta.headers or not tipo_compressivel(resposta.mimetype)):
+        return resposta
+
+    resposta.vary.add('Accept-Encoding')
+    corpo, codificacao = negociar(resposta.get_data(), resposta.mimetype,
+                                  request.headers.get('Accept-Encoding'))
+    if codificacao:
+        resposta.set_data(corpo)
+        resposta.headers['Content-Encoding'] = codificacao
+    return resposta
+
+def resposta_asset(asset):
+    """Responde com um asset da memória (cache imutável para os versionados)"""
+    corpo, codificacao, etag = asset.representacao(request.headers.get('Accept-Encoding'))
+    cabecalhos = {'ETag': etag, 'Cache-Control': asset.cache_control}
+    if asset.variantes:
+        cabecalhos['Vary'] = 'Accept-Encoding'
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers=cabecalhos)
+    if codificacao:
+        cabecalhos['Content-Encoding'] = codificacao
+    return Response(corpo, mimetype=asset.mimetype, headers=cabecalhos)
+
+def enviar_estatico(filename):
+    """Serve um arquivo estático, usando a versão pré-comprimida quando o cliente aceita"""
+    if assets_versionados is not None:
+        asset = assets_versionados.obter(filename)
+        if asset is not None:
+            return resposta_asset(asset)
+
+    variante = arquivos_comprimidos.variante(filename, request.headers.get('Accept-Encoding'))
+    if variante is None:
+        resposta = send_from_directory('.', filename)
+        if tipo_compressivel(resposta.mimetype):
+            resposta.vary.add('Accept-Encoding')
+        return resposta
+
+    arquivo, codificacao, corpo = variante
+    resposta = Response(corpo, mimetype=arquivo.mimetype)
+    resposta.headers['Content-Encoding'] = codificacao
+    resposta.vary.add('Accept-Encoding')
+    resposta.last_modified = arquivo.mtime
+    return resposta.make_conditional(request)
 
 @app.route('/')
 def index():
     """Serve o arquivo index.html"""
-    return send_from_directory('.', 'index.html')
+    return enviar_estatico('index.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve arquivos estáticos"""
-    return send_from_directory('.', filename)
+    return enviar_estatico(filename)
 
 # API Routes
 
 @app.route('/api/solicitantes', methods=['GET', 'POST'])
+@em_cache('solicitantes')
 def handle_solicitantes():
     """Gerencia solicitantes"""
     db = get_db()
 
     if request.method == 'GET':
         try:
+            if formato_compacto():
+                return resposta_compacta(db.obter_solicitantes(como_registros=True), Solicitante)
             solicitantes = db.obter_solicitantes()
             return jsonify({'success': True, 'data': solicitantes})
         except Exception as e:
@@ -94,6 +391,20 @@ def handle_solicitantes():
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/solicitantes/batch', methods=['POST'])
+def handle_solicitantes_batch():
+    """Adiciona vários solicitantes em uma única transação"""
+    db = get_db()
+
+    try:
+        registros = obter_registros_lote(request.get_json())
+        ids = db.adicionar_solicitantes_lote(registros)
+        return jsonify({'success': True, 'ids': ids, 'message': f'{len(ids)} solicitantes adicionados com sucesso'})
+    except (ValueError, KeyError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/solicitantes/<int:id>', methods=['PUT', 'DELETE'])
 def handle_solicitante(id):
     """Gerencia solicitante específico"""
@@ -129,12 +440,15 @@ def handle_solicitante(id):
 
 
 @app.route('/api/ferramentas', methods=['GET', 'POST'])
+@em_cache('ferramentas')
 def handle_ferramentas():
     """Gerencia ferramentas"""
     db = get_db()
 
     if request.method == 'GET':
         try:
+            if formato_compacto():
+                return resposta_compacta(db.obter_ferramentas(como_registros=True), Ferramenta)
             ferramentas = db.obter_ferramentas()
             return jsonify({'success': True, 'data': ferramentas})
         except Exception as e:
@@ -151,6 +465,20 @@ def handle_ferramentas():
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ferramentas/batch', methods=['POST'])
+def handle_ferramentas_batch():
+    """Adiciona várias ferramentas em uma única transação"""
+    db = get_db()
+
+    try:
+        registros = obter_registros_lote(request.get_json())
+        ids = db.adicionar_ferramentas_lote(registros)
+        return jsonify({'success': True, 'ids': ids, 'message': f'{len(ids)} ferramentas adicionadas com sucesso'})
+    except (ValueError, KeyError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/ferramentas/<int:id>', methods=['PUT', 'DELETE'])
 def handle_ferramenta(id):
     """Gerencia ferramenta específica"""
@@ -181,16 +509,87 @@ def handle_ferramenta(id):
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/patrimonios', methods=['POST'])
+def handle_patrimonios():
+    """Cadastra um patrimônio de uma ferramenta"""
+    db = get_db()
+
+    try:
+        data = request.get_json()
+        codigo = db.adicionar_patrimonio(data['codigo'], data['ferramenta_id'])
+        return jsonify({'success': True, 'codigo': codigo, 'message': 'Patrimônio adicionado com sucesso'})
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f'Campo obrigatório: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/patrimonios/<codigo>', methods=['GET', 'DELETE'])
+@em_cache('patrimonios', 'ferramentas', 'solicitantes')
+def handle_patrimonio(codigo):
+    """Consulta (com o solicitante atual) ou remove um patrimônio"""
+    db = get_db()
+
+    try:
+        if request.method == 'GET':
+            patrimonio = db.obter_patrimonio(codigo)
+            if patrimonio:
+                return jsonify({'success': True, 'data': patrimonio})
+        elif db.remover_patrimonio(codigo):
+            return jsonify({'success': True, 'message': 'Patrimônio removido com sucesso'})
+        return jsonify({'success': False, 'error': 'Patrimônio não encontrado'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ferramentas/<int:id>/patrimonios', methods=['GET'])
+@em_cache('patrimonios', 'ferramentas', 'solicitantes')
+def get_patrimonios_ferramenta(id):
+    """Lista os patrimônios de uma ferramenta (?livres=1 para apenas os disponíveis)"""
+    db = get_db()
+
+    try:
+        somente_livres = request.args.get('livres') in ('1', 'true', 'sim')
+        patrimonios = db.obter_patrimonios_ferramenta(id, somente_livres=somente_livres)
+        return jsonify({'success': True, 'data': patrimonios})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/solicitantes/<int:id>/patrimonios', methods=['GET'])
+@em_cache('patrimonios', 'ferramentas', 'solicitantes')
+def get_patrimonios_solicitante(id):
+    """Lista os patrimônios que estão com um solicitante"""
+    db = get_db()
+
+    try:
+        return jsonify({'success': True, 'data': db.obter_patrimonios_solicitante(id)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/movimentacoes', methods=['GET', 'POST'])
+@em_cache('movimentacoes', 'ferramentas', 'solicitantes')
 def handle_movimentacoes():
     """Gerencia movimentações"""
     db = get_db()
 
     if request.method == 'GET':
         try:
-            status = request.args.get('status')
-            movimentacoes = db.obter_movimentacoes(status=status)
-            return jsonify({'success': True, 'data': movimentacoes})
+            limite = min(request.args.get('limit', 100, type=int), 1000)
+            pagina = db.obter_movimentacoes_pagina(
+                limite=max(limite, 1),
+                cursor=request.args.get('cursor'),
+                status=request.args.get('status'),
+                tipo=request.args.get('tipo'),
+                solicitante_id=request.args.get('solicitante_id', type=int),
+                ferramenta_id=request.args.get('ferramenta_id', type=int),
+                data_inicio=request.args.get('data_inicio'),
+                data_fim=request.args.get('data_fim'),
+                incluir_historico=request.args.get('historico') in ('1', 'true', 'sim'),
+                como_registros=formato_compacto()
+            )
+            if formato_compacto():
+                return resposta_compacta(pagina['data'], Movimentacao, next_cursor=pagina['next_cursor'])
+            return jsonify({'success': True, 'data': pagina['data'], 'next_cursor': pagina['next_cursor']})
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -208,8 +607,8 @@ def handle_movimentacoes():
                 hora_devolucao=data.get('horaDevolucao'),
                 tem_retorno=data.get('temRetorno', 'Sim'),
                 observacoes=data.get('observacoes'),
-                projeto_id=data.get('projeto_id'),
-                email_notificacao=data.get('emailNotificacao')
+                email_notificacao=data.get('emailNotificacao'),
+                patrimonio=data.get('patrimonio')
             )
 
             # Envia e-mail de notificação se fornecido
@@ -226,10 +625,48 @@ def handle_movimentacoes():
                 """
                 enviar_email_notificacao(data['emailNotificacao'], assunto, mensagem)
 
-            return jsonify({'success': True, 'id': movimentacao_id, 'message': 'Movimentação registrada e e-mail enviado'})
+            return jsonify({'success': True, 'id': movimentacao_id, 'message': 'Movimentação registrada'})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/movimentacoes/batch', methods=['POST'])
+def handle_movimentacoes_batch():
+    """Adiciona várias movimentações em uma única transação"""
+    db = get_db()
+
+    try:
+        registros = [{
+            'tipo': data['tipo'],
+            'solicitante_id': data['solicitante_id'],
+            'ferramenta_id': data['ferramenta_id'],
+            'data_saida': data.get('dataSaida'),
+            'data_retorno': data.get('dataRetorno'),
+            'hora_devolucao': data.get('horaDevolucao'),
+            'tem_retorno': data.get('temRetorno', 'Sim'),
+            'observacoes': data.get('observacoes'),
+            'email_notificacao': data.get('emailNotificacao'),
+            'patrimonio': data.get('patrimonio')
+        } for data in obter_registros_lote(request.get_json())]
+        ids = db.adicionar_movimentacoes_lote(registros)
+        return jsonify({'success': True, 'ids': ids, 'message': f'{len(ids)} movimentações registradas com sucesso'})
+    except (ValueError, KeyError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/movimentacoes/atrasadas', methods=['GET'])
+def get_movimentacoes_atrasadas():
+    """Retorna as saídas ativas com devolução prevista já vencida"""
+    db = get_db()
+
+    try:
+        limite = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+        atrasadas = db.obter_movimentacoes_atrasadas(limite=limite)
+        return jsonify({'success': True, 'data': atrasadas,
+                        'verificacao': get_verificador_atrasos().status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/movimentacoes/<int:id>', methods=['PUT'])
 def handle_movimentacao(id):
     """Atualiza movimentação específica"""
@@ -242,6 +679,8 @@ def handle_movimentacao(id):
             return jsonify({'success': True, 'message': 'Movimentação atualizada com sucesso'})
         else:
             return jsonify({'success': False, 'error': 'Movimentação não encontrada'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -260,6 +699,7 @@ def concluir_movimentacao(id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/estatisticas', methods=['GET'])
+@em_cache('movimentacoes', 'ferramentas', 'solicitantes')
 def get_estatisticas():
     """Retorna estatísticas do sistema"""
     db = get_db()
@@ -270,55 +710,115 @@ def get_estatisticas():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/uso', methods=['GET'])
+def get_uso():
+    """Retorna o uso por ferramenta/solicitante/dia a partir dos agregados diários"""
+    db = get_db()
+
+    try:
+        if request.args.get('inicio') and request.args.get('fim'):
+            periodo = (request.args['inicio'], request.args['fim'])
+        else:
+            periodo = max(request.args.get('dias', 30, type=int), 1)
+        uso = db.obter_uso(periodo, request.args.get('agrupamento', 'ferramenta'))
+        return jsonify({'success': True, 'data': uso})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/alteracoes', methods=['GET'])
+def get_alteracoes():
+    """Retorna as alterações registradas após o checkpoint ?desde=<seq>"""
+    db = get_db()
+
+    try:
+        desde = request.args.get('desde', 0, type=int)
+        limite = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+        resultado = db.obter_alteracoes(desde=desde, limite=limite)
+        return jsonify({'success': True, **resultado})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/eventos/status', methods=['GET'])
+def get_eventos_status():
+    """Retorna assinantes conectados e eventos publicados pelo feed SSE"""
+    if hub_eventos is None:
+        return jsonify({'success': True, 'data': None, 'message': 'Feed de eventos não iniciado neste processo'})
+    return jsonify({'success': True, 'data': hub_eventos.status()})
+
 @app.route('/api/google-sheets', methods=['POST'])
 def proxy_google_sheets():
     """Proxy para Google Sheets (mantém compatibilidade)"""
     try:
-        import urllib.request
-        import json
-
-        # URL do Google Apps Script
-        google_apps_url = "https://script.google.com/macros/s/AKfycbw7_F6_p_cnLGenGmPFbep7zHwdZ5UcAYC1OXLu8Jp7SXrdjU9Nncimkxpuvt8qRw7oBA/exec"
-
         # Obtém dados da requisição
         data = request.get_json()
         if not data:
             return jsonify({'success': False, 'error': 'Dados JSON necessários'}), 400
 
-        # Converte para JSON string
-        json_data = json.dumps(data).encode('utf-8')
-
-        # Cria requisição para Google Apps Script
-        req = urllib.request.Request(google_apps_url, data=json_data, method='POST')
-        req.add_header('Content-Type', 'application/json')
-
-        # Faz a requisição
-        with urllib.request.urlopen(req) as response:
-            result = response.read().decode('utf-8')
+        # Encaminha pelo cliente compartilhado (keep-alive, timeouts, concorrência limitada)
+        resposta = get_cliente_apps_script().post(json.dumps(data).encode('utf-8'))
 
         # Retorna resposta do Google Apps Script
-        return result, response.getcode(), {'Content-Type': 'application/json'}
+        return resposta.corpo, resposta.status, {'Content-Type': 'application/json'}
 
+    except ClienteSaturado as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '1'}
+    except TempoEsgotado as e:
+        print(f"Timeout no proxy Google Sheets: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 504
     except Exception as e:
         print(f"Erro no proxy Google Sheets: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/google-sheets/status', methods=['GET'])
+def get_google_sheets_status():
+    """Retorna conexões, latência média, timeouts e recusas do cliente do Apps Script"""
+    return jsonify({'success': True, 'data': get_cliente_apps_script().estatisticas()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metricas():
+    """Métricas no formato texto do Prometheus (somadas entre os workers no producao_sql)"""
+    return Response(exportar_metricas(), content_type=CONTENT_TYPE_METRICAS)
+
+@app.route('/api/admissao/status', methods=['GET'])
+def get_admissao_status():
+    """Retorna as recusas por regra e a ocupação das filas do controle de admissão"""
+    if controle_admissao is None:
+        return jsonify({'success': True, 'data': None, 'message': 'Controle de admissão desativado (ADMISSAO=0)'})
+    return jsonify({'success': True, 'data': controle_admissao.estatisticas()})
+
+@app.route('/api/cache/status', methods=['GET'])
+def get_cache_status():
+    """Retorna a taxa de acerto e os bytes economizados pelo cache de respostas"""
+    return jsonify({'success': True, 'data': cache_respostas.estatisticas()})
+
 @app.route('/api/backup', methods=['POST'])
 def criar_backup():
-    """Cria backup do banco de dados"""
+    """Inicia um backup do banco de dados em segundo plano (409 se qualquer worker já estiver fazendo um)"""
     try:
-        db = get_db()
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = f'backup_ferramentas_{timestamp}.db'
-        db.backup_database(backup_path)
-        return jsonify({'success': True, 'message': f'Backup criado: {backup_path}'})
+        backup = get_backup()
+        if not backup.iniciar():
+            return jsonify({'success': False, 'error': 'Já existe um backup em andamento',
+                            'status': backup.status()}), 409
+        status = backup.status()
+        return jsonify({'success': True, 'message': f"Backup iniciado: {status['arquivo']}",
+                        'status': status}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/backup/status', methods=['GET'])
+def status_backup():
+    """Retorna o progresso do backup atual ou o resultado do último"""
+    try:
+        return jsonify({'success': True, 'status': get_backup().status()})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/db-viewer')
 def db_viewer():
     """Serve a página do visualizador de banco de dados"""
-    return send_from_directory('.', 'db_viewer.html')
+    return enviar_estatico('db_viewer.html')
 
 @app.route('/api/db/tables', methods=['GET'])
 def get_db_tables():
@@ -349,7 +849,14 @@ def get_table_data(table_name):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
-    print("Iniciando servidor Flask com banco de dados SQL...")
+    print("Iniciando servidor Flask com banco de dados SQL (desenvolvimento)...")
+    print("Para produção use: python producao_sql.py --workers 4 --threads 8")
     print("Acesse: http://localhost:8000")
     print("Visualizador de BD: http://localhost:8000/db-viewer")
+    print(f"Arquivos estáticos: {preparar_estaticos()}")
+    # Com o reloader do debug, só o processo filho roda os serviços de fundo e abre a porta do feed
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        iniciar_servicos()
+        if get_hub_eventos():
+            print(f"Feed de alterações (SSE): http://localhost:{hub_eventos.porta}/eventos")
     app.run(host='0.0.0.0', port=8000, debug=True)
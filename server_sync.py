@@ -14,7 +14,19 @@ from datetime import datetime
 # Adicionar o diretório atual ao path para importar módulos locais
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-class DataSyncHandler(http.server.BaseHTTPRequestHandler):
+from compressao import ArquivosComprimidos, negociar, tipo_compressivel
+from estaticos import AssetsVersionados, MODO_PRODUCAO, enviar_asset, modo_estaticos
+from metricas import HandlerComMetricas
+from admissao import HandlerComAdmissao, get_controle_admissao
+
+# Versões gzip/br dos arquivos estáticos, preparadas em run_server
+arquivos_comprimidos = ArquivosComprimidos(os.path.dirname(os.path.abspath(__file__)))
+
+class DataSyncHandler(HandlerComAdmissao, HandlerComMetricas, http.server.BaseHTTPRequestHandler):
+    nome_servidor = 'server_sync'
+    # AssetsVersionados no modo produção (run_server); None mantém o modo dev sem cache
+    assets = None
+
     def do_GET(self):
         if self.path.startswith('/api/sync'):
             self.handle_sync()
@@ -22,6 +34,8 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
             self.handle_generate_sync_excel()
         elif self.path.startswith('/api/sync_google_sheets'):
             self.handle_sync_google_sheets()
+        elif self.path == '/metrics':
+            self.enviar_metricas()
         else:
             # Servir arquivos estáticos
             self.serve_static()
@@ -93,12 +107,10 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
                 'timestamp': datetime.now().isoformat()
             }
 
-            # Send response
+            # Send response (JSON compacto; comprimido se o cliente aceitar)
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(data, indent=2).encode())
+            self.enviar_corpo(json.dumps(data).encode(), 'application/json')
 
         except Exception as e:
             self.send_error(500, f"Erro interno: {str(e)}")
@@ -200,6 +212,9 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
 
     def serve_static(self):
         try:
+            if enviar_asset(self, self.assets):
+                return
+
             # Get the file path
             path = self.path
             if path == '/':
@@ -226,33 +241,64 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
                     content_type = 'text/plain'
 
                 self.send_response(200)
-                self.send_header('Content-type', content_type)
                 # Disable cache for development
                 self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
                 self.send_header('Pragma', 'no-cache')
                 self.send_header('Expires', '0')
-                self.end_headers()
+
+                variante = arquivos_comprimidos.variante(path, self.headers.get('Accept-Encoding'))
+                if variante is not None:
+                    _, codificacao, corpo = variante
+                    self.enviar_corpo(corpo, content_type, codificacao)
+                    return
 
                 with open(filepath, 'rb') as f:
-                    self.wfile.write(f.read())
+                    self.enviar_corpo(f.read(), content_type)
             else:
                 self.send_error(404, "Arquivo não encontrado")
 
         except Exception as e:
             self.send_error(500, f"Erro interno: {str(e)}")
 
+    def enviar_corpo(self, corpo, content_type, codificacao=None):
+        """
+        Termina os cabeçalhos e envia o corpo
+
+        Sem `codificacao` (corpo já comprimido), comprime corpos de texto/JSON
+        acima do tamanho mínimo conforme o Accept-Encoding do cliente.
+        """
+        if codificacao is None:
+            corpo, codificacao = negociar(corpo, content_type, self.headers.get('Accept-Encoding'))
+        self.send_header('Content-type', content_type)
+        if tipo_compressivel(content_type):
+            self.send_header('Vary', 'Accept-Encoding')
+        if codificacao:
+            self.send_header('Content-Encoding', codificacao)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
     def log_message(self, format, *args):
         # Log mais limpo - apenas requests de API
         if self.path.startswith('/api/'):
             print(f"{self.address_string()} - {self.path}")
 
-def run_server(port=8000):
+def run_server(port=8000, modo=None):
+    # Limites por cliente (VBA, navegador) e orçamento próprio para o Excel
+    DataSyncHandler.controle_admissao = get_controle_admissao()
+    modo = modo_estaticos(modo)
+    if modo == MODO_PRODUCAO:
+        DataSyncHandler.assets = AssetsVersionados(os.path.dirname(os.path.abspath(__file__))).preparar()
+    print(f"Arquivos estáticos pré-comprimidos: {arquivos_comprimidos.preparar()}")
     with socketserver.TCPServer(("", port), DataSyncHandler) as httpd:
         print(f"Servidor rodando em http://localhost:{port}")
         print("API de sincronização disponível em /api/sync")
         print("Geração de Excel sincronizado em /api/generate_sync_excel")
         print("Sincronização com Google Sheets em /api/sync_google_sheets")
-        print("Cache desabilitado para desenvolvimento")
+        if modo == MODO_PRODUCAO:
+            print(f"Modo produção: {len(DataSyncHandler.assets.versoes)} arquivos versionados com cache imutável")
+        else:
+            print("Cache desabilitado para desenvolvimento")
         print("Pressione Ctrl+C para parar")
         try:
             httpd.serve_forever()
@@ -14,7 +14,16 @@ from datetime import datetime
 # Adicionar o diretório atual ao path para importar módulos locais
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-class DataSyncHandler(http.server.BaseHTTPRequestHandler):
+from metricas import HandlerComMetricas
+from admissao import HandlerComAdmissao, get_controle_admissao
+from compressao import ArquivosComprimidos, negociar, tipo_compressivel
+
+# Versões gzip/br dos arquivos estáticos, preparadas em run_server
+arquivos_comprimidos = ArquivosComprimidos(os.path.dirname(os.path.abspath(__file__)))
+
+class DataSyncHandler(HandlerComAdmissao, HandlerComMetricas, http.server.BaseHTTPRequestHandler):
+    nome_servidor = 'server_sync_fixed'
+
     def do_GET(self):
         if self.path.startswith('/api/sync'):
             self.handle_sync()
@@ -22,6 +31,8 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
             self.handle_generate_sync_excel()
         elif self.path.startswith('/api/sync_google_sheets'):
             self.handle_sync_google_sheets()
+        elif self.path == '/metrics':
+            self.enviar_metricas()
         else:
             # Servir arquivos estáticos
             self.serve_static()
@@ -89,12 +100,10 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
                 'timestamp': datetime.now().isoformat()
             }
 
-            # Send response
+            # Send response (JSON compacto; comprimido se o cliente aceitar)
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(data, indent=2).encode())
+            self.enviar_corpo(json.dumps(data).encode(), 'application/json')
 
         except Exception as e:
             self.send_error(500, f"Erro interno: {str(e)}")
@@ -222,21 +231,43 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
                     content_type = 'text/plain'
 
                 self.send_response(200)
-                self.send_header('Content-type', content_type)
                 # Disable cache for development
                 self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
                 self.send_header('Pragma', 'no-cache')
                 self.send_header('Expires', '0')
-                self.end_headers()
+
+                variante = arquivos_comprimidos.variante(path, self.headers.get('Accept-Encoding'))
+                if variante is not None:
+                    _, codificacao, corpo = variante
+                    self.enviar_corpo(corpo, content_type, codificacao)
+                    return
 
                 with open(filepath, 'rb') as f:
-                    self.wfile.write(f.read())
+                    self.enviar_corpo(f.read(), content_type)
             else:
                 self.send_error(404, "Arquivo não encontrado")
 
         except Exception as e:
             self.send_error(500, f"Erro interno: {str(e)}")
 
+    def enviar_corpo(self, corpo, content_type, codificacao=None):
+        """
+        Termina os cabeçalhos e envia o corpo
+
+        Sem `codificacao` (corpo já comprimido), comprime corpos de texto/JSON
+        acima do tamanho mínimo conforme o Accept-Encoding do cliente.
+        """
+        if codificacao is None:
+            corpo, codificacao = negociar(corpo, content_type, self.headers.get('Accept-Encoding'))
+        self.send_header('Content-type', content_type)
+        if tipo_compressivel(content_type):
+            self.send_header('Vary', 'Accept-Encoding')
+        if codificacao:
+            self.send_header('Content-Encoding', codificacao)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
     def handle_doPost(self):
         try:
             print("Recebendo dados via doPost...")
@@ -268,6 +299,8 @@ class DataSyncHandler(http.server.BaseHTTPRequestHandler):
             print(f"{self.address_string()} - {self.path}")
 
 def run_server(port=8000):
+    DataSyncHandler.controle_admissao = get_controle_admissao()
+    print(f"Arquivos estáticos pré-comprimidos: {arquivos_comprimidos.preparar()}")
     with socketserver.TCPServer(("", port), DataSyncHandler) as httpd:
         print(f"Servidor rodando em http://localhost:{port}")
         print("API de sincronização disponível em /api/sync")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita o Google Apps Script, para testes do proxy
+Responde em HTTP/1.1 com keep-alive. Como o Apps Script real, pode
+redirecionar (302) o /exec para outro caminho que entrega o JSON, atrasar
+as respostas ou travar sem responder.
+"""
+import argparse
+import http.server
+import json
+import threading
+import time
+
+class _ManipuladorAppsScript(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em writes separados; sem isso o delayed ACK
+    # do cliente soma ~40 ms a cada resposta keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexoes += 1
+
+    def _responder(self, status, corpo=b'', cabecalhos=None):
+        self.send_response(status)
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _atender(self):
+        servidor = self.server
+        tamanho = int(self.headers.get('Content-Length', 0))
+        dados = self.rfile.read(tamanho) if tamanho else b''
+        with servidor.lock:
+            servidor.requisicoes += 1
+
+        if self.path.startswith('/exec') and servidor.redirecionar:
+            with servidor.lock:
+                servidor.pendentes[self.client_address] = dados
+            self._responder(302, cabecalhos={'Location': '/echo?user_content_key=teste'})
+            return
+
+        if servidor.travar:
+            servidor.liberar.wait()
+        elif servidor.atraso:
+            time.sleep(servidor.atraso)
+
+        if self.path.startswith('/echo'):
+            with servidor.lock:
+                dados = servidor.pendentes.pop(self.client_address, dados)
+        corpo = json.dumps({'status': 'success', 'metodo': self.command, 'recebido': len(dados)}).encode()
+        self._responder(200, corpo, {'Content-Type': 'application/json'})
+
+    do_GET = _atender
+    do_POST = _atender
+
+    def log_message(self, format, *args):
+        pass
+
+class ServidorAppsScriptLocal(http.server.ThreadingHTTPServer):
+    """
+    Apps Script de mentira em uma thread, para testes de latência e vazão
+
+    `redirecionar` responde 302 no /exec (como o Apps Script real);
+    `atraso` segura cada resposta; `travar` segura até parar() ser chamado.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', porta: int = 0, atraso: float = 0.0,
+                 redirecionar: bool = True, travar: bool = False):
+        super().__init__((host, porta), _ManipuladorAppsScript)
+        self.atraso = atraso
+        self.redirecionar = redirecionar
+        self.travar = travar
+        self.liberar = threading.Event()
+        self.lock = threading.Lock()
+        self.pendentes = {}
+        self.conexoes = 0
+        self.requisicoes = 0
+        self._thread = None
+
+    @property
+    def porta(self) -> int:
+        return self.server_address[1]
+
+    def handle_error(self, request, client_address):
+        # Cliente que desistiu por timeout fecha a conexão antes da resposta
+        pass
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.porta}/exec"
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='apps-script-local', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.liberar.set()
+        self.shutdown()
+        self.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apps Script local para testes do proxy')
+    parser.add_argument('--porta', type=int, default=8090)
+    parser.add_argument('--atraso', type=float, default=0.0, help='segundos de espera por resposta')
+    parser.add_argument('--sem-redirecionamento', action='store_true')
+    args = parser.parse_args()
+
+    servidor = ServidorAppsScriptLocal(porta=args.porta, atraso=args.atraso,
+                                       redirecionar=not args.sem_redirecionamento)
+    print(f"Apps Script de teste em {servidor.url} (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(f"{servidor.requisicoes} requisição(ões) em {servidor.conexoes} conexão(ões)")
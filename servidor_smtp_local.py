@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Servidor SMTP local para testes da fila de e-mails
+Aceita qualquer login, guarda as mensagens em memória e não entrega nada.
+Pode atrasar cada mensagem e recusar as primeiras N para simular falhas.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    def _responder(self, linha: str):
+        # Respostas SMTP são ASCII: textos sem acento
+        self.wfile.write((linha + '\r\n').encode('ascii'))
+
+    def handle(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.conexoes += 1
+        self._responder('220 localhost SMTP de teste')
+        remetente = None
+        destinatarios = []
+
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode('utf-8', 'replace').strip()
+            verbo = comando.split(' ', 1)[0].upper()
+
+            if verbo == 'EHLO':
+                self._responder('250-localhost')
+                self._responder('250-AUTH PLAIN LOGIN')
+                self._responder('250 8BITMIME')
+            elif verbo == 'HELO':
+                self._responder('250 localhost')
+            elif verbo == 'AUTH':
+                partes = comando.split()
+                if partes[1].upper() == 'LOGIN':
+                    for pergunta in ('334 VXNlcm5hbWU6', '334 UGFzc3dvcmQ6'):
+                        self._responder(pergunta)
+                        self.rfile.readline()
+                elif len(partes) == 2:
+                    self._responder('334 ')
+                    self.rfile.readline()
+                with servidor.lock:
+                    servidor.logins += 1
+                self._responder('235 2.7.0 Autenticado')
+            elif verbo == 'MAIL':
+                remetente = comando.split(':', 1)[1].strip()
+                destinatarios = []
+                self._responder('250 OK')
+            elif verbo == 'RCPT':
+                destinatarios.append(comando.split(':', 1)[1].strip())
+                self._responder('250 OK')
+            elif verbo == 'DATA':
+                self._responder('354 Termine com <CRLF>.<CRLF>')
+                corpo = []
+                while True:
+                    linha = self.rfile.readline()
+                    if not linha or linha in (b'.\r\n', b'.\n'):
+                        break
+                    corpo.append(linha)
+                if servidor.atraso:
+                    time.sleep(servidor.atraso)
+                with servidor.lock:
+                    recusar = servidor.recusar > 0
+                    if recusar:
+                        servidor.recusar -= 1
+                    else:
+                        servidor.mensagens.append({'de': remetente, 'para': destinatarios,
+                                                   'dados': b''.join(corpo)})
+                self._responder('451 4.3.0 Falha temporaria simulada' if recusar else '250 OK enfileirada')
+            elif verbo in ('RSET', 'NOOP'):
+                self._responder('250 OK')
+            elif verbo == 'QUIT':
+                self._responder('221 Ate logo')
+                return
+            else:
+                self._responder('502 Comando nao implementado')
+
+class ServidorSMTPLocal(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP mínimo em uma thread, para testes
+
+    `atraso` segura cada mensagem por alguns segundos (servidor lento);
+    `recusar` responde 451 às próximas N mensagens.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', porta: int = 0, atraso: float = 0.0, recusar: int = 0):
+        super().__init__((host, porta), _SessaoSMTP)
+        self.atraso = atraso
+        self.recusar = recusar
+        self.lock = threading.Lock()
+        self.mensagens = []
+        self.conexoes = 0
+        self.logins = 0
+        self._thread = None
+
+    @property
+    def porta(self) -> int:
+        return self.server_address[1]
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='smtp-local', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor SMTP local para testes')
+    parser.add_argument('--porta', type=int, default=8025)
+    parser.add_argument('--atraso', type=float, default=0.0, help='segundos de espera por mensagem')
+    args = parser.parse_args()
+
+    servidor = ServidorSMTPLocal(porta=args.porta, atraso=args.atraso)
+    print(f"SMTP de teste em 127.0.0.1:{servidor.porta} (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(f"{len(servidor.mensagens)} mensagem(ns) recebida(s) em {servidor.conexoes} conexão(ões)")
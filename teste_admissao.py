@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Teste do controle de admissão (admissao)
+
+Verifica o balde de tokens por cliente e rota, a recusa imediata com a
+fila de escritas cheia, o orçamento separado do Excel, o 429 com
+Retry-After do server_sync, que as vagas compartilhadas valem para vários
+processos e que os orçamentos são divididos entre eles, e que um cliente
+inundando escritas no SQLite é recusado sem atrasar as escritas de um
+cliente bem-comportado.
+"""
+import http.client
+import http.server
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from admissao import (AdmissaoRecusada, ControleAdmissao, FilaAdmissao, FilaAdmissaoCompartilhada,
+                      LimitadorTaxa, Regra)
+from database_sql import DatabaseManager
+from server_sync import DataSyncHandler
+
+def testar_balde():
+    """Rajada até a capacidade, recusa depois, reposição pela taxa; clientes e rotas independentes"""
+    limitador = LimitadorTaxa({'escrita': Regra(5, 20.0)})
+    chave = ('10.0.0.1', 'escrita', '/api/movimentacoes')
+    permitidas = sum(1 for _ in range(5) if limitador.consumir(chave, 'escrita') == 0)
+    espera = limitador.consumir(chave, 'escrita')
+    outro_cliente = limitador.consumir(('10.0.0.2', 'escrita', '/api/movimentacoes'), 'escrita')
+    outra_rota = limitador.consumir(('10.0.0.1', 'escrita', '/api/ferramentas'), 'escrita')
+    time.sleep(0.06)
+    reposto = limitador.consumir(chave, 'escrita')
+
+    if permitidas != 5 or not 0 < espera <= 0.051 or outro_cliente or outra_rota or reposto:
+        print(f"FALHA: permitidas={permitidas} espera={espera:.3f} outro_cliente={outro_cliente} "
+              f"outra_rota={outra_rota} reposto={reposto}")
+        return False
+
+    # Clientes inativos (baldes cheios) são descartados ao passar de max_baldes
+    limitador = LimitadorTaxa({'leitura': Regra(1, 1000.0)}, max_baldes=100)
+    for i in range(1000):
+        limitador.consumir((f'10.1.{i // 250}.{i % 250}', 'leitura', '/api/x'), 'leitura')
+        time.sleep(0.0001)
+    if len(limitador) > 100:
+        print(f"FALHA: {len(limitador)} baldes guardados com max_baldes=100")
+        return False
+    print(f"Balde: rajada de 5, sexta espera {espera * 1000:.0f} ms; clientes e rotas independentes")
+    return True
+
+def testar_fila():
+    """Com vagas e fila ocupadas, a próxima entrada é recusada sem esperar"""
+    fila = FilaAdmissao(vagas=2, max_fila=2, espera_maxima=1.0)
+    fila.entrar()
+    fila.entrar()
+    admitidos = []
+    esperando = [threading.Thread(target=lambda: admitidos.append(fila.entrar())) for _ in range(2)]
+    for t in esperando:
+        t.start()
+    time.sleep(0.1)
+
+    inicio = time.perf_counter()
+    recusada = not fila.entrar()
+    decorrido = time.perf_counter() - inicio
+    fila.sair()
+    fila.sair()
+    for t in esperando:
+        t.join()
+
+    if not recusada or decorrido > 0.05 or admitidos != [True, True]:
+        print(f"FALHA: recusada={recusada} em {decorrido * 1000:.1f} ms, admitidos após espera {admitidos}")
+        return False
+    print(f"Fila: quinta entrada recusada em {decorrido * 1000:.2f} ms; as duas da fila entraram ao liberar")
+    return True
+
+def _worker_vagas(diretorio, ativos, maximo, lock, admitidas):
+    fila = FilaAdmissaoCompartilhada(diretorio, 'escrita', vagas=2, max_fila=8, espera_maxima=5.0)
+
+    def ocupar():
+        for _ in range(5):
+            if not fila.entrar():
+                continue
+            with lock:
+                ativos.value += 1
+                maximo.value = max(maximo.value, ativos.value)
+                admitidas.value += 1
+            time.sleep(0.01)
+            with lock:
+                ativos.value -= 1
+            fila.sair()
+
+    threads = [threading.Thread(target=ocupar) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def testar_vagas_compartilhadas(tmpdir):
+    """Três processos com 4 threads cada nunca passam de 2 escritas simultâneas"""
+    diretorio = os.path.join(tmpdir, 'admissao')
+    contexto = multiprocessing.get_context('fork')
+    lock = contexto.Lock()
+    ativos, maximo, admitidas = contexto.Value('i', 0), contexto.Value('i', 0), contexto.Value('i', 0)
+    processos = [contexto.Process(target=_worker_vagas, args=(diretorio, ativos, maximo, lock, admitidas))
+                 for _ in range(3)]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join(30)
+
+    if maximo.value != 2 or admitidas.value != 60 or any(p.exitcode for p in processos):
+        print(f"FALHA: {maximo.value} simultâneas (esperado 2), {admitidas.value}/60 admitidas")
+        return False
+
+    # Vaga de um processo morto é liberada pelo sistema
+    fila = FilaAdmissaoCompartilhada(diretorio, 'escrita', vagas=2)
+    ocupante = contexto.Process(target=lambda: (fila.entrar(), fila.entrar(), time.sleep(30)))
+    ocupante.start()
+    time.sleep(0.5)
+    cheia = not fila.entrar()
+    # Quem espera tenta com intervalo crescente, sempre nos mesmos descritores
+    paciente = FilaAdmissaoCompartilhada(diretorio, 'escrita', vagas=2, max_fila=1, espera_maxima=0.3)
+    tomar_vaga = paciente._tomar_vaga
+    tentativas = []
+    paciente._tomar_vaga = lambda: tentativas.append(1) or tomar_vaga()
+    recusada = not paciente.entrar()
+    espera = len(tentativas)
+    descritores = list(paciente._descritores)
+    paciente.entrar()
+    mesmos = paciente._descritores == descritores
+    ocupante.kill()
+    ocupante.join()
+    if not cheia or not fila.entrar():
+        print(f"FALHA: vagas ocupadas por outro processo admitiram ({not cheia}) ou não voltaram após a morte")
+        return False
+    fila.sair()
+    if not recusada or espera > 12 or not mesmos:
+        print(f"FALHA: espera de 0.3 s com {espera} tentativas (recusada {recusada}), "
+              f"descritores reabertos {not mesmos}")
+        return False
+
+    # Sem diretório, as vagas e a fila de espera são divididas; os baldes sempre são
+    controle = ControleAdmissao(processos=4)
+    escrita, excel = controle.filas['escrita'], controle.filas['excel']
+    regra = controle.limitador.regras['escrita']
+    if (escrita.vagas, escrita.max_fila, excel.vagas) != (1, 8, 1) or regra != Regra(7.5, 1.25):
+        print(f"FALHA: divisão por 4 processos: vagas {escrita.vagas}, fila {escrita.max_fila}, regra {regra}")
+        return False
+    compartilhado = ControleAdmissao(processos=4, diretorio=diretorio)
+    if not isinstance(compartilhado.filas['escrita'], FilaAdmissaoCompartilhada) \
+            or compartilhado.filas['escrita'].vagas != 4:
+        print("FALHA: com diretório as vagas deveriam ser as globais")
+        return False
+    print(f"Vagas compartilhadas: 3 processos x 4 threads, no máximo {maximo.value} simultâneas; "
+          f"vaga de processo morto liberada; espera de 0.3 s com {espera} tentativas; "
+          f"orçamentos divididos por 4")
+    return True
+
+def testar_rotas_pesadas():
+    """Excel tem orçamento e vaga próprios: esgotá-lo não afeta as demais rotas"""
+    controle = ControleAdmissao()
+    fila = controle.admitir('10.0.0.1', 'GET', '/api/generate_sync_excel')
+    try:
+        controle.admitir('10.0.0.2', 'GET', '/api/generate_sync_excel')
+        print("FALHA: segunda geração simultânea do Excel admitida")
+        return False
+    except AdmissaoRecusada as e:
+        retry_concorrente = e.retry_after
+    fila.sair()
+
+    controle.admitir('10.0.0.1', 'GET', '/api/generate_sync_excel').sair()
+    try:
+        controle.admitir('10.0.0.1', 'GET', '/api/generate_sync_excel')
+        print("FALHA: terceira geração do Excel no mesmo minuto admitida")
+        return False
+    except AdmissaoRecusada as e:
+        retry_taxa = e.retry_after
+    leitura = controle.admitir('10.0.0.1', 'GET', '/api/sync')
+    estatico = controle.admitir('10.0.0.1', 'GET', '/index.html')
+
+    if leitura is not None or estatico is not None or retry_taxa < 30:
+        print(f"FALHA: leitura/estático com fila ou Retry-After {retry_taxa} s fora do esperado")
+        return False
+    print(f"Rotas pesadas: Excel concorrente recusado (Retry-After {retry_concorrente} s), "
+          f"terceiro no minuto recusado (Retry-After {retry_taxa} s); /api/sync livre")
+    return True
+
+def testar_servidor_sync():
+    """server_sync responde 429 com Retry-After antes de executar o handler"""
+    class Handler(DataSyncHandler):
+        controle_admissao = ControleAdmissao(regras={'leitura': Regra(2, 0.5), 'escrita': Regra(2, 0.5),
+                                                     'excel': Regra(1, 0.01), 'backup': Regra(1, 0.01)})
+
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    status = []
+    try:
+        for _ in range(3):
+            conexao = http.client.HTTPConnection('127.0.0.1', servidor.server_address[1], timeout=10)
+            conexao.request('GET', '/api/sync')
+            resposta = conexao.getresponse()
+            resposta.read()
+            status.append((resposta.status, resposta.getheader('Retry-After')))
+            conexao.close()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    if [s for s, _ in status] != [200, 200, 429] or status[2][1] != '2':
+        print(f"FALHA: respostas {status}")
+        return False
+    print(f"server_sync: {[s for s, _ in status]}, Retry-After {status[2][1]} s")
+    return True
+
+def testar_inundacao(tmpdir, duracao=2.0):
+    """Um cliente com 16 threads inunda escritas; o outro continua escrevendo rápido"""
+    db = DatabaseManager(os.path.join(tmpdir, 'inundacao.db'))
+    db.initialize_database()
+    solicitante_id = db.adicionar_solicitante('Planilha descontrolada', 'vba@example.com')
+    ferramenta_id = db.adicionar_ferramenta('Multímetro', quantidade_total=1000000)
+    controle = ControleAdmissao()
+    parar = threading.Event()
+    contagem = {'inundacao_ok': 0, 'inundacao_429': 0, 'normal_ok': 0, 'normal_429': 0}
+    latencias = []
+    lock = threading.Lock()
+
+    def escrever(cliente, prefixo):
+        try:
+            fila = controle.admitir(cliente, 'POST', '/api/movimentacoes', '/api/movimentacoes')
+        except AdmissaoRecusada:
+            with lock:
+                contagem[f'{prefixo}_429'] += 1
+            return False
+        try:
+            db.adicionar_movimentacao('saida', solicitante_id, ferramenta_id)
+        finally:
+            fila.sair()
+            db.liberar_conexao()
+        with lock:
+            contagem[f'{prefixo}_ok'] += 1
+        return True
+
+    def inundar():
+        while not parar.is_set():
+            escrever('10.0.0.66', 'inundacao')
+
+    def normal():
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            if escrever('10.0.0.7', 'normal'):
+                latencias.append(time.perf_counter() - inicio)
+            time.sleep(0.25)
+
+    threads = [threading.Thread(target=inundar) for _ in range(16)] + [threading.Thread(target=normal)]
+    for t in threads:
+        t.start()
+    time.sleep(duracao)
+    parar.set()
+    for t in threads:
+        t.join()
+    db.close()
+
+    latencias.sort()
+    print(f"Inundação: {contagem['inundacao_ok']} escritas admitidas e {contagem['inundacao_429']} recusadas; "
+          f"cliente normal {contagem['normal_ok']} ok / {contagem['normal_429']} recusadas, "
+          f"pior latência {latencias[-1] * 1000:.1f} ms")
+    if contagem['normal_429'] or not latencias or contagem['inundacao_429'] < contagem['inundacao_ok']:
+        print("FALHA: cliente normal recusado ou inundação não contida")
+        return False
+    if latencias[-1] > 0.5:
+        print("FALHA: escrita do cliente normal passou de 500 ms")
+        return False
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_admissao_')
+    try:
+        ok = testar_balde()
+        ok = testar_fila() and ok
+        ok = testar_rotas_pesadas() and ok
+        ok = testar_vagas_compartilhadas(tmpdir) and ok
+        ok = testar_servidor_sync() and ok
+        ok = testar_inundacao(tmpdir) and ok
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Teste dos backups em segundo plano (backup_sql)
+
+Verifica que o backup comprimido (e o não comprimido) restaura os dados,
+que nenhum .parcial sobra ao terminar ou falhar, que a retenção mantém
+o mais recente de cada dia e semana sem contar cópias em andamento, e que
+processos com o mesmo diretório não fazem backups simultâneos e veem o
+estado uns dos outros.
+"""
+import glob
+import gzip
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from backup_sql import GerenciadorBackup, PREFIXO_BACKUP, SUFIXO_PARCIAL, aplicar_retencao
+from database_sql import DatabaseManager
+
+def _contar_ferramentas(caminho):
+    conexao = sqlite3.connect(caminho)
+    try:
+        return conexao.execute('SELECT COUNT(*) FROM ferramentas').fetchone()[0]
+    finally:
+        conexao.close()
+
+def _backups(diretorio):
+    """Arquivos de backup do diretório (sem a trava e o arquivo de status)"""
+    return sorted(nome for nome in os.listdir(diretorio) if nome.startswith(PREFIXO_BACKUP))
+
+def testar_copia(db, tmpdir):
+    """Cópia em passos, com e sem compressão; o arquivo final restaura as ferramentas"""
+    for comprimir in (True, False):
+        diretorio = os.path.join(tmpdir, f'backups_{int(comprimir)}')
+        backup = GerenciadorBackup(db, diretorio=diretorio, comprimir=comprimir, paginas_por_passo=2, pausa=0)
+        if not backup.iniciar():
+            print("FALHA: backup não iniciado")
+            return False
+        backup.aguardar(30)
+        status = backup.status()
+        arquivos = _backups(diretorio)
+        if status['erro'] or status['em_andamento'] or arquivos != [os.path.basename(status['arquivo'])]:
+            print(f"FALHA: status {status}, arquivos {arquivos}")
+            return False
+
+        restaurado = os.path.join(tmpdir, 'restaurado.db')
+        if comprimir:
+            with gzip.open(status['arquivo'], 'rb') as origem, open(restaurado, 'wb') as destino:
+                shutil.copyfileobj(origem, destino)
+        else:
+            shutil.copy(status['arquivo'], restaurado)
+        ferramentas = _contar_ferramentas(restaurado)
+        os.remove(restaurado)
+        if ferramentas != 50 or status['progresso'] != 1.0:
+            print(f"FALHA: {ferramentas} ferramentas no backup, progresso {status['progresso']}")
+            return False
+    print(f"Cópia: {os.path.basename(status['arquivo'])} e .db.gz restauram as 50 ferramentas, sem .parcial")
+    return True
+
+def testar_falha(tmpdir):
+    """Uma cópia que falha no meio não deixa arquivo nenhum"""
+    class BancoQuebrado:
+        def backup_database(self, caminho, **kwargs):
+            with open(caminho, 'wb') as f:
+                f.write(b'metade')
+            raise sqlite3.OperationalError('disco cheio')
+
+    diretorio = os.path.join(tmpdir, 'backups_falha')
+    backup = GerenciadorBackup(BancoQuebrado(), diretorio=diretorio)
+    backup.iniciar()
+    backup.aguardar(10)
+    if backup.status()['erro'] != 'disco cheio' or _backups(diretorio):
+        print(f"FALHA: erro {backup.status()['erro']}, sobraram {_backups(diretorio)}")
+        return False
+    print("Falha: erro registrado e nenhum arquivo deixado para a retenção")
+    return True
+
+class BancoLento:
+    """Escreve a cópia parcial e espera o evento antes de terminar"""
+    def __init__(self, liberar):
+        self.liberar = liberar
+
+    def backup_database(self, caminho, progresso=None, **kwargs):
+        with open(caminho, 'wb') as f:
+            f.write(b'SQLite format 3\0')
+        progresso(1, 2)
+        self.liberar.wait(30)
+        progresso(2, 2)
+
+def _backup_em_outro_processo(diretorio, liberar):
+    backup = GerenciadorBackup(BancoLento(liberar), diretorio=diretorio, pausa=0)
+    backup.iniciar()
+    backup.aguardar(30)
+
+def _esperar_parcial(diretorio):
+    for _ in range(500):
+        if glob.glob(os.path.join(diretorio, '*' + SUFIXO_PARCIAL)):
+            return True
+        time.sleep(0.01)
+    return False
+
+def testar_varios_processos(tmpdir):
+    """Backup de outro processo bloqueia o segundo (409) e o status dele é visto por todos"""
+    diretorio = os.path.join(tmpdir, 'backups_processos')
+    contexto = multiprocessing.get_context('fork')
+    liberar = contexto.Event()
+    outro = contexto.Process(target=_backup_em_outro_processo, args=(diretorio, liberar))
+    outro.start()
+    _esperar_parcial(diretorio)
+
+    pronto = contexto.Event()
+    pronto.set()
+    backup = GerenciadorBackup(BancoLento(pronto), diretorio=diretorio, pausa=0)
+    recusado = not backup.iniciar()
+    durante = backup.status()
+    liberar.set()
+    outro.join(30)
+    depois = backup.status()
+    if (not recusado or not durante['em_andamento'] or depois['em_andamento'] or depois['erro']
+            or durante['arquivo'] != depois['arquivo'] or _backups(diretorio) != [os.path.basename(depois['arquivo'])]):
+        print(f"FALHA: recusado {recusado}; status durante {durante}; depois {depois}; arquivos {_backups(diretorio)}")
+        return False
+
+    # Processo morto no meio da cópia: trava solta, status interrompido e .parcial limpo no próximo
+    travado = contexto.Event()
+    morto = contexto.Process(target=_backup_em_outro_processo, args=(diretorio, travado))
+    morto.start()
+    _esperar_parcial(diretorio)
+    morto.kill()
+    morto.join()
+    interrompido = backup.status()
+    iniciado = backup.iniciar()
+    backup.aguardar(30)
+    sobras = glob.glob(os.path.join(diretorio, '*' + SUFIXO_PARCIAL))
+    if interrompido['em_andamento'] or not interrompido['erro'] or not iniciado or sobras or backup.status()['erro']:
+        print(f"FALHA: após a morte do processo: status {interrompido}, novo backup {iniciado}, sobras {sobras}")
+        return False
+    print(f"Vários processos: segundo backup recusado enquanto outro copia; status compartilhado "
+          f"({os.path.basename(depois['arquivo'])}); processo morto informado como '{interrompido['erro']}'")
+    return True
+
+def testar_retencao(tmpdir):
+    """Mais recente de cada dia e semana; .parcial não conta e não é removido"""
+    diretorio = os.path.join(tmpdir, 'retencao')
+    os.makedirs(diretorio)
+    nomes = [
+        'backup_ferramentas_20260105_030000.db.gz',  # semana 2026-02
+        'backup_ferramentas_20260112_030000.db.gz',  # semana 2026-03
+        'backup_ferramentas_20260113_030000.db.gz',
+        'backup_ferramentas_20260114_020000.db.gz',
+        'backup_ferramentas_20260114_030000.db.gz',
+        'backup_ferramentas_20260114_040000.db' + SUFIXO_PARCIAL,  # em andamento
+        'backup_ferramentas_20260114_040000.db.gz' + SUFIXO_PARCIAL,
+        'outro_arquivo.db',
+    ]
+    for nome in nomes:
+        open(os.path.join(diretorio, nome), 'wb').close()
+
+    removidos = sorted(os.path.basename(c) for c in aplicar_retencao(diretorio, manter_diarios=2, manter_semanais=2))
+    esperado = ['backup_ferramentas_20260112_030000.db.gz', 'backup_ferramentas_20260114_020000.db.gz']
+    restantes = set(os.listdir(diretorio))
+    if removidos != esperado or restantes != set(nomes) - set(esperado):
+        print(f"FALHA: removidos {removidos}, restantes {sorted(restantes)}")
+        return False
+    print(f"Retenção: removidos {removidos}; backup concluído do dia mantido apesar da cópia em andamento")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_backup_')
+    try:
+        db = DatabaseManager(os.path.join(tmpdir, 'teste.db'))
+        db.initialize_database()
+        db.adicionar_ferramentas_lote([{'nome': f'Ferramenta {i}', 'quantidade_total': 2} for i in range(50)])
+        ok = testar_copia(db, tmpdir)
+        ok = testar_falha(tmpdir) and ok
+        ok = testar_retencao(tmpdir) and ok
+        ok = testar_varios_processos(tmpdir) and ok
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
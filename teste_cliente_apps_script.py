@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Teste do cliente do Apps Script contra o servidor local
+
+Verifica que as chamadas reaproveitam a conexão keep-alive (inclusive
+seguindo o 302 do Apps Script), que um upstream travado vira
+TempoEsgotado dentro do limite de leitura, que chamadas além do limite de
+concorrência são recusadas na hora e compara a vazão com o urlopen
+por chamada usado antes.
+"""
+import json
+import sys
+import threading
+import time
+import urllib.request
+
+from cliente_apps_script import ClienteSaturado, ClienteUpstream, TempoEsgotado
+from servidor_apps_script_local import ServidorAppsScriptLocal
+
+CHAMADAS = 200
+
+def testar_keep_alive():
+    """CHAMADAS POSTs sequenciais, com 302 cada, em uma única conexão"""
+    servidor = ServidorAppsScriptLocal().iniciar()
+    cliente = ClienteUpstream(servidor.url)
+    try:
+        for i in range(CHAMADAS):
+            resposta = cliente.post(json.dumps({'action': 'registrar', 'n': i}).encode())
+            dados = json.loads(resposta.corpo)
+            if resposta.status != 200 or dados['metodo'] != 'GET' or dados['recebido'] == 0:
+                print(f"FALHA: resposta inesperada {resposta.status} {dados}")
+                return False
+    finally:
+        cliente.fechar()
+        servidor.parar()
+
+    estatisticas = cliente.estatisticas()
+    if servidor.conexoes != 1 or estatisticas['conexoes_abertas'] != 1:
+        print(f"FALHA: {servidor.conexoes} conexões para {CHAMADAS} chamadas, esperado 1")
+        return False
+    print(f"Keep-alive: {CHAMADAS} chamadas ({servidor.requisicoes} requisições com o 302) em 1 conexão")
+    return True
+
+def testar_timeout():
+    """Upstream que não responde libera a thread em ~timeout_leitura"""
+    servidor = ServidorAppsScriptLocal(travar=True, redirecionar=False).iniciar()
+    cliente = ClienteUpstream(servidor.url, timeout_leitura=0.5)
+    inicio = time.perf_counter()
+    try:
+        cliente.post(b'{}')
+        print("FALHA: chamada a upstream travado retornou")
+        return False
+    except TempoEsgotado:
+        decorrido = time.perf_counter() - inicio
+    finally:
+        cliente.fechar()
+        servidor.parar()
+
+    if decorrido > 2.0:
+        print(f"FALHA: timeout levou {decorrido:.2f}s com limite de 0.5s")
+        return False
+    print(f"Upstream travado: TempoEsgotado em {decorrido:.2f}s")
+    return True
+
+def testar_saturacao():
+    """Com 2 vagas ocupadas por chamadas lentas, a terceira é recusada sem esperar"""
+    servidor = ServidorAppsScriptLocal(atraso=1.0, redirecionar=False).iniciar()
+    cliente = ClienteUpstream(servidor.url, max_concorrentes=2, espera_vaga=0.05)
+    lentas = [threading.Thread(target=cliente.get) for _ in range(2)]
+    for t in lentas:
+        t.start()
+    time.sleep(0.2)
+
+    inicio = time.perf_counter()
+    try:
+        cliente.get()
+        recusada = False
+    except ClienteSaturado:
+        recusada = True
+    decorrido = time.perf_counter() - inicio
+    for t in lentas:
+        t.join()
+    cliente.fechar()
+    servidor.parar()
+
+    if not recusada or decorrido > 0.5:
+        print(f"FALHA: terceira chamada recusada={recusada} após {decorrido:.2f}s")
+        return False
+    print(f"Saturação: chamada excedente recusada em {decorrido * 1000:.0f} ms")
+    return True
+
+def testar_vazao(threads=8):
+    """Compara o cliente compartilhado com um urlopen novo por chamada"""
+    servidor = ServidorAppsScriptLocal().iniciar()
+    cliente = ClienteUpstream(servidor.url, max_concorrentes=threads)
+
+    def via_cliente():
+        cliente.post(b'{"action": "ping"}')
+
+    def via_urlopen():
+        req = urllib.request.Request(servidor.url, data=b'{"action": "ping"}', method='POST')
+        req.add_header('Content-Type', 'application/json')
+        with urllib.request.urlopen(req) as resposta:
+            resposta.read()
+
+    def medir(funcao):
+        por_thread = CHAMADAS // threads
+        latencias = []
+        lock = threading.Lock()
+
+        def trabalhador():
+            locais = []
+            for _ in range(por_thread):
+                inicio = time.perf_counter()
+                funcao()
+                locais.append(time.perf_counter() - inicio)
+            with lock:
+                latencias.extend(locais)
+
+        inicio = time.perf_counter()
+        trabalhadores = [threading.Thread(target=trabalhador) for _ in range(threads)]
+        for t in trabalhadores:
+            t.start()
+        for t in trabalhadores:
+            t.join()
+        decorrido = time.perf_counter() - inicio
+        latencias.sort()
+        return len(latencias) / decorrido, latencias[int(len(latencias) * 0.99) - 1] * 1000
+
+    try:
+        conexoes_antes = servidor.conexoes
+        vazao_urlopen, p99_urlopen = medir(via_urlopen)
+        conexoes_urlopen = servidor.conexoes - conexoes_antes
+        conexoes_antes = servidor.conexoes
+        vazao_cliente, p99_cliente = medir(via_cliente)
+        conexoes_cliente = servidor.conexoes - conexoes_antes
+    finally:
+        cliente.fechar()
+        servidor.parar()
+
+    print(f"urlopen por chamada: {vazao_urlopen:7.0f} chamadas/s  p99 {p99_urlopen:6.1f} ms  {conexoes_urlopen} conexões")
+    print(f"cliente compartilhado: {vazao_cliente:5.0f} chamadas/s  p99 {p99_cliente:6.1f} ms  {conexoes_cliente} conexões")
+    if conexoes_cliente > threads:
+        print(f"FALHA: cliente abriu {conexoes_cliente} conexões para {threads} threads")
+        return False
+    return True
+
+def main():
+    ok = testar_keep_alive()
+    ok = testar_timeout() and ok
+    ok = testar_saturacao() and ok
+    ok = testar_vazao() and ok
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
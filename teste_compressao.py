@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Teste da compressão negociada
+
+Verifica a escolha da codificação a partir do Accept-Encoding, a
+pré-compressão dos arquivos estáticos (inclusive a recompressão quando o
+arquivo muda em disco) e, contra cada servidor HTTP no ar (server,
+server_proxy, server_sync e server_sync_fixed), que a API, o /metrics e os
+arquivos estáticos saem comprimidos só para quem pede e só acima do
+tamanho mínimo.
+"""
+import gzip
+import http.client
+import json
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+import compressao
+import server
+import server_proxy
+import server_sync
+import server_sync_fixed
+from compressao import ArquivosComprimidos, escolher_codificacao, negociar
+
+def testar_negociacao():
+    """Accept-Encoding: q=0, curinga, identity e preferência do servidor"""
+    preferida = compressao.codificacoes_disponiveis()[0]
+    casos = [
+        (None, None),
+        ('', None),
+        ('identity', None),
+        ('gzip', 'gzip'),
+        ('gzip;q=0', None),
+        ('*', preferida),
+        ('*;q=0, gzip;q=0.5', 'gzip'),
+        ('deflate, gzip;q=1.0, br', preferida),
+        ('GZIP ; q=0.8', 'gzip'),
+    ]
+    ok = True
+    for cabecalho, esperado in casos:
+        obtido = escolher_codificacao(cabecalho)
+        if obtido != esperado:
+            print(f"FALHA: Accept-Encoding {cabecalho!r} -> {obtido!r}, esperado {esperado!r}")
+            ok = False
+
+    corpo = json.dumps([{'id': i, 'nome': f'Ferramenta {i}'} for i in range(200)]).encode()
+    comprimido, codificacao = negociar(corpo, 'application/json', 'gzip')
+    if codificacao != 'gzip' or gzip.decompress(comprimido) != corpo:
+        print("FALHA: JSON grande não foi comprimido com gzip")
+        ok = False
+    if negociar(b'{"success": true}', 'application/json', 'gzip')[1] is not None:
+        print("FALHA: corpo abaixo do tamanho mínimo foi comprimido")
+        ok = False
+    if negociar(os.urandom(4096), 'application/octet-stream', 'gzip')[1] is not None:
+        print("FALHA: tipo binário foi comprimido")
+        ok = False
+    if ok:
+        print(f"Negociação: {len(casos)} casos; JSON de {len(corpo)} -> {len(comprimido)} bytes")
+    return ok
+
+def testar_pre_compressao(tmpdir):
+    """preparar() comprime os estáticos; obter() recomprime após mudança em disco"""
+    caminho = os.path.join(tmpdir, 'painel.html')
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write('<div class="linha">ferramenta</div>\n' * 500)
+    with open(os.path.join(tmpdir, 'pequeno.css'), 'w', encoding='utf-8') as f:
+        f.write('body { margin: 0; }\n')
+    with open(os.path.join(tmpdir, 'planilha.xlsx'), 'wb') as f:
+        f.write(os.urandom(8192))
+
+    arquivos = ArquivosComprimidos(tmpdir)
+    ok = True
+    preparados = arquivos.preparar()
+    if preparados != 1:
+        print(f"FALHA: {preparados} arquivos pré-comprimidos, esperado 1 (só painel.html)")
+        ok = False
+
+    primeiro = arquivos.obter('painel.html')
+    if primeiro is None or gzip.decompress(primeiro.variantes['gzip']) != open(caminho, 'rb').read():
+        print("FALHA: variante gzip de painel.html não corresponde ao arquivo")
+        return False
+    if arquivos.obter('painel.html') is not primeiro:
+        print("FALHA: arquivo sem mudança foi recomprimido")
+        ok = False
+
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write('<p>nova linha</p>\n')
+    os.utime(caminho, (time.time() + 5, time.time() + 5))
+    segundo = arquivos.obter('painel.html')
+    if segundo is primeiro or not gzip.decompress(segundo.variantes['gzip']).endswith(b'<p>nova linha</p>\n'):
+        print("FALHA: mudança em disco não gerou nova versão comprimida")
+        ok = False
+
+    if arquivos.obter('../' + os.path.basename(tmpdir) + '_fora.html') is not None:
+        print("FALHA: caminho fora do diretório foi aceito")
+        ok = False
+    if ok:
+        estatisticas = arquivos.estatisticas()
+        print(f"Pré-compressão: {estatisticas['bytes_originais']} -> {estatisticas['bytes_comprimidos']['gzip']} bytes (gzip)")
+    return ok
+
+def requisitar(porta, caminho, accept_encoding=None):
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=10)
+    cabecalhos = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    conexao.request('GET', caminho, headers=cabecalhos)
+    resposta = conexao.getresponse()
+    corpo = resposta.read()
+    conexao.close()
+    return resposta, corpo
+
+class MovimentacoesFicticias:
+    """Mixin para os DataSyncHandler: movimentações suficientes para passar do tamanho mínimo"""
+
+    def load_json(self, filename, last_sync=None):
+        if filename == 'movimentacoes.json':
+            return [{'id': i, 'ferramenta': f'Ferramenta {i % 7}', 'solicitante': 'Oficina',
+                     'dataRegistro': '2026-10-01T08:00:00'} for i in range(100)]
+        return super().load_json(filename, last_sync)
+
+    def log_message(self, format, *args):
+        pass
+
+class HandlerSync(MovimentacoesFicticias, server_sync.DataSyncHandler):
+    pass
+
+class HandlerSyncFixed(MovimentacoesFicticias, server_sync_fixed.DataSyncHandler):
+    pass
+
+SERVIDORES = [
+    ('server', server.NoCacheHTTPRequestHandler, ('/painel.html', '/metrics')),
+    ('server_proxy', server_proxy.ProxyHTTPRequestHandler, ('/painel.html', '/metrics')),
+    ('server_sync', HandlerSync, ('/api/sync', '/painel.html', '/metrics')),
+    ('server_sync_fixed', HandlerSyncFixed, ('/api/sync', '/painel.html', '/metrics')),
+]
+
+def testar_servidor(nome, handler, caminhos):
+    """Cada caminho sai em gzip só quando o cliente aceita, com Vary e o mesmo conteúdo"""
+    httpd = socketserver.ThreadingTCPServer(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    porta = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    ok = True
+    try:
+        for caminho in caminhos:
+            simples, corpo_simples = requisitar(porta, caminho)
+            comprimida, corpo_comprimido = requisitar(porta, caminho, 'gzip, deflate')
+            if simples.status != 200 or comprimida.status != 200:
+                print(f"FALHA: {nome} {caminho} respondeu {simples.status}/{comprimida.status}")
+                ok = False
+                continue
+            if simples.getheader('Content-Encoding') is not None:
+                print(f"FALHA: {nome} {caminho} comprimido sem Accept-Encoding")
+                ok = False
+            if comprimida.getheader('Content-Encoding') != 'gzip':
+                print(f"FALHA: {nome} {caminho} sem Content-Encoding: gzip")
+                ok = False
+                continue
+            if comprimida.getheader('Vary') != 'Accept-Encoding':
+                print(f"FALHA: {nome} {caminho} sem Vary: Accept-Encoding")
+                ok = False
+            descomprimido = gzip.decompress(corpo_comprimido)
+            if caminho == '/api/sync':
+                iguais = json.loads(descomprimido).keys() == json.loads(corpo_simples).keys()
+            elif caminho == '/metrics':
+                # Os contadores mudam entre as duas requisições; basta ser o mesmo formato
+                iguais = descomprimido.startswith(b'# HELP') and corpo_simples.startswith(b'# HELP')
+            else:
+                iguais = descomprimido == corpo_simples
+            if not iguais:
+                print(f"FALHA: {nome} {caminho} descomprimido difere da resposta sem compressão")
+                ok = False
+            elif ok:
+                print(f"{nome} {caminho}: {len(corpo_simples)} -> {len(corpo_comprimido)} bytes")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    return ok
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_compressao_')
+    try:
+        ok = testar_negociacao()
+        ok = testar_pre_compressao(tmpdir) and ok
+        for nome, handler, caminhos in SERVIDORES:
+            ok = testar_servidor(nome, handler, caminhos) and ok
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Teste de carga de empréstimos concorrentes entre processos
+
+Vários processos, cada um com seu próprio DatabaseManager, disputam as
+poucas unidades de uma mesma ferramenta: cada processo tenta emprestar e,
+quando consegue, devolve logo em seguida. Enquanto isso um processo
+observador confere que o número de empréstimos ativos nunca passa do
+estoque. No fim verifica que nenhum empréstimo além do estoque foi aceito,
+que nenhuma operação falhou por lock e que o contador bate com as
+movimentações gravadas. Reporta vazão e latência p99.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from database_sql import DatabaseManager
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def trabalhador(db_path, ferramenta_id, solicitante_id, tentativas, busy_timeout_ms, inicio, fila):
+    db = DatabaseManager(db_path, max_conexoes=1, busy_timeout_ms=busy_timeout_ms, max_tentativas=20)
+    latencias = []
+    aceitos = recusados = erros = 0
+    ultimo_erro = None
+    inicio.wait()
+    for _ in range(tentativas):
+        t0 = time.perf_counter()
+        try:
+            mov_id = db.adicionar_movimentacao('saida', solicitante_id, ferramenta_id)
+            aceitos += 1
+            db.concluir_movimentacao(mov_id)
+        except ValueError:
+            recusados += 1
+        except Exception as e:
+            erros += 1
+            ultimo_erro = repr(e)
+        latencias.append(time.perf_counter() - t0)
+    db.close()
+    fila.put({'aceitos': aceitos, 'recusados': recusados, 'erros': erros,
+              'ultimo_erro': ultimo_erro, 'latencias': latencias})
+
+def observador(db_path, ferramenta_id, unidades, parar, fila):
+    db = DatabaseManager(db_path, max_conexoes=1)
+    maximo = amostras = excessos = 0
+    while not parar.is_set():
+        cursor = db.connection.execute(
+            "SELECT COUNT(*) FROM movimentacoes WHERE ferramenta_id = ? AND status = 'ativo'",
+            (ferramenta_id,))
+        ativos = cursor.fetchone()[0]
+        amostras += 1
+        maximo = max(maximo, ativos)
+        if ativos > unidades:
+            excessos += 1
+    db.close()
+    fila.put({'amostras': amostras, 'maximo_ativos': maximo, 'excessos': excessos})
+
+def executar(db_path, processos, tentativas, unidades, busy_timeout_ms):
+    db = DatabaseManager(db_path)
+    db.initialize_database()
+    ferramenta_id = db.adicionar_ferramenta('Paquímetro', quantidade_total=unidades)
+    solicitante_id = db.obter_solicitantes()[0]['id']
+    db.close()
+
+    inicio = multiprocessing.Event()
+    parar = multiprocessing.Event()
+    fila = multiprocessing.Queue()
+    fila_observador = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=trabalhador,
+                                       args=(db_path, ferramenta_id, solicitante_id, tentativas, busy_timeout_ms,
+                                             inicio, fila))
+               for _ in range(processos)]
+    vigia = multiprocessing.Process(target=observador,
+                                    args=(db_path, ferramenta_id, unidades, parar, fila_observador))
+    for p in workers:
+        p.start()
+    vigia.start()
+
+    t0 = time.perf_counter()
+    inicio.set()
+    resultados = [fila.get() for _ in workers]
+    decorrido = time.perf_counter() - t0
+    parar.set()
+    vigiado = fila_observador.get()
+    for p in workers + [vigia]:
+        p.join()
+
+    db = DatabaseManager(db_path)
+    ferramenta = next(f for f in db.obter_ferramentas() if f['id'] == ferramenta_id)
+    ativas = len(db.obter_movimentacoes(status='ativo', ferramenta_id=ferramenta_id))
+    gravadas = len(db.obter_movimentacoes(ferramenta_id=ferramenta_id))
+    db.close()
+
+    aceitos = sum(r['aceitos'] for r in resultados)
+    recusados = sum(r['recusados'] for r in resultados)
+    erros = sum(r['erros'] for r in resultados)
+    latencias = [l for r in resultados for l in r['latencias']]
+
+    ok = True
+    if erros:
+        exemplo = next(r['ultimo_erro'] for r in resultados if r['ultimo_erro'])
+        print(f"FALHA: {erros} operação(ões) com erro, por exemplo: {exemplo}")
+        ok = False
+    if vigiado['excessos']:
+        print(f"FALHA: {vigiado['excessos']} amostra(s) com mais de {unidades} empréstimos ativos "
+              f"(máximo {vigiado['maximo_ativos']})")
+        ok = False
+    if ferramenta['quantidade_disponivel'] != unidades or ativas != 0:
+        print(f"FALHA: ao final quantidade_disponivel = {ferramenta['quantidade_disponivel']} "
+              f"e {ativas} ativa(s), esperado {unidades} e 0")
+        ok = False
+    if gravadas != aceitos:
+        print(f"FALHA: {gravadas} movimentações gravadas para {aceitos} empréstimos aceitos")
+        ok = False
+
+    total = processos * tentativas
+    print(f"{processos} processos x {tentativas} tentativas sobre {unidades} unidades: "
+          f"{aceitos} aceitos, {recusados} recusados por falta de estoque, {erros} erros")
+    print(f"Observador: {vigiado['amostras']} amostras, máximo de {vigiado['maximo_ativos']} ativos")
+    print(f"Vazão: {total / decorrido:.0f} tentativas/s  "
+          f"p50 {percentil(latencias, 0.50) * 1000:.1f} ms  p99 {percentil(latencias, 0.99) * 1000:.1f} ms")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga de empréstimos concorrentes')
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--tentativas', type=int, default=500)
+    parser.add_argument('--unidades', type=int, default=3)
+    parser.add_argument('--busy-timeout-ms', type=int, default=5000,
+                        help='valores baixos exercitam as novas tentativas com espera aleatória')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='teste_concorrencia_')
+    try:
+        ok = executar(os.path.join(tmpdir, 'teste.db'), args.processos, args.tentativas, args.unidades,
+                     args.busy_timeout_ms)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
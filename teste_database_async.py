@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Teste da camada assíncrona do banco de dados
+
+Dispara centenas de empréstimos concorrentes (asyncio.gather) contra uma
+ferramenta com poucas unidades, junto com leituras, e verifica que as
+escritas foram serializadas: nenhum empréstimo além do estoque, nenhum erro
+de lock e o contador final batendo com as movimentações gravadas.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from database_async import (AsyncDatabaseManager, METODOS_ESCRITA, METODOS_LEITURA,
+                            METODOS_SINCRONOS)
+from database_sql import DatabaseManager
+
+UNIDADES = 25
+PEDIDOS = 400
+LEITURAS = 200
+
+def verificar_cobertura():
+    """Todo método público do DatabaseManager precisa de uma versão na fachada"""
+    publicos = {nome for nome in dir(DatabaseManager)
+                if not nome.startswith('_') and callable(getattr(DatabaseManager, nome))}
+    cobertos = set(METODOS_ESCRITA) | set(METODOS_LEITURA) | set(METODOS_SINCRONOS) | {'iterar_movimentacoes'}
+    faltando = publicos - cobertos
+    if faltando:
+        print(f"FALHA: métodos sem versão assíncrona: {sorted(faltando)}")
+        return False
+    return True
+
+async def executar(db_path):
+    adb = AsyncDatabaseManager(db_path, leitores=4)
+    await adb.initialize_database()
+    ferramenta_id = await adb.adicionar_ferramenta('Torquímetro', quantidade_total=UNIDADES)
+    solicitante_id = (await adb.obter_solicitantes())[0]['id']
+
+    threads_escrita = set()
+    original = adb.db.adicionar_movimentacao
+
+    def registrar_thread(*args, **kwargs):
+        threads_escrita.add(threading.get_ident())
+        return original(*args, **kwargs)
+
+    adb.db.adicionar_movimentacao = registrar_thread
+
+    async def emprestar():
+        try:
+            return await adb.adicionar_movimentacao('saida', solicitante_id, ferramenta_id)
+        except ValueError:
+            return None
+
+    tarefas = [emprestar() for _ in range(PEDIDOS)]
+    tarefas += [adb.obter_ferramentas() for _ in range(LEITURAS)]
+    resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+
+    erros = [r for r in resultados if isinstance(r, BaseException)]
+    emprestimos = [r for r in resultados[:PEDIDOS] if isinstance(r, int)]
+    ferramenta = next(f for f in await adb.obter_ferramentas() if f['id'] == ferramenta_id)
+    ativas = await adb.obter_movimentacoes(status='ativo', ferramenta_id=ferramenta_id)
+    async_iter = [m async for m in adb.iterar_movimentacoes(tamanho_lote=7, ferramenta_id=ferramenta_id)]
+
+    await adb.close()
+
+    ok = True
+    if erros:
+        print(f"FALHA: {len(erros)} erro(s), por exemplo: {erros[0]!r}")
+        ok = False
+    if len(emprestimos) != UNIDADES:
+        print(f"FALHA: {len(emprestimos)} empréstimos aceitos, esperado {UNIDADES}")
+        ok = False
+    if ferramenta['quantidade_disponivel'] != 0:
+        print(f"FALHA: quantidade_disponivel = {ferramenta['quantidade_disponivel']}, esperado 0")
+        ok = False
+    if len(ativas) != UNIDADES or len(async_iter) != UNIDADES:
+        print(f"FALHA: {len(ativas)} movimentações ativas / {len(async_iter)} iteradas, esperado {UNIDADES}")
+        ok = False
+    if len(threads_escrita) != 1:
+        print(f"FALHA: escritas executadas em {len(threads_escrita)} threads, esperado 1")
+        ok = False
+
+    print(f"{PEDIDOS} pedidos concorrentes, {LEITURAS} leituras: "
+          f"{len(emprestimos)} empréstimos aceitos para {UNIDADES} unidades")
+    return ok
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_async_')
+    try:
+        ok = verificar_cobertura()
+        ok = asyncio.run(executar(os.path.join(tmpdir, 'teste.db'))) and ok
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
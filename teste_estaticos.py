@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Teste dos arquivos estáticos versionados
+
+Sobe o server.py nos modos produção e dev e verifica que, em produção, as
+páginas apontam para nomes com hash, que esses nomes saem com cache
+imutável e revalidam com 304, e que os nomes antigos continuam servidos
+sem cache. Em dev as páginas saem intactas e sem cache, como antes.
+"""
+import http.client
+import os
+import re
+import socketserver
+import sys
+import threading
+
+import server
+from estaticos import AssetsVersionados, CACHE_IMUTAVEL, modo_estaticos, nome_versionado
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+class Handler(server.NoCacheHTTPRequestHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=DIRETORIO, **kwargs)
+
+def subir(assets):
+    Handler.assets = assets
+    httpd = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def requisitar(porta, caminho, cabecalhos=None):
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=10)
+    conexao.request('GET', caminho, headers=cabecalhos or {})
+    resposta = conexao.getresponse()
+    corpo = resposta.read()
+    conexao.close()
+    return resposta, corpo
+
+def ler(nome):
+    with open(os.path.join(DIRETORIO, nome), 'rb') as f:
+        return f.read()
+
+def testar_producao():
+    assets = AssetsVersionados(DIRETORIO).preparar()
+    httpd = subir(assets)
+    porta = httpd.server_address[1]
+    ok = True
+    try:
+        resposta, corpo = requisitar(porta, '/painel.html')
+        versionado = nome_versionado('script.js', ler('script.js'))
+        if f'src="{versionado}"' not in corpo.decode('utf-8') or 'src="script.js"' in corpo.decode('utf-8'):
+            print("FALHA: painel.html não aponta para script.js versionado")
+            ok = False
+        if resposta.getheader('Cache-Control') != 'no-cache' or not resposta.getheader('ETag'):
+            print(f"FALHA: painel.html com Cache-Control {resposta.getheader('Cache-Control')!r}")
+            ok = False
+
+        referencias = [n for n in re.findall(r'src="([^"]+)"', corpo.decode('utf-8')) if not n.startswith('http')]
+        for nome in referencias:
+            resposta, corpo_asset = requisitar(porta, '/' + nome)
+            if resposta.getheader('Cache-Control') != CACHE_IMUTAVEL:
+                print(f"FALHA: {nome} sem cache imutável")
+                ok = False
+            original = nome.rsplit('.', 2)[0] + '.' + nome.rsplit('.', 1)[1]
+            if corpo_asset != ler(original):
+                print(f"FALHA: {nome} difere de {original}")
+                ok = False
+
+        resposta, _ = requisitar(porta, '/' + versionado)
+        revalidada, corpo_304 = requisitar(porta, '/' + versionado, {'If-None-Match': resposta.getheader('ETag')})
+        if revalidada.status != 304 or corpo_304:
+            print(f"FALHA: If-None-Match respondeu {revalidada.status} com {len(corpo_304)} bytes")
+            ok = False
+
+        comprimida, _ = requisitar(porta, '/' + versionado, {'Accept-Encoding': 'gzip'})
+        if comprimida.getheader('Content-Encoding') != 'gzip' or comprimida.getheader('ETag') == resposta.getheader('ETag'):
+            print("FALHA: variante gzip sem Content-Encoding ou com o mesmo ETag")
+            ok = False
+
+        antigo, corpo_antigo = requisitar(porta, '/script.js')
+        if antigo.status != 200 or corpo_antigo != ler('script.js') or 'no-store' not in antigo.getheader('Cache-Control', ''):
+            print("FALHA: nome antigo script.js não é mais servido sem cache")
+            ok = False
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    if ok:
+        print(f"Produção: {len(assets.versoes)} arquivos versionados; {len(referencias)} scripts locais em painel.html")
+    return ok
+
+def testar_dev():
+    httpd = subir(None)
+    porta = httpd.server_address[1]
+    try:
+        resposta, corpo = requisitar(porta, '/painel.html')
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    if corpo != ler('painel.html') or 'no-store' not in resposta.getheader('Cache-Control', ''):
+        print("FALHA: modo dev alterou painel.html ou o cabeçalho sem cache")
+        return False
+    print("Dev: painel.html intacto e sem cache")
+    return True
+
+def testar_modo():
+    ok = modo_estaticos('PRODUCAO') == 'producao' and modo_estaticos('dev') == 'dev'
+    try:
+        modo_estaticos('teste')
+        ok = False
+    except ValueError:
+        pass
+    if not ok:
+        print("FALHA: validação do modo de estáticos")
+    return ok
+
+def main():
+    ok = testar_modo()
+    ok = testar_producao() and ok
+    ok = testar_dev() and ok
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
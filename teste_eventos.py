@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Teste do feed de alterações por SSE (eventos_sql)
+
+Verifica que centenas de assinantes não criam threads, que uma escrita
+chega a todos em menos de um segundo (com e sem avisar()), que o filtro
+por entidade funciona e que uma reconexão com Last-Event-ID recebe
+exatamente o que perdeu, do buffer em memória ou do banco, ou só os eventos
+novos quando o id está à frente do log (banco restaurado).
+"""
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from database_sql import DatabaseManager
+from eventos_sql import HubEventos
+
+ASSINANTES = 200
+
+class ClienteSSE:
+    """Assinante mínimo sobre um socket, como o EventSource do navegador"""
+
+    def __init__(self, porta, caminho='/eventos', ultimo_id=None):
+        self.sock = socket.create_connection(('127.0.0.1', porta), timeout=5)
+        cabecalhos = f"GET {caminho} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n"
+        if ultimo_id is not None:
+            cabecalhos += f"Last-Event-ID: {ultimo_id}\r\n"
+        self.sock.sendall((cabecalhos + "\r\n").encode('ascii'))
+        self.buffer = b''
+        resposta = self._ler_ate(b'\r\n\r\n')
+        self.status = int(resposta.split(b' ')[1])
+
+    def _ler_ate(self, separador):
+        while separador not in self.buffer:
+            dados = self.sock.recv(65536)
+            if not dados:
+                raise ConnectionError("Conexão fechada pelo servidor")
+            self.buffer += dados
+        bloco, self.buffer = self.buffer.split(separador, 1)
+        return bloco
+
+    def proximo_evento(self, timeout=5.0):
+        """Retorna {'id', 'event', 'data'} do próximo evento, ignorando comentários"""
+        self.sock.settimeout(timeout)
+        while True:
+            evento = {}
+            for linha in self._ler_ate(b'\n\n').decode('utf-8').split('\n'):
+                nome, _, valor = linha.partition(': ')
+                if nome in ('id', 'event', 'data'):
+                    evento[nome] = valor
+            if 'id' in evento:
+                evento['id'] = int(evento['id'])
+                evento['data'] = json.loads(evento['data'])
+                return evento
+
+    def fechar(self):
+        self.sock.close()
+
+def aguardar(condicao, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.01)
+    return False
+
+def testar_fan_out(db):
+    """ASSINANTES conexões sem novas threads; uma escrita chega a todas em < 1 s"""
+    hub = HubEventos(db, host='127.0.0.1', porta=0).iniciar()
+    threads_antes = threading.active_count()
+    clientes = [ClienteSSE(hub.porta) for _ in range(ASSINANTES)]
+    filtrado = ClienteSSE(hub.porta, '/eventos?entidades=movimentacoes')
+    try:
+        if not aguardar(lambda: hub.status()['assinantes'] == ASSINANTES + 1):
+            print(f"FALHA: {hub.status()['assinantes']} assinantes registrados de {ASSINANTES + 1}")
+            return False
+        threads_depois = threading.active_count()
+
+        inicio = time.perf_counter()
+        ferramenta_id = db.adicionar_ferramenta('Chave SSE', quantidade_total=3)
+        hub.avisar()
+        latencias = []
+        for cliente in clientes:
+            evento = cliente.proximo_evento()
+            latencias.append(time.perf_counter() - inicio)
+            if evento['event'] != 'ferramentas' or evento['data']['id'] != ferramenta_id:
+                print(f"FALHA: evento inesperado {evento}")
+                return False
+
+        # Sem avisar(): escrita de outro processo, vista pelo intervalo de leitura
+        inicio = time.perf_counter()
+        solicitante_id = db.adicionar_solicitante('Assinante SSE', 'sse@example.com')
+        evento = clientes[0].proximo_evento()
+        latencia_intervalo = time.perf_counter() - inicio
+
+        db.adicionar_movimentacoes_lote([{'tipo': 'saida', 'solicitante_id': solicitante_id,
+                                          'ferramenta_id': ferramenta_id}])
+        evento_filtrado = filtrado.proximo_evento()
+    finally:
+        for cliente in clientes + [filtrado]:
+            cliente.fechar()
+        hub.parar()
+
+    maxima = max(latencias)
+    print(f"Fan-out: {ASSINANTES} assinantes, {threads_depois - threads_antes} threads novas, "
+          f"latência máxima {maxima * 1000:.0f} ms; sem avisar() {latencia_intervalo * 1000:.0f} ms")
+    if threads_depois > threads_antes:
+        print(f"FALHA: {threads_depois - threads_antes} threads criadas para os assinantes")
+        return False
+    if maxima > 1.0 or latencia_intervalo > 1.0:
+        print("FALHA: evento levou mais de 1 s para chegar")
+        return False
+    if evento['event'] != 'solicitantes' or evento_filtrado['event'] != 'movimentacoes':
+        print(f"FALHA: eventos {evento['event']} / {evento_filtrado['event']} fora do esperado")
+        return False
+    return True
+
+def testar_retomada(db, tamanho_buffer, origem):
+    """Reconexão com Last-Event-ID recebe só o que foi perdido, em ordem"""
+    hub = HubEventos(db, host='127.0.0.1', porta=0, tamanho_buffer=tamanho_buffer).iniciar()
+    try:
+        cliente = ClienteSSE(hub.porta)
+        aguardar(lambda: hub.status()['assinantes'] == 1)
+        db.adicionar_ferramenta(f'Antes da queda ({origem})', quantidade_total=1)
+        hub.avisar()
+        ultimo_id = cliente.proximo_evento()['id']
+        cliente.fechar()
+
+        perdidos = [db.adicionar_ferramenta(f'Perdida {i} ({origem})', quantidade_total=1) for i in range(5)]
+        hub.avisar()
+        aguardar(lambda: hub.status()['ultimo_seq'] >= ultimo_id + 5)
+
+        cliente = ClienteSSE(hub.porta, ultimo_id=ultimo_id)
+        recebidos = [cliente.proximo_evento() for _ in perdidos]
+        novo_id = db.adicionar_ferramenta(f'Depois da volta ({origem})', quantidade_total=1)
+        hub.avisar()
+        seguinte = cliente.proximo_evento()
+        cliente.fechar()
+        status = hub.status()
+    finally:
+        hub.parar()
+
+    ids = [e['id'] for e in recebidos]
+    if [e['data']['id'] for e in recebidos] != perdidos or ids != sorted(ids) or ids[0] != ultimo_id + 1:
+        print(f"FALHA: retomada ({origem}) recebeu {ids} depois de {ultimo_id}")
+        return False
+    if seguinte['data']['id'] != novo_id or seguinte['id'] != ids[-1] + 1:
+        print(f"FALHA: após retomar ({origem}) veio {seguinte}")
+        return False
+    if status[f'retomadas_{origem}'] != 1:
+        print(f"FALHA: retomada não veio do {origem}: {status}")
+        return False
+    print(f"Retomada pelo {origem}: {len(recebidos)} eventos perdidos reenviados após id {ultimo_id}")
+    return True
+
+def testar_id_adiante(db):
+    """Last-Event-ID maior que o último seq (banco restaurado) não esconde os eventos novos"""
+    hub = HubEventos(db, host='127.0.0.1', porta=0).iniciar()
+    try:
+        cliente = ClienteSSE(hub.porta, ultimo_id=hub.status()['ultimo_seq'] + 1000)
+        aguardar(lambda: hub.status()['assinantes'] == 1)
+        novo_id = db.adicionar_ferramenta('Depois da restauração', quantidade_total=1)
+        hub.avisar()
+        try:
+            evento = cliente.proximo_evento(timeout=2.0)
+        except socket.timeout:
+            evento = None
+        cliente.fechar()
+    finally:
+        hub.parar()
+
+    if evento is None or evento['data']['id'] != novo_id:
+        print(f"FALHA: com Last-Event-ID à frente do log o assinante recebeu {evento}")
+        return False
+    print(f"Id à frente do log: evento novo {evento['id']} entregue")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_eventos_')
+    try:
+        db = DatabaseManager(os.path.join(tmpdir, 'teste.db'))
+        db.initialize_database()
+        ok = testar_fan_out(db)
+        ok = testar_retomada(db, tamanho_buffer=100, origem='buffer') and ok
+        # Hub novo com buffer de 2: os eventos perdidos já saíram da memória
+        ok = testar_retomada(db, tamanho_buffer=2, origem='banco') and ok
+        ok = testar_id_adiante(db) and ok
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
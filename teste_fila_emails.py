@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Teste da fila de e-mails contra o servidor SMTP local
+
+Verifica que enfileirar não espera pelo SMTP (mesmo com servidor lento),
+que um lote inteiro sai por uma única sessão autenticada, que recusas
+temporárias são reenviadas, que dois processos drenando a mesma fila não
+enviam a mesma mensagem, que uma reserva vencida volta à fila e que, com o
+servidor fora do ar, as mensagens esperam sem gastar tentativas.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from database_sql import DatabaseManager
+from fila_emails import FilaEmails
+from servidor_smtp_local import ServidorSMTPLocal
+
+MENSAGENS = 30
+
+def configuracao(porta):
+    return {'smtp_server': '127.0.0.1', 'smtp_port': porta, 'usar_tls': False,
+            'username': 'teste', 'password': 'teste', 'from_email': 'ferramentas@example.com'}
+
+def contar(db, status):
+    cursor = db.connection.execute("SELECT COUNT(*) FROM emails_pendentes WHERE status = ?", (status,))
+    return cursor.fetchone()[0]
+
+def aguardar(condicao, timeout=15.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.02)
+    return False
+
+def testar_servidor_lento(db):
+    """Com o SMTP levando 50 ms por mensagem, enfileirar continua instantâneo"""
+    smtp = ServidorSMTPLocal(atraso=0.05).iniciar()
+    fila = FilaEmails(db, configuracao(smtp.porta), tamanho_lote=10, intervalo=0.1, espera_base=0.0)
+    fila.iniciar()
+
+    latencias = []
+    for i in range(MENSAGENS):
+        inicio = time.perf_counter()
+        db.enfileirar_email(f'pessoa{i}@example.com', f'Aviso {i}', f'<p>Mensagem {i}</p>')
+        fila.avisar()
+        latencias.append(time.perf_counter() - inicio)
+
+    entregue = aguardar(lambda: len(smtp.mensagens) == MENSAGENS)
+    fila.parar(timeout=5)
+    smtp.parar()
+
+    ok = True
+    if not entregue or contar(db, 'enviado') != MENSAGENS:
+        print(f"FALHA: {len(smtp.mensagens)} entregues / {contar(db, 'enviado')} marcadas, esperado {MENSAGENS}")
+        ok = False
+    if smtp.conexoes != 1 or smtp.logins != 1:
+        print(f"FALHA: {smtp.conexoes} conexões e {smtp.logins} logins, esperado 1 e 1")
+        ok = False
+    if max(latencias) > 0.05:
+        print(f"FALHA: enfileirar levou {max(latencias) * 1000:.1f} ms (servidor SMTP segura 50 ms)")
+        ok = False
+    print(f"Servidor lento: {len(smtp.mensagens)} mensagens em {smtp.conexoes} conexão(ões), "
+          f"enfileirar máx {max(latencias) * 1000:.2f} ms")
+    return ok
+
+def testar_recusas(db):
+    """Respostas 451 reagendam só a mensagem recusada; todas acabam entregues"""
+    smtp = ServidorSMTPLocal(recusar=3).iniciar()
+    fila = FilaEmails(db, configuracao(smtp.porta), intervalo=0.05, espera_base=0.0)
+    for i in range(5):
+        db.enfileirar_email(f'recusa{i}@example.com', 'Recusa', '<p>x</p>')
+    fila.iniciar()
+
+    entregue = aguardar(lambda: len(smtp.mensagens) == 5)
+    fila.parar(timeout=5)
+    smtp.parar()
+
+    status = fila.status()
+    if not entregue or status['falhas'] != 3 or contar(db, 'pendente') != 0:
+        print(f"FALHA: recusas -> {len(smtp.mensagens)} entregues, {status['falhas']} falhas registradas")
+        return False
+    print(f"Recusas temporárias: 5 entregues após {status['falhas']} reenvios")
+    return True
+
+def testar_dois_processos(caminho):
+    """Duas filas com conexões próprias (como dois workers) entregam cada mensagem uma vez só"""
+    smtp = ServidorSMTPLocal(atraso=0.005).iniciar()
+    bancos = [DatabaseManager(caminho) for _ in range(2)]
+    for i in range(MENSAGENS):
+        bancos[0].enfileirar_email(f'dupla{i}@example.com', f'Dupla {i}', '<p>x</p>')
+    filas = [FilaEmails(db, configuracao(smtp.porta), tamanho_lote=5, espera_base=0.0) for db in bancos]
+
+    # As duas threads começam a drenar ao mesmo tempo
+    largada = threading.Barrier(len(filas))
+    def drenar(fila):
+        largada.wait()
+        while fila.processar():
+            pass
+        fila.db.liberar_conexao()
+    threads = [threading.Thread(target=drenar, args=(fila,)) for fila in filas]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for fila in filas:
+        fila._fechar_sessao()
+    smtp.parar()
+
+    destinatarios = [m for m in smtp.mensagens if 'dupla' in str(m)]
+    por_fila = [fila.status()['enviados'] for fila in filas]
+    for db in bancos:
+        db.close()
+    if len(destinatarios) != MENSAGENS or sum(por_fila) != MENSAGENS:
+        print(f"FALHA: {len(destinatarios)} entregas para {MENSAGENS} mensagens (por fila: {por_fila})")
+        return False
+    print(f"Dois processos: {MENSAGENS} mensagens entregues uma vez cada (por fila: {por_fila})")
+    return True
+
+def testar_reserva_vencida(db):
+    """Um lote reservado não é entregue a outro processo até a reserva vencer"""
+    db.enfileirar_email('reserva@example.com', 'Reserva', '<p>x</p>')
+    reservado = db.reservar_emails_pendentes(limite=10, reserva_segundos=600)
+    durante = db.reservar_emails_pendentes(limite=10)
+    # Simula o processo que reservou morrendo: a reserva vence
+    db.connection.execute("UPDATE emails_pendentes SET proxima_tentativa = datetime('now', '-1 seconds') "
+                          "WHERE status = 'enviando'")
+    db.connection.commit()
+    depois = db.reservar_emails_pendentes(limite=10)
+    db.marcar_emails_enviados([email['id'] for email in depois])
+
+    if len(reservado) != 1 or durante or [e['id'] for e in depois] != [e['id'] for e in reservado]:
+        print(f"FALHA: reservado {reservado}, durante a reserva {durante}, depois de vencer {depois}")
+        return False
+    print("Reserva vencida: a mensagem volta à fila só depois que a reserva vence")
+    return True
+
+def testar_servidor_fora(db):
+    """Sem servidor, as mensagens esperam sem gastar tentativas e saem quando ele volta"""
+    smtp = ServidorSMTPLocal()
+    porta = smtp.porta
+    smtp.server_close()
+
+    fila = FilaEmails(db, configuracao(porta), max_tentativas=3, espera_base=0.0, timeout=1.0)
+    for i in range(3):
+        db.enfileirar_email(f'fora{i}@example.com', 'Fora do ar', '<p>x</p>')
+    # Mais quedas do que max_tentativas: nenhuma mensagem pode ser descartada
+    for _ in range(5):
+        fila.processar()
+    tentativas = db.connection.execute(
+        "SELECT MAX(tentativas) FROM emails_pendentes WHERE destinatario LIKE 'fora%'").fetchone()[0]
+    pendentes = contar(db, 'pendente')
+
+    smtp = ServidorSMTPLocal().iniciar()
+    fila.config = configuracao(smtp.porta)
+    fila.processar()
+    fila._fechar_sessao()
+    smtp.parar()
+
+    if contar(db, 'falhou') or tentativas or pendentes != 3 or len(smtp.mensagens) != 3:
+        print(f"FALHA: servidor fora do ar -> {contar(db, 'falhou')} descartada(s), {tentativas} tentativas "
+              f"gastas, {pendentes} pendentes; {len(smtp.mensagens)} entregues na volta")
+        return False
+    print(f"Servidor fora do ar: {pendentes} mensagens esperaram 5 quedas sem gastar tentativas "
+          f"e foram entregues na volta")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_emails_')
+    try:
+        caminho = os.path.join(tmpdir, 'teste.db')
+        db = DatabaseManager(caminho)
+        db.initialize_database()
+        ok = testar_servidor_lento(db)
+        ok = testar_recusas(db) and ok
+        ok = testar_dois_processos(caminho) and ok
+        ok = testar_reserva_vencida(db) and ok
+        ok = testar_servidor_fora(db) and ok
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
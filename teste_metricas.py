@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Teste do registro de métricas (metricas)
+
+Verifica o custo de registrar uma observação, o formato texto exportado
+(faixas cumulativas, soma e contagem), o mixin dos servidores http.server
+com /metrics, as métricas do DatabaseManager e do cliente do Apps Script e
+a soma entre processos (workers) pelo diretório compartilhado.
+"""
+import functools
+import http.client
+import http.server
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from cliente_apps_script import ClienteUpstream
+from database_sql import DatabaseManager
+from metricas import (DURACAO_APPS_SCRIPT, DURACAO_DB, MetricasCompartilhadas, Registro, normalizar_rota,
+                      registro)
+from server import NoCacheHTTPRequestHandler
+from servidor_apps_script_local import ServidorAppsScriptLocal
+
+OBSERVACOES = 200000
+
+def valor_exportado(texto, prefixo):
+    """Valor da primeira linha do /metrics que começa com `prefixo`"""
+    for linha in texto.splitlines():
+        if linha.startswith(prefixo):
+            return float(linha.rsplit(' ', 1)[1])
+    return None
+
+def testar_custo():
+    """Uma observação de histograma e um incremento de contador custam microssegundos"""
+    teste = Registro()
+    histograma = teste.histograma('teste_duracao_segundos', 'Teste', ('rota',))
+    contador = teste.contador('teste_total', 'Teste', ('rota', 'status'))
+
+    inicio = time.perf_counter()
+    for i in range(OBSERVACOES):
+        histograma.observar('/api/ferramentas', valor=0.003)
+        contador.inc('/api/ferramentas', '200')
+    por_registro = (time.perf_counter() - inicio) / (OBSERVACOES * 2) * 1e6
+
+    # Quatro threads ao mesmo tempo não perdem incrementos
+    def trabalhador():
+        for _ in range(10000):
+            contador.inc('/api/concorrente', '200')
+    threads = [threading.Thread(target=trabalhador) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"Custo: {por_registro:.2f} µs por registro ({OBSERVACOES * 2} registros)")
+    if por_registro > 10:
+        print("FALHA: registrar passou de 10 µs")
+        return False
+    if contador.rotulos('/api/concorrente', '200').valor != 40000:
+        print(f"FALHA: {contador.rotulos('/api/concorrente', '200').valor} de 40000 incrementos")
+        return False
+    return True
+
+def testar_formato():
+    """Faixas cumulativas terminando em +Inf, soma e contagem; rótulos escapados"""
+    teste = Registro()
+    histograma = teste.histograma('teste_segundos', 'Duração', ('rota',), limites=(0.1, 1.0))
+    for valor in (0.05, 0.1, 0.5, 2.0):
+        histograma.observar('a"b', valor=valor)
+    texto = teste.exportar().decode()
+
+    esperado = {
+        'teste_segundos_bucket{rota="a\\"b",le="0.1"}': 2,
+        'teste_segundos_bucket{rota="a\\"b",le="1"}': 3,
+        'teste_segundos_bucket{rota="a\\"b",le="+Inf"}': 4,
+        'teste_segundos_count{rota="a\\"b"}': 4,
+    }
+    for prefixo, valor in esperado.items():
+        if valor_exportado(texto, prefixo + ' ') != valor:
+            print(f"FALHA: {prefixo} != {valor} em\n{texto}")
+            return False
+    if abs(valor_exportado(texto, 'teste_segundos_sum') - 2.65) > 1e-9 or '# TYPE teste_segundos histogram' not in texto:
+        print(f"FALHA: soma ou TYPE incorretos em\n{texto}")
+        return False
+    if normalizar_rota('/api/ferramentas/42?x=1') != '/api/ferramentas/<id>' or normalizar_rota('/style.css') != 'estatico':
+        print("FALHA: normalizar_rota não reduziu o caminho")
+        return False
+    print("Formato: faixas cumulativas, soma, contagem e rótulos escapados corretos")
+    return True
+
+def testar_servidor(tmpdir):
+    """O mixin conta requisições por rota e status e /metrics responde no formato texto"""
+    with open(os.path.join(tmpdir, 'index.html'), 'w') as f:
+        f.write('<html></html>')
+    handler = functools.partial(NoCacheHTTPRequestHandler, directory=tmpdir)
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    prefixo = 'ferramentas_http_requisicoes_total{servidor="server",metodo="GET",rota="estatico",status='
+    antes_200 = valor_exportado(registro.exportar().decode(), prefixo + '"200"}') or 0
+    antes_404 = valor_exportado(registro.exportar().decode(), prefixo + '"404"}') or 0
+    try:
+        for caminho in ['/index.html'] * 3 + ['/nao_existe.html'] * 2:
+            conexao = http.client.HTTPConnection('127.0.0.1', servidor.server_address[1], timeout=5)
+            conexao.request('GET', caminho)
+            conexao.getresponse().read()
+            conexao.close()
+        conexao = http.client.HTTPConnection('127.0.0.1', servidor.server_address[1], timeout=5)
+        conexao.request('GET', '/metrics')
+        resposta = conexao.getresponse()
+        texto = resposta.read().decode()
+        tipo = resposta.getheader('Content-Type')
+        conexao.close()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    ok_200 = valor_exportado(texto, prefixo + '"200"}') - antes_200
+    ok_404 = valor_exportado(texto, prefixo + '"404"}') - antes_404
+    if (ok_200, ok_404) != (3, 2) or not tipo.startswith('text/plain; version=0.0.4'):
+        print(f"FALHA: contados {ok_200} x 200 e {ok_404} x 404 (esperado 3 e 2), Content-Type {tipo}")
+        return False
+    if 'ferramentas_http_duracao_segundos_bucket{servidor="server",metodo="GET",rota="estatico",le="+Inf"}' not in texto:
+        print("FALHA: histograma de duração da rota ausente no /metrics")
+        return False
+    print(f"Servidor: 3 x 200 e 2 x 404 contados; /metrics com {len(texto.splitlines())} linhas")
+    return True
+
+def testar_banco_e_upstream(tmpdir):
+    """Métodos do DatabaseManager e chamadas ao Apps Script aparecem nos histogramas"""
+    db = DatabaseManager(os.path.join(tmpdir, 'teste.db'))
+    db.initialize_database()
+    serie_db = DURACAO_DB.rotulos('obter_ferramentas')
+    antes = sum(serie_db.contagens)
+    for _ in range(5):
+        db.obter_ferramentas()
+    chamadas_db = sum(serie_db.contagens) - antes
+    nome_preservado = DatabaseManager.obter_ferramentas.__name__ == 'obter_ferramentas'
+    db.close()
+
+    servidor = ServidorAppsScriptLocal().iniciar()
+    cliente = ClienteUpstream(servidor.url)
+    serie_upstream = DURACAO_APPS_SCRIPT.rotulos('ok')
+    antes = sum(serie_upstream.contagens)
+    try:
+        for _ in range(3):
+            cliente.post(b'{"action": "ping"}')
+    finally:
+        cliente.fechar()
+        servidor.parar()
+    chamadas_upstream = sum(serie_upstream.contagens) - antes
+
+    if chamadas_db != 5 or not nome_preservado:
+        print(f"FALHA: {chamadas_db} de 5 chamadas a obter_ferramentas medidas (nome preservado: {nome_preservado})")
+        return False
+    if chamadas_upstream != 3:
+        print(f"FALHA: {chamadas_upstream} de 3 chamadas ao Apps Script medidas")
+        return False
+    print(f"Banco e upstream: {chamadas_db} chamadas ao banco e {chamadas_upstream} ao Apps Script medidas")
+    return True
+
+def _worker_metricas(diretorio, requisicoes, pronto, sair):
+    """Processo filho: registra requisições, deixa uma em andamento e grava ao sair"""
+    teste = Registro()
+    contador = teste.contador('teste_requisicoes_total', 'Teste', ('rota',))
+    histograma = teste.histograma('teste_duracao_segundos', 'Teste', ('rota',), limites=(0.1, 1.0))
+    teste.medidor('teste_em_andamento', 'Teste').rotulos().inc()
+    compartilhadas = MetricasCompartilhadas(teste, diretorio, intervalo=0.05).iniciar()
+    for _ in range(requisicoes):
+        contador.inc('/api/ferramentas')
+        histograma.observar('/api/ferramentas', valor=0.5)
+    compartilhadas.gravar()
+    pronto.set()
+    sair.wait(10)
+    compartilhadas.parar()
+
+def testar_varios_processos(tmpdir):
+    """O /metrics de um worker soma os outros; contadores de um worker encerrado não somem"""
+    diretorio = os.path.join(tmpdir, 'metricas')
+    contexto = multiprocessing.get_context('fork')
+    pronto, sair = contexto.Event(), contexto.Event()
+    filho = contexto.Process(target=_worker_metricas, args=(diretorio, 7, pronto, sair))
+    filho.start()
+    pronto.wait(10)
+
+    teste = Registro()
+    contador = teste.contador('teste_requisicoes_total', 'Teste', ('rota',))
+    teste.histograma('teste_duracao_segundos', 'Teste', ('rota',), limites=(0.1, 1.0)).observar(
+        '/api/ferramentas', valor=0.05)
+    teste.medidor('teste_em_andamento', 'Teste').rotulos().inc()
+    contador.inc('/api/ferramentas', quantidade=3)
+    compartilhadas = MetricasCompartilhadas(teste, diretorio, intervalo=60)
+    com_filho = compartilhadas.exportar().decode()
+
+    sair.set()
+    filho.join(10)
+    contador.inc('/api/ferramentas')
+    sem_filho = compartilhadas.exportar().decode()
+
+    esperado = [
+        (com_filho, 'teste_requisicoes_total{rota="/api/ferramentas"} ', 10),
+        (com_filho, 'teste_duracao_segundos_bucket{rota="/api/ferramentas",le="0.1"} ', 1),
+        (com_filho, 'teste_duracao_segundos_count{rota="/api/ferramentas"} ', 8),
+        (com_filho, 'teste_em_andamento ', 2),
+        (sem_filho, 'teste_requisicoes_total{rota="/api/ferramentas"} ', 11),
+        (sem_filho, 'teste_em_andamento ', 1),
+    ]
+    for texto, prefixo, valor in esperado:
+        if valor_exportado(texto, prefixo) != valor:
+            print(f"FALHA: {prefixo.strip()} = {valor_exportado(texto, prefixo)} (esperado {valor}) em\n{texto}")
+            return False
+    print("Vários processos: contadores e faixas somados; o encerrado mantém os contadores e sai dos medidores")
+    return True
+
+def _worker_morto(diretorio, pronto):
+    """Processo filho encerrado com SIGKILL, sem chamar parar()"""
+    teste = Registro()
+    teste.contador('teste_requisicoes_total', 'Teste', ('rota',)).inc('/api/ferramentas', quantidade=5)
+    MetricasCompartilhadas(teste, diretorio, intervalo=60).iniciar()
+    pronto.set()
+    time.sleep(30)
+
+def testar_processos_encerrados(tmpdir):
+    """Encerrados viram um único arquivo: sem <pid>.json esquecido nem totais perdidos com pid reutilizado"""
+    diretorio = os.path.join(tmpdir, 'metricas_encerrados')
+    contexto = multiprocessing.get_context('fork')
+    pronto, sair = contexto.Event(), contexto.Event()
+    sair.set()
+    encerrado = contexto.Process(target=_worker_metricas, args=(diretorio, 7, pronto, sair))
+    encerrado.start()
+    encerrado.join(10)
+    pronto = contexto.Event()
+    morto = contexto.Process(target=_worker_morto, args=(diretorio, pronto))
+    morto.start()
+    pronto.wait(10)
+    morto.kill()
+    morto.join()
+
+    prefixo = 'teste_requisicoes_total{rota="/api/ferramentas"} '
+    leitor = MetricasCompartilhadas(Registro(), diretorio, intervalo=60)
+    leituras = [valor_exportado(leitor.exportar().decode(), prefixo) for _ in range(2)]
+    arquivos = sorted(os.listdir(diretorio))
+
+    # Arquivo deixado por um processo morto com o pid que o próximo processo recebe
+    antigo = Registro()
+    antigo.contador('teste_requisicoes_total', 'Teste', ('rota',)).inc('/api/ferramentas', quantidade=4)
+    MetricasCompartilhadas(antigo, diretorio, intervalo=60).gravar()
+    novo = Registro()
+    novo.contador('teste_requisicoes_total', 'Teste', ('rota',)).inc('/api/ferramentas', quantidade=2)
+    reutilizado = MetricasCompartilhadas(novo, diretorio, intervalo=60).iniciar()
+    com_reutilizado = valor_exportado(reutilizado.exportar().decode(), prefixo)
+    reutilizado.parar()
+    final = valor_exportado(leitor.exportar().decode(), prefixo)
+    restantes = sorted(os.listdir(diretorio))
+
+    esperado_arquivos = ['.lock', MetricasCompartilhadas.ARQUIVO_ENCERRADOS]
+    if leituras != [12, 12] or arquivos != esperado_arquivos or com_reutilizado != 18 or final != 18 \
+            or restantes != esperado_arquivos:
+        print(f"FALHA: leituras {leituras}, arquivos {arquivos}; pid reutilizado {com_reutilizado}, "
+              f"final {final}, restantes {restantes}")
+        return False
+    print(f"Encerrados: parado e morto por SIGKILL somados uma vez ({leituras[0]:.0f}) em {esperado_arquivos[1]}; "
+          f"pid reutilizado não apaga totais ({final:.0f})")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_metricas_')
+    try:
+        ok = testar_custo()
+        ok = testar_formato() and ok
+        ok = testar_servidor(tmpdir) and ok
+        ok = testar_banco_e_upstream(tmpdir) and ok
+        ok = testar_varios_processos(tmpdir) and ok
+        ok = testar_processos_encerrados(tmpdir) and ok
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Teste de regressão dos planos de consulta do DatabaseManager
+
+Exercita todos os métodos públicos do DatabaseManager em um banco temporário,
+captura cada instrução SQL emitida e roda EXPLAIN QUERY PLAN sobre ela.
+Falha (código de saída 1) se alguma consulta cair em varredura completa de
+tabela ("SCAN tabela" sem índice).
+"""
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from database_sql import DatabaseManager
+
+# Métodos de administração que leem tabelas inteiras de propósito (visualizador de BD
+# e reconstrução dos agregados de uso a partir de todo o histórico)
+METODOS_VARREDURA_PERMITIDA = {'obter_tabelas', 'obter_dados_tabela', 'contar_registros_tabela',
+                               'reconstruir_uso'}
+
+# Tabelas internas minúsculas, sem índice por definição
+TABELAS_VARREDURA_PERMITIDA = {'sqlite_sequence', 'sqlite_master', 'sqlite_schema'}
+
+VARREDURA_COMPLETA = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+def preparar_banco():
+    """Cria um banco temporário com dados suficientes para todos os caminhos"""
+    tmpdir = tempfile.mkdtemp(prefix='teste_planos_')
+    db = DatabaseManager(os.path.join(tmpdir, 'teste.db'))
+    db.initialize_database()
+    return db, tmpdir
+
+def exercitar(db, registrar):
+    """Chama cada método público, marcando qual método emitiu cada instrução"""
+    registrar('adicionar_solicitante')
+    solicitante_id = db.adicionar_solicitante('TESTE PLANOS', email='t@example.com')
+    registrar('adicionar_solicitantes_lote')
+    db.adicionar_solicitantes_lote([{'nome': 'LOTE 1'}, {'nome': 'LOTE 2'}])
+    registrar('obter_solicitantes')
+    db.obter_solicitantes()
+    registrar('atualizar_solicitante')
+    db.atualizar_solicitante(solicitante_id, telefone='0000')
+
+    registrar('adicionar_ferramenta')
+    ferramenta_id = db.adicionar_ferramenta('Furadeira', quantidade_total=5)
+    registrar('adicionar_ferramentas_lote')
+    outras = db.adicionar_ferramentas_lote([{'nome': 'Serra', 'quantidade_total': 3}, {'nome': 'Trena'}])
+    registrar('obter_ferramentas')
+    db.obter_ferramentas()
+    registrar('atualizar_ferramenta')
+    db.atualizar_ferramenta(ferramenta_id, quantidade_total=6)
+
+    registrar('adicionar_patrimonio')
+    db.adicionar_patrimonio('PAT001', ferramenta_id)
+    db.adicionar_patrimonio('PAT002', ferramenta_id)
+    db.adicionar_patrimonio('PAT101', outras[0])
+
+    registrar('adicionar_movimentacao')
+    mov_id = db.adicionar_movimentacao('saida', solicitante_id, ferramenta_id,
+                                       data_saida='2025-01-10', data_retorno='2025-01-12',
+                                       patrimonio='PAT001')
+    registrar('adicionar_movimentacoes_lote')
+    db.adicionar_movimentacoes_lote([
+        {'tipo': 'saida', 'solicitante_id': solicitante_id, 'ferramenta_id': outras[0],
+         'data_saida': '2025-01-11', 'patrimonio': 'PAT101'},
+        {'tipo': 'retorno', 'solicitante_id': solicitante_id, 'ferramenta_id': outras[0]}
+    ])
+    registrar('obter_movimentacoes')
+    db.obter_movimentacoes()
+    db.obter_movimentacoes(status='ativo')
+    db.obter_movimentacoes(tipo='saida')
+    db.obter_movimentacoes(solicitante_id=solicitante_id)
+    db.obter_movimentacoes(ferramenta_id=ferramenta_id)
+    db.obter_movimentacoes(data_inicio='2025-01-01', data_fim='2025-01-31')
+    db.obter_movimentacoes(status='ativo', como_registros=True)
+    registrar('obter_movimentacoes_pagina')
+    pagina = db.obter_movimentacoes_pagina(limite=1)
+    db.obter_movimentacoes_pagina(limite=1, cursor=pagina['next_cursor'], status='ativo')
+    registrar('iterar_movimentacoes')
+    list(db.iterar_movimentacoes(tamanho_lote=1))
+    registrar('obter_patrimonio')
+    db.obter_patrimonio('PAT001')
+    registrar('obter_patrimonios_solicitante')
+    db.obter_patrimonios_solicitante(solicitante_id)
+    registrar('obter_patrimonios_ferramenta')
+    db.obter_patrimonios_ferramenta(ferramenta_id)
+    db.obter_patrimonios_ferramenta(ferramenta_id, somente_livres=True)
+    registrar('obter_movimentacoes_atrasadas')
+    atrasadas = db.obter_movimentacoes_atrasadas(agora='2025-01-13 08:00')
+    db.obter_movimentacoes_atrasadas(agora='2025-01-13 08:00', somente_pendentes=True)
+    registrar('marcar_atrasos_notificados')
+    db.marcar_atrasos_notificados([m['id'] for m in atrasadas])
+    registrar('atualizar_movimentacao')
+    db.atualizar_movimentacao(mov_id, observacoes='teste')
+    registrar('concluir_movimentacao')
+    db.concluir_movimentacao(mov_id)
+    registrar('arquivar_movimentacoes')
+    db.arquivar_movimentacoes(idade_dias=-1)
+    registrar('obter_movimentacoes')
+    db.obter_movimentacoes(incluir_historico=True)
+    db.obter_movimentacoes(incluir_historico=True, ferramenta_id=ferramenta_id, como_registros=True)
+    db.obter_movimentacoes(incluir_historico=True, data_inicio='2025-01-01', data_fim='2025-01-31')
+    registrar('obter_movimentacoes_pagina')
+    pagina = db.obter_movimentacoes_pagina(limite=1, incluir_historico=True)
+    db.obter_movimentacoes_pagina(limite=1, cursor=pagina['next_cursor'], incluir_historico=True)
+
+    registrar('obter_uso')
+    for agrupamento in ('ferramenta', 'solicitante', 'dia', 'ferramenta_dia', 'solicitante_dia'):
+        db.obter_uso(('2025-01-01', '2026-12-31'), agrupamento)
+    db.obter_uso(30)
+    registrar('reconstruir_uso')
+    db.reconstruir_uso()
+
+    registrar('enfileirar_email')
+    email_id = db.enfileirar_email('t@example.com', 'Assunto', '<p>Mensagem</p>')
+    db.enfileirar_email('u@example.com', 'Assunto', '<p>Mensagem</p>')
+    registrar('reservar_emails_pendentes')
+    db.reservar_emails_pendentes(limite=10)
+    registrar('marcar_emails_enviados')
+    db.marcar_emails_enviados([email_id])
+    registrar('adiar_emails')
+    db.adiar_emails([email_id + 1], 0, 'servidor fora do ar')
+    registrar('registrar_falha_email')
+    db.registrar_falha_email(email_id + 1, 'erro de teste', 30)
+
+    registrar('obter_estatisticas')
+    db.obter_estatisticas()
+    registrar('reconciliar_estatisticas')
+    db.reconciliar_estatisticas()
+    registrar('obter_alteracoes')
+    db.obter_alteracoes(desde=1, limite=10)
+    registrar('obter_ultimo_seq')
+    db.obter_ultimo_seq()
+    registrar('versoes_tabelas')
+    db.versoes_tabelas(['ferramentas', 'movimentacoes'])
+    registrar('obter_tabelas')
+    db.obter_tabelas()
+    registrar('obter_colunas_tabela')
+    db.obter_colunas_tabela('movimentacoes')
+    registrar('obter_dados_tabela')
+    db.obter_dados_tabela('movimentacoes', limit=10)
+    registrar('contar_registros_tabela')
+    db.contar_registros_tabela('movimentacoes')
+
+    registrar('remover_patrimonio')
+    db.remover_patrimonio('PAT002')
+    registrar('remover_ferramenta')
+    db.remover_ferramenta(outras[1])
+    registrar('remover_solicitante')
+    db.remover_solicitante(db.adicionar_solicitante('REMOVER'))
+
+def deve_explicar(sql):
+    """Só instruções que leem tabelas têm plano de consulta relevante"""
+    comando = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    if comando not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+        return False
+    if comando == 'INSERT' and ' SELECT ' not in sql.upper():
+        return False
+    return True
+
+def main():
+    db, tmpdir = preparar_banco()
+    conn = db.connection
+    capturadas = []
+    atual = {'metodo': None}
+
+    def registrar(metodo):
+        atual['metodo'] = metodo
+
+    conn.set_trace_callback(lambda sql: capturadas.append((atual['metodo'], sql)))
+    try:
+        exercitar(db, registrar)
+    finally:
+        conn.set_trace_callback(None)
+
+    falhas = []
+    verificadas = 0
+    for metodo, sql in capturadas:
+        if not deve_explicar(sql):
+            continue
+        verificadas += 1
+        plano = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        for linha in plano:
+            m = VARREDURA_COMPLETA.match(linha)
+            if not m:
+                continue
+            if metodo in METODOS_VARREDURA_PERMITIDA or m.group(1) in TABELAS_VARREDURA_PERMITIDA:
+                continue
+            falhas.append((metodo, ' '.join(sql.split()), plano))
+
+    db.close()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"{verificadas} consultas verificadas")
+    if falhas:
+        print(f"{len(falhas)} consulta(s) com varredura completa de tabela:")
+        for metodo, sql, plano in falhas:
+            print(f"  [{metodo}] {sql}")
+            for linha in plano:
+                print(f"      {linha}")
+        return 1
+
+    print("Nenhuma varredura completa de tabela encontrada")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Teste de fumaça do producao_sql: gunicorn com 2 workers sobre um banco temporário
+
+Sobe o servidor como em produção (preload, gthread) e verifica que as
+escritas de um worker são vistas pelos outros, que só um worker inicia os
+serviços de fundo, que o /metrics soma as requisições de todos os workers,
+que o status do backup é o mesmo em qualquer worker e que o TERM encerra
+o servidor sem erro, incorporando as métricas dos workers a um só arquivo.
+"""
+import http.client
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark_servidor_sql import DIRETORIO, aguardar_servidor, criar_banco, porta_livre
+
+WORKERS = 2
+REQUISICOES = 60
+
+def _requisitar(porta, metodo, rota, corpo=None):
+    """Uma requisição em conexão nova (Connection: close), para variar o worker que atende"""
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=10)
+    try:
+        cabecalhos = {'Connection': 'close'}
+        if corpo is not None:
+            cabecalhos['Content-Type'] = 'application/json'
+            corpo = json.dumps(corpo)
+        conexao.request(metodo, rota, body=corpo, headers=cabecalhos)
+        resposta = conexao.getresponse()
+        return resposta.status, resposta.read()
+    finally:
+        conexao.close()
+
+def _total_requisicoes(porta):
+    _, corpo = _requisitar(porta, 'GET', '/metrics')
+    return sum(float(linha.rsplit(' ', 1)[1]) for linha in corpo.decode().splitlines()
+               if linha.startswith('ferramentas_http_requisicoes_total{'))
+
+def testar_escritas(porta):
+    """Ferramenta criada por um worker aparece na listagem de todos"""
+    status, _ = _requisitar(porta, 'POST', '/api/ferramentas', {'nome': 'Trena de fumaça', 'quantidade_total': 1})
+    vistas = [b'Trena de fuma' in _requisitar(porta, 'GET', '/api/ferramentas')[1] for _ in range(10)]
+    if status != 200 or not all(vistas):
+        print(f"FALHA: POST {status}; listagens com a ferramenta {vistas}")
+        return False
+    print("Escritas: ferramenta criada aparece em 10 listagens por conexões novas")
+    return True
+
+def testar_metricas(porta, diretorio_metricas):
+    """O /metrics de qualquer worker soma as requisições dos dois"""
+    antes = _total_requisicoes(porta)
+    for _ in range(REQUISICOES):
+        _requisitar(porta, 'GET', '/api/estatisticas')
+    time.sleep(6)  # intervalo de gravação das métricas de cada worker
+    arquivos = [nome for nome in os.listdir(diretorio_metricas) if nome.split('.')[0].isdigit()]
+    totais = [_total_requisicoes(porta) - antes for _ in range(4)]
+    if len(arquivos) != WORKERS or min(totais) < REQUISICOES:
+        print(f"FALHA: arquivos de métricas {arquivos}; requisições somadas {totais} (esperado >= {REQUISICOES})")
+        return False
+    print(f"Métricas: {len(arquivos)} workers gravando; /metrics soma {min(totais):.0f} requisições em qualquer worker")
+    return True
+
+def testar_backup(porta):
+    """Backup iniciado em um worker tem o mesmo status em todos"""
+    status, corpo = _requisitar(porta, 'POST', '/api/backup')
+    if status != 202:
+        print(f"FALHA: POST /api/backup {status} {corpo[:200]}")
+        return False
+    arquivo = json.loads(corpo)['status']['arquivo']
+    for _ in range(100):
+        estados = [json.loads(_requisitar(porta, 'GET', '/api/backup/status')[1])['status'] for _ in range(6)]
+        if not any(e['em_andamento'] for e in estados):
+            break
+        time.sleep(0.1)
+    if any(e['arquivo'] != arquivo or e['erro'] or e['em_andamento'] for e in estados):
+        print(f"FALHA: status em workers diferentes {estados}")
+        return False
+    print(f"Backup: {os.path.basename(arquivo)} concluído e informado igual por 6 conexões")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_producao_sql_')
+    processo = None
+    try:
+        criar_banco(tmpdir, movimentacoes=200)
+        porta = porta_livre()
+        saida = open(os.path.join(tmpdir, 'saida.log'), 'w+')
+        ambiente = dict(os.environ, ADMISSAO='0', PYTHONUNBUFFERED='1',
+                        PYTHONPATH=DIRETORIO + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        processo = subprocess.Popen([sys.executable, os.path.join(DIRETORIO, 'producao_sql.py'),
+                                     '--bind', f'127.0.0.1:{porta}', '--workers', str(WORKERS), '--threads', '4'],
+                                    cwd=tmpdir, env=ambiente, stdout=saida, stderr=subprocess.STDOUT)
+        aguardar_servidor(porta, processo)
+
+        ok = testar_escritas(porta)
+        diretorio_metricas = os.path.join(tmpdir, 'ferramentas.db.metricas')
+        ok = testar_metricas(porta, diretorio_metricas) and ok
+        ok = testar_backup(porta) and ok
+
+        processo.send_signal(signal.SIGTERM)
+        codigo = processo.wait(timeout=40)
+        saida.seek(0)
+        log = saida.read()
+        saida.close()
+        servicos = log.count('serviços de fundo iniciados')
+        metricas = sorted(nome for nome in os.listdir(diretorio_metricas) if nome.endswith('.json'))
+        if codigo != 0 or servicos != 1 or 'Traceback' in log or metricas != ['encerrados.json']:
+            print(f"FALHA: código de saída {codigo}, serviços iniciados em {servicos} workers, "
+                  f"métricas {metricas}\n{log[-2000:]}")
+            ok = False
+        else:
+            print(f"Encerramento: TERM termina com código 0; serviços de fundo em 1 de {WORKERS} workers; "
+                  f"métricas dos workers em {metricas[0]}")
+    finally:
+        if processo is not None and processo.poll() is None:
+            processo.kill()
+            processo.wait()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Teste do rastreamento de instruções SQL (rastreio_sql)
+
+Verifica que o resumo por requisição conta as instruções (o N+1 de
+obter_tabelas aparece), que uma consulta lenta vai para o log com o tempo
+de leitura das linhas, os binds e o EXPLAIN QUERY PLAN, que o log roda ao
+atingir o tamanho máximo, que o server_proxy_new devolve X-DB-Queries e
+X-DB-Time e quanto custa rastrear cada instrução.
+"""
+import http.client
+import http.server
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import database_sql
+from database_sql import DatabaseManager
+from rastreio_sql import ConexaoRastreada, RastreadorSQL
+
+INSTRUCOES = 20000
+
+def criar_banco(caminho, rastreador):
+    db = DatabaseManager(caminho, rastreador=rastreador)
+    db.initialize_database()
+    solicitante_id = db.adicionar_solicitante('Rastreio', 'rastreio@example.com')
+    ferramenta_id = db.adicionar_ferramenta('Torquímetro', quantidade_total=10)
+    db.adicionar_movimentacoes_lote([
+        {'tipo': 'saida', 'solicitante_id': solicitante_id, 'ferramenta_id': ferramenta_id}
+        for _ in range(5)
+    ])
+    return db, solicitante_id
+
+def testar_resumo(tmpdir):
+    """obter_tabelas faz 1 + N instruções e o resumo mostra isso"""
+    rastreador = RastreadorSQL(limite_ms=10000, arquivo=os.path.join(tmpdir, 'resumo.log'))
+    db, _ = criar_banco(os.path.join(tmpdir, 'resumo.db'), rastreador)
+    try:
+        rastreador.iniciar_requisicao()
+        tabelas = db.obter_tabelas()
+        cabecalhos = rastreador.cabecalhos()
+    finally:
+        db.close()
+
+    if cabecalhos['X-DB-Queries'] != str(len(tabelas) + 1) or float(cabecalhos['X-DB-Time']) <= 0:
+        print(f"FALHA: resumo {cabecalhos} para {len(tabelas)} tabelas (esperado {len(tabelas) + 1} instruções)")
+        return False
+    print(f"Resumo: obter_tabelas com {len(tabelas)} tabelas -> X-DB-Queries {cabecalhos['X-DB-Queries']}, "
+          f"X-DB-Time {cabecalhos['X-DB-Time']} ms")
+    return True
+
+def testar_consulta_lenta(tmpdir):
+    """A leitura lenta das linhas conta no tempo; a instrução vai para o log com o plano"""
+    arquivo = os.path.join(tmpdir, 'lentas.log')
+    rastreador = RastreadorSQL(limite_ms=30, arquivo=arquivo)
+    db, solicitante_id = criar_banco(os.path.join(tmpdir, 'lentas.db'), rastreador)
+    try:
+        conn = db.connection
+        conn.create_function('dormir', 1, lambda segundos: time.sleep(segundos) or 0)
+        # Cada linha dorme 15 ms: o execute sozinho fica abaixo do limite, a leitura completa não
+        linhas = conn.execute("SELECT id, dormir(0.015) FROM movimentacoes WHERE solicitante_id = ?",
+                              (solicitante_id,)).fetchall()
+        conn.execute("SELECT COUNT(*) FROM ferramentas").fetchone()
+        rastreador.resumo()
+        lentas = rastreador.estatisticas()['lentas']
+        rastreador.fechar()
+    finally:
+        db.close()
+
+    with open(arquivo, encoding='utf-8') as f:
+        log = f.read()
+    if lentas != 1 or f"linhas={len(linhas)} binds=1" not in log or 'dormir(0.015)' not in log:
+        print(f"FALHA: {lentas} consultas lentas registradas; log:\n{log}")
+        return False
+    if 'movimentacoes' not in log.split('dormir(0.015)', 1)[1] or 'COUNT(*)' in log:
+        print(f"FALHA: plano ausente ou consulta rápida no log:\n{log}")
+        return False
+    tempo = float(log.split(' ms ', 1)[0].rsplit(' ', 1)[1])
+    if tempo < 15 * len(linhas):
+        print(f"FALHA: {tempo} ms registrados para {len(linhas)} linhas de 15 ms")
+        return False
+    print(f"Consulta lenta: {tempo:.0f} ms para {len(linhas)} linhas, registrada com o plano:")
+    print('\n'.join(l for l in log.splitlines()[2:]))
+    return True
+
+def testar_rotacao(tmpdir):
+    """Com limite 0 tudo é registrado e o log roda ao passar de max_bytes"""
+    arquivo = os.path.join(tmpdir, 'rotacao.log')
+    rastreador = RastreadorSQL(limite_ms=0, arquivo=arquivo, max_bytes=2000, backups=2)
+    db, _ = criar_banco(os.path.join(tmpdir, 'rotacao.db'), rastreador)
+    try:
+        for _ in range(50):
+            db.obter_ferramentas()
+        rastreador.fechar()
+    finally:
+        db.close()
+
+    arquivos = sorted(n for n in os.listdir(tmpdir) if n.startswith('rotacao.log'))
+    if arquivos != ['rotacao.log', 'rotacao.log.1', 'rotacao.log.2']:
+        print(f"FALHA: arquivos de log {arquivos}")
+        return False
+    if any(os.path.getsize(os.path.join(tmpdir, n)) > 4000 for n in arquivos):
+        print("FALHA: log passou do tamanho máximo")
+        return False
+    print(f"Rotação: {', '.join(arquivos)}")
+    return True
+
+def testar_servidor(tmpdir):
+    """GET /api/db/tables no server_proxy_new devolve X-DB-Queries e X-DB-Time"""
+    import server_proxy_new
+
+    diretorio = os.path.join(tmpdir, 'servidor')
+    os.makedirs(diretorio)
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    servidor = None
+    try:
+        database_sql.db_manager = None
+        db = database_sql.init_database()
+        tabelas = len(db.obter_tabelas())
+        servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), server_proxy_new.ProxyHTTPRequestHandler)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        conexao = http.client.HTTPConnection('127.0.0.1', servidor.server_address[1], timeout=5)
+        conexao.request('GET', '/api/db/tables')
+        resposta = conexao.getresponse()
+        resposta.read()
+        consultas = resposta.getheader('X-DB-Queries')
+        tempo = resposta.getheader('X-DB-Time')
+        conexao.close()
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+            servidor.server_close()
+        if database_sql.db_manager is not None:
+            database_sql.db_manager.close()
+            database_sql.db_manager = None
+        os.chdir(anterior)
+
+    if consultas != str(tabelas + 1) or tempo is None:
+        print(f"FALHA: X-DB-Queries {consultas}, X-DB-Time {tempo} (esperado {tabelas + 1} instruções)")
+        return False
+    print(f"Servidor: /api/db/tables -> X-DB-Queries {consultas}, X-DB-Time {tempo} ms")
+    return True
+
+def testar_custo(tmpdir):
+    """Custo por instrução: conexão rastreada contra a conexão comum"""
+    caminho = os.path.join(tmpdir, 'custo.db')
+
+    def medir(conn):
+        inicio = time.perf_counter()
+        for i in range(INSTRUCOES):
+            conn.execute("SELECT ?", (i,)).fetchone()
+        return (time.perf_counter() - inicio) / INSTRUCOES * 1e6
+
+    comum = sqlite3.connect(caminho)
+    rastreada = sqlite3.connect(caminho, factory=ConexaoRastreada)
+    rastreada.rastreador = RastreadorSQL(limite_ms=10000, arquivo=os.path.join(tmpdir, 'custo.log'))
+    medir(comum)
+    medir(rastreada)
+    tempo_comum = medir(comum)
+    tempo_rastreado = medir(rastreada)
+    comum.close()
+    rastreada.close()
+
+    extra = tempo_rastreado - tempo_comum
+    print(f"Custo: {tempo_comum:.1f} µs sem rastreio, {tempo_rastreado:.1f} µs com rastreio "
+          f"(+{extra:.1f} µs por instrução)")
+    if extra > 20:
+        print("FALHA: rastreio custa mais de 20 µs por instrução")
+        return False
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_rastreio_')
+    try:
+        ok = testar_resumo(tmpdir)
+        ok = testar_consulta_lenta(tmpdir) and ok
+        ok = testar_rotacao(tmpdir) and ok
+        ok = testar_servidor(tmpdir) and ok
+        ok = testar_custo(tmpdir) and ok
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Teste das rotas e hooks do server_sql com o cliente de teste do Flask
+
+Verifica o cache de respostas (ETag forte, 304, invalidação por escrita,
+variantes gzip com Vary/Content-Encoding e ETag próprio), a compressão das
+respostas fora do cache, o 429 com Retry-After do controle de admissão, a
+ordem dos after_request (compressão antes dos cabeçalhos X-DB-* e das
+métricas), as rotas em lote e a paginação de /api/movimentacoes, e a
+conclusão pelo PUT.
+"""
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+
+import server_sql
+from admissao import ControleAdmissao, Regra
+from database_sql import DatabaseManager
+
+def _metrica(cliente, nome):
+    """Valor de uma série sem rótulos no /metrics (0 se ausente)"""
+    for linha in cliente.get('/metrics').get_data(as_text=True).splitlines():
+        if linha.startswith(nome + ' '):
+            return float(linha.split()[1])
+    return 0.0
+
+def testar_cache(cliente):
+    """ETag forte, 304 sem corpo, nova ETag após escrita e contadores no /metrics"""
+    acertos_antes = _metrica(cliente, 'ferramentas_cache_acertos_total')
+    economizados_antes = _metrica(cliente, 'ferramentas_cache_bytes_economizados_total')
+
+    primeira = cliente.get('/api/ferramentas')
+    etag = primeira.headers.get('ETag')
+    segunda = cliente.get('/api/ferramentas', headers={'If-None-Match': etag})
+    if (primeira.status_code != 200 or not etag or primeira.headers.get('Cache-Control') != 'no-cache'
+            or segunda.status_code != 304 or segunda.get_data() or segunda.headers.get('ETag') != etag):
+        print(f"FALHA: {primeira.status_code} ETag {etag}; condicional {segunda.status_code} "
+              f"com {len(segunda.get_data())} bytes")
+        return False
+
+    cliente.post('/api/ferramentas', json={'nome': 'Nível a laser', 'quantidade_total': 1})
+    terceira = cliente.get('/api/ferramentas', headers={'If-None-Match': etag})
+    if terceira.status_code != 200 or terceira.headers.get('ETag') == etag:
+        print(f"FALHA: após escrita {terceira.status_code} com a mesma ETag")
+        return False
+
+    acertos = _metrica(cliente, 'ferramentas_cache_acertos_total') - acertos_antes
+    economizados = _metrica(cliente, 'ferramentas_cache_bytes_economizados_total') - economizados_antes
+    if acertos != 1 or economizados != len(primeira.get_data()):
+        print(f"FALHA: /metrics com {acertos} acertos e {economizados} bytes economizados")
+        return False
+    print(f"Cache: 304 com ETag {etag[:12]}…; escrita troca a ETag; /metrics conta o acerto e "
+          f"{economizados:.0f} bytes economizados")
+    return True
+
+def testar_variantes(cliente):
+    """Variante gzip do cache: Content-Encoding, Vary, ETag própria e mesmo conteúdo"""
+    identidade = cliente.get('/api/movimentacoes?limit=500')
+    comprimida = cliente.get('/api/movimentacoes?limit=500', headers={'Accept-Encoding': 'gzip'})
+    etag_gzip = comprimida.headers.get('ETag')
+    vary = [v.strip() for v in comprimida.headers.get('Vary', '').split(',')]
+    if (comprimida.headers.get('Content-Encoding') != 'gzip' or vary.count('Accept-Encoding') != 1
+            or not etag_gzip.endswith('-gzip"') or etag_gzip == identidade.headers.get('ETag')
+            or 'Content-Encoding' in identidade.headers
+            or gzip.decompress(comprimida.get_data()) != identidade.get_data()):
+        print(f"FALHA: variante gzip {dict(comprimida.headers)}")
+        return False
+
+    # Cada ETag só vale para a sua representação
+    nao_modificada = cliente.get('/api/movimentacoes?limit=500',
+                                 headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag_gzip})
+    outra = cliente.get('/api/movimentacoes?limit=500', headers={'If-None-Match': etag_gzip})
+    if nao_modificada.status_code != 304 or outra.status_code != 200:
+        print(f"FALHA: If-None-Match gzip respondeu {nao_modificada.status_code} / sem gzip {outra.status_code}")
+        return False
+    print(f"Variantes: gzip com {len(comprimida.get_data())} de {len(identidade.get_data())} bytes, "
+          f"Vary: Accept-Encoding e ETag {etag_gzip[-6:]}")
+    return True
+
+def testar_compressao_e_ordem(cliente):
+    """Rota fora do cache comprimida; X-DB-* e métricas registrados depois da compressão"""
+    resposta = cliente.get('/api/uso?dias=30', headers={'Accept-Encoding': 'gzip'})
+    metricas = cliente.get('/metrics', headers={'Accept-Encoding': 'gzip'})
+    texto = gzip.decompress(metricas.get_data()).decode()
+    contados = [linha for linha in texto.splitlines()
+                if linha.startswith('ferramentas_http_requisicoes_total{') and 'rota="/api/ferramentas"' in linha
+                and 'status="304"' in linha]
+    if (metricas.headers.get('Content-Encoding') != 'gzip' or 'X-DB-Queries' not in resposta.headers
+            or 'X-DB-Queries' not in metricas.headers or not contados
+            or int(metricas.headers['Content-Length']) != len(metricas.get_data())):
+        print(f"FALHA: /metrics {dict(metricas.headers)}; 304 contados {contados}")
+        return False
+    print(f"Compressão: /metrics em gzip ({len(metricas.get_data())} bytes) com X-DB-Queries; "
+          f"304 contado em ferramentas_http_requisicoes_total")
+    return True
+
+def testar_admissao(cliente):
+    """429 com Retry-After do before_request; a vaga de escrita é devolvida no teardown"""
+    original = server_sql.controle_admissao
+    controle = ControleAdmissao(regras={'leitura': Regra(2, 0.5), 'escrita': Regra(50, 50),
+                                        'excel': Regra(1, 0.01), 'backup': Regra(1, 0.01)})
+    server_sql.controle_admissao = controle
+    try:
+        respostas = [cliente.get('/api/solicitantes') for _ in range(3)]
+        escritas = [cliente.post('/api/solicitantes', json={'nome': f'Cliente {i}'}) for i in range(5)]
+        estatisticas = controle.estatisticas()
+    finally:
+        server_sql.controle_admissao = original
+
+    recusada = respostas[2]
+    if ([r.status_code for r in respostas] != [200, 200, 429] or recusada.headers.get('Retry-After') != '2'
+            or recusada.get_json()['success'] is not False):
+        print(f"FALHA: leituras {[r.status_code for r in respostas]}, Retry-After {recusada.headers.get('Retry-After')}")
+        return False
+    if [r.status_code for r in escritas] != [200] * 5 or estatisticas['filas']['escrita']['ocupadas'] != 0:
+        print(f"FALHA: escritas {[r.status_code for r in escritas]}, filas {estatisticas['filas']}")
+        return False
+    print("Admissão: terceira leitura recusada com 429 e Retry-After 2; vagas de escrita devolvidas")
+    return True
+
+def testar_movimentacoes(cliente, ids):
+    """Lote de 250 movimentações e paginação por cursor (JSON e compacto) sem repetir linhas"""
+    solicitante_id, ferramenta_id = ids
+    lote = cliente.post('/api/movimentacoes/batch', json={'registros': [
+        {'tipo': 'entrada', 'solicitante_id': solicitante_id, 'ferramenta_id': ferramenta_id,
+         'observacoes': f'lote {i}'} for i in range(250)]})
+    invalido = cliente.post('/api/movimentacoes/batch', json=[{'tipo': 'entrada'}])
+    if lote.status_code != 200 or len(lote.get_json()['ids']) != 250 or invalido.status_code != 400:
+        print(f"FALHA: lote {lote.status_code}, lote inválido {invalido.status_code}")
+        return False
+
+    for formato in ('', '&formato=compacto'):
+        vistos = []
+        cursor = None
+        paginas = 0
+        while True:
+            url = f'/api/movimentacoes?limit=100{formato}' + (f'&cursor={cursor}' if cursor else '')
+            corpo = cliente.get(url).get_json()
+            if formato:
+                posicao = corpo['colunas'].index('id')
+                vistos.extend(linha[posicao] for linha in corpo['data'])
+            else:
+                vistos.extend(linha['id'] for linha in corpo['data'])
+            paginas += 1
+            cursor = corpo['next_cursor']
+            if cursor is None:
+                break
+        if len(vistos) != len(set(vistos)) or not set(lote.get_json()['ids']) <= set(vistos) or paginas < 3:
+            print(f"FALHA: paginação{formato}: {len(vistos)} ids ({len(set(vistos))} distintos) em {paginas} páginas")
+            return False
+    print(f"Movimentações: lote de 250 em uma requisição; {len(vistos)} linhas em {paginas} páginas, "
+          f"nos formatos JSON e compacto")
+    return True
+
+def _disponivel(db, ferramenta_id):
+    return db.connection.execute("SELECT quantidade_disponivel FROM ferramentas WHERE id = ?",
+                                 (ferramenta_id,)).fetchone()[0]
+
+def testar_conclusao_pelo_put(cliente, db, ids):
+    """PUT com status concluido libera o patrimônio e devolve a unidade; outro status é 400"""
+    solicitante_id, ferramenta_id = ids
+    db.adicionar_patrimonio('PAT-PUT-1', ferramenta_id)
+    disponivel = _disponivel(db, ferramenta_id)
+    mov = cliente.post('/api/movimentacoes', json={'tipo': 'saida', 'solicitante_id': solicitante_id,
+                                                  'ferramenta_id': ferramenta_id,
+                                                  'patrimonio': 'PAT-PUT-1'}).get_json()['id']
+    invalido = cliente.put(f'/api/movimentacoes/{mov}', json={'status': 'cancelado'})
+    concluido = cliente.put(f'/api/movimentacoes/{mov}', json={'status': 'concluido', 'observacoes': 'ok'})
+    patrimonio = cliente.get('/api/patrimonios/PAT-PUT-1').get_json()['data']
+    depois = _disponivel(db, ferramenta_id)
+    if (invalido.status_code != 400 or concluido.status_code != 200
+            or patrimonio['solicitante_id'] is not None or depois != disponivel):
+        print(f"FALHA: PUT inválido {invalido.status_code}, concluir {concluido.status_code}, "
+              f"patrimônio {patrimonio}, disponível {disponivel} -> {depois}")
+        return False
+    print("PUT: status concluido libera o patrimônio e devolve a unidade; outro status responde 400")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_server_sql_')
+    try:
+        db = DatabaseManager(os.path.join(tmpdir, 'teste.db'))
+        db.initialize_database()
+        server_sql.db_manager = db
+        solicitante_id = db.adicionar_solicitante('Almoxarifado', 'almox@example.com')
+        ferramenta_id = db.adicionar_ferramenta('Furadeira', quantidade_total=100)
+        db.adicionar_ferramentas_lote([{'nome': f'Ferramenta {i}', 'quantidade_total': 3} for i in range(30)])
+        for _ in range(20):
+            db.adicionar_movimentacao('saida', solicitante_id, ferramenta_id, observacoes='carga inicial')
+        ids = (solicitante_id, ferramenta_id)
+
+        cliente = server_sql.app.test_client()
+        ok = testar_cache(cliente)
+        ok = testar_variantes(cliente) and ok
+        ok = testar_compressao_e_ordem(cliente) and ok
+        ok = testar_admissao(cliente) and ok
+        ok = testar_movimentacoes(cliente, ids) and ok
+        ok = testar_conclusao_pelo_put(cliente, db, ids) and ok
+        db.close()
+    finally:
+        server_sql.db_manager = None
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
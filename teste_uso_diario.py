@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Teste dos agregados diários de uso (uso_diario_*)
+
+Verifica que a devolução conta no dia em que a saída foi concluída e não
+se move quando a linha é editada depois (observações, ferramenta), que
+alterações, exclusões e o arquivamento mantêm os agregados iguais aos de
+reconstruir_uso, e que a migração preenche concluido_em.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from database_sql import DatabaseManager
+
+PERIODO = ('2025-01-01', '2026-12-31')
+
+def _agregados(db):
+    """Linhas não nulas das duas tabelas de agregados"""
+    resultado = {}
+    for tabela in ('uso_diario_ferramenta', 'uso_diario_solicitante'):
+        linhas = db.connection.execute(f"""
+            SELECT * FROM {tabela}
+            WHERE movimentacoes OR saidas OR unidades OR devolucoes
+            ORDER BY 1, 2
+        """).fetchall()
+        resultado[tabela] = [tuple(linha) for linha in linhas]
+    return resultado
+
+def _confere_reconstrucao(db, etapa):
+    antes = _agregados(db)
+    db.reconstruir_uso()
+    depois = _agregados(db)
+    if antes != depois:
+        print(f"FALHA ({etapa}): agregados divergem de reconstruir_uso\n  {antes}\n  {depois}")
+        return False
+    return True
+
+def testar_edicao_apos_devolucao(db):
+    """Saída devolvida em 2026-01-10, editada hoje: a devolução continua em 2026-01-10"""
+    solicitante = db.adicionar_solicitante('Oficina', 'oficina@example.com')
+    furadeira = db.adicionar_ferramenta('Furadeira', quantidade_total=3)
+    serra = db.adicionar_ferramenta('Serra', quantidade_total=3)
+    mov = db.adicionar_movimentacao('saida', solicitante, furadeira)
+    db.concluir_movimentacao(mov)
+    # Empréstimo antigo: registrado em 2026-01-05 e devolvido em 2026-01-10
+    db.connection.execute("""
+        UPDATE movimentacoes SET criado_em = '2026-01-05 09:00:00', concluido_em = '2026-01-10 17:00:00'
+        WHERE id = ?
+    """, (mov,))
+    db.connection.commit()
+
+    por_dia = db.obter_uso(PERIODO, 'dia')
+    devolucoes = [(u['dia'], u['devolucoes']) for u in por_dia if u['devolucoes']]
+    if devolucoes != [('2026-01-10', 1)]:
+        print(f"FALHA: devoluções {devolucoes} antes da edição")
+        return False
+
+    db.atualizar_movimentacao(mov, observacoes='nota')
+    if db.obter_uso(PERIODO, 'dia') != por_dia:
+        print(f"FALHA: editar observações moveu a devolução: {db.obter_uso(PERIODO, 'dia')}")
+        return False
+
+    db.atualizar_movimentacao(mov, ferramenta_id=serra)
+    por_ferramenta = {u['ferramenta_id']: u['devolucoes'] for u in db.obter_uso(PERIODO, 'ferramenta')}
+    if db.obter_uso(PERIODO, 'dia') != por_dia or por_ferramenta.get(serra) != 1 or por_ferramenta.get(furadeira):
+        print(f"FALHA: trocar a ferramenta: por dia {db.obter_uso(PERIODO, 'dia')}, por ferramenta {por_ferramenta}")
+        return False
+    if not _confere_reconstrucao(db, 'edição'):
+        return False
+    print("Edição: devolução de 2026-01-10 continua no dia após editar observações e trocar a ferramenta")
+    return True
+
+def testar_exclusao_e_arquivo(db):
+    """Exclusão desconta a linha; arquivamento não altera os agregados"""
+    solicitante = db.adicionar_solicitante('Manutenção')
+    ferramenta = db.adicionar_ferramenta('Alicate', quantidade_total=5)
+    ids = [db.adicionar_movimentacao('saida', solicitante, ferramenta) for _ in range(4)]
+    for mov in ids[:3]:
+        db.concluir_movimentacao(mov)
+    db.connection.execute("DELETE FROM movimentacoes WHERE id = ?", (ids[0],))
+    db.connection.commit()
+    if not _confere_reconstrucao(db, 'exclusão'):
+        return False
+
+    antes = _agregados(db)
+    arquivadas = db.arquivar_movimentacoes(idade_dias=-1)
+    if not arquivadas or _agregados(db) != antes or not _confere_reconstrucao(db, 'arquivo'):
+        print(f"FALHA: {arquivadas} arquivadas; agregados alterados pelo arquivamento")
+        return False
+    print(f"Exclusão e arquivo: {arquivadas} linhas arquivadas, agregados iguais aos reconstruídos")
+    return True
+
+def testar_migracao(tmpdir):
+    """Linhas concluídas antes da migração 0011 recebem concluido_em = atualizado_em"""
+    db = DatabaseManager(os.path.join(tmpdir, 'migracao.db'))
+    db.initialize_database()
+    ferramenta = db.adicionar_ferramenta('Chave', quantidade_total=2)
+    mov = db.adicionar_movimentacao('saida', db.adicionar_solicitante('Antigo'), ferramenta)
+    db.concluir_movimentacao(mov)
+    # Volta o banco ao schema 10: sem a coluna e sem os triggers que a usam
+    db.connection.executescript("""
+        PRAGMA user_version = 10;
+        DROP TRIGGER trg_uso_movimentacoes_concluir;
+        DROP TRIGGER trg_uso_movimentacoes_devolucao_alterar;
+        DROP TRIGGER trg_uso_movimentacoes_reabrir;
+        DROP TRIGGER trg_uso_movimentacoes_delete;
+        DROP TRIGGER trg_alteracoes_movimentacoes_update;
+        UPDATE movimentacoes SET atualizado_em = '2025-06-01 08:00:00';
+        ALTER TABLE movimentacoes DROP COLUMN concluido_em;
+        ALTER TABLE movimentacoes_arquivo DROP COLUMN concluido_em;
+    """)
+    db.close()
+
+    db = DatabaseManager(os.path.join(tmpdir, 'migracao.db'))
+    db.initialize_database()
+    concluido_em = db.connection.execute("SELECT concluido_em FROM movimentacoes WHERE id = ?", (mov,)).fetchone()[0]
+    db.close()
+    if concluido_em != '2025-06-01 08:00:00':
+        print(f"FALHA: concluido_em após a migração = {concluido_em}")
+        return False
+    print("Migração: concluido_em preenchido com atualizado_em das linhas já concluídas")
+    return True
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='teste_uso_diario_')
+    try:
+        db = DatabaseManager(os.path.join(tmpdir, 'teste.db'))
+        db.initialize_database()
+        ok = testar_edicao_apos_devolucao(db)
+        ok = testar_exclusao_e_arquivo(db) and ok
+        db.close()
+        ok = testar_migracao(tmpdir) and ok
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())